@@ -0,0 +1,66 @@
+"""Compare order_stacks against the previous O(V*E) implementation on synthetic definitions.
+
+    python -m benchmarks.bench_order_stacks [--sizes 1000,5000,10000] [--deps 3]
+"""
+import argparse
+import random
+import time
+from cloudforge.forge import order_stacks
+
+
+def legacy_order_stacks(stack_definitions):
+    dep_graph = {}
+    satisfied_deps = []
+    sorted_stack_definitions = []
+    for name, stack_definition in stack_definitions.items():
+        deps = set(stack_definition.get('requires', []))
+        if deps:
+            dep_graph[name] = list(deps)
+        else:
+            satisfied_deps.append(name)
+    while len(satisfied_deps) > 0:
+        completed_name = satisfied_deps.pop()
+        sorted_stack_definitions.append((completed_name, stack_definitions[completed_name]))
+        for name, deps in dep_graph.items():
+            if completed_name in deps:
+                deps.remove(completed_name)
+                if not deps:
+                    satisfied_deps.append(name)
+                    del dep_graph[name]
+    return sorted_stack_definitions
+
+
+def make_stacks(count, deps_per_stack, seed=0):
+    rand = random.Random(seed)
+    stacks = {}
+    for i in range(count):
+        requires = ['stack{}'.format(rand.randrange(i)) for _ in range(deps_per_stack)] if i else []
+        stacks['stack{}'.format(i)] = {'requires': sorted(set(requires)), 'resources': {'fake': None}}
+    return stacks
+
+
+def best_of(func, stacks, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func(stacks)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,5000,10000', help='Comma separated stack counts')
+    parser.add_argument('--deps', type=int, default=3, help='Dependencies per stack')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    print '{:>8} {:>12} {:>12} {:>8}'.format('stacks', 'legacy (s)', 'current (s)', 'speedup')
+    for size in [int(s) for s in args.sizes.split(',')]:
+        stacks = make_stacks(size, args.deps)
+        legacy = best_of(legacy_order_stacks, stacks, args.repeat)
+        current = best_of(order_stacks, stacks, args.repeat)
+        print '{:>8} {:>12.4f} {:>12.4f} {:>7.1f}x'.format(size, legacy, current, legacy / current)
+
+
+if __name__ == '__main__':
+    main()
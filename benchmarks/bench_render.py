@@ -0,0 +1,43 @@
+"""Compare serial and process pool rendering of a synthetic template.
+
+    python -m benchmarks.bench_render [--resources 2000] [--processes 2,4]
+"""
+import argparse
+import multiprocessing
+import time
+from jinja2 import DictLoader
+from cloudforge.render import Renderer
+from cloudforge.serialize import serialize_template
+from benchmarks.bench_stringify import RESOURCE_TEMPLATE, make_stack_def
+
+
+def timed(func):
+    start = time.time()
+    rv = func()
+    return time.time() - start, rv
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--resources', type=int, default=2000)
+    parser.add_argument('--processes', default=','.join(str(n) for n in sorted({2, multiprocessing.cpu_count()})),
+                        help='Comma separated pool sizes')
+    args = parser.parse_args()
+    loader = DictLoader({'instance.yaml': RESOURCE_TEMPLATE})
+    stack_def = make_stack_def(args.resources)
+    serial, body = timed(lambda: serialize_template(Renderer(loader).render_template(stack_def)))
+    print '{:>10} {:>10} {:>8} {:>10}'.format('processes', 'seconds', 'speedup', 'identical')
+    print '{:>10} {:>10.2f} {:>7.1f}x {:>10}'.format('serial', serial, 1, 'yes')
+    for processes in [int(n) for n in args.processes.split(',')]:
+        renderer = Renderer(loader, processes=processes)
+        renderer.get_pool()
+        try:
+            elapsed, parallel_body = timed(lambda: serialize_template(renderer.render_template(stack_def)))
+        finally:
+            renderer.close()
+        print '{:>10} {:>10.2f} {:>7.1f}x {:>10}'.format(processes, elapsed, serial / elapsed,
+                                                        'yes' if parallel_body == body else 'NO')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Compare serialize_template and streaming write_template against json.dumps(...).replace(...).
+
+    python -m benchmarks.bench_serialize [--resources 5000]
+"""
+import argparse
+import json
+import os
+import time
+from cStringIO import StringIO
+from cloudforge.serialize import write_template, serialize_template
+
+
+def legacy_template_body(template):
+    return json.dumps(template).replace(r'\\', '\\')
+
+
+def make_template(resources):
+    return {
+        'AWSTemplateFormatVersion': '2010-09-09',
+        'Resources': {
+            'Instance{}'.format(i): {
+                'Type': 'AWS::EC2::Instance',
+                'Properties': {
+                    'ImageId': 'ami-{:08x}'.format(i),
+                    'InstanceType': 't2.micro',
+                    'UserData': '#!/bin/bash\\\\necho {} > /etc/motd\\\\n'.format(i),
+                    'Tags': [{'Key': 'Name', 'Value': 'instance-{}'.format(i)}],
+                    'SecurityGroupIds': [{'Ref': 'SecurityGroup'}]
+                }
+            } for i in range(resources)
+        }
+    }
+
+
+def best_of(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--resources', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    template = make_template(args.resources)
+    devnull = open(os.devnull, 'w')
+    cases = [
+        ('legacy dumps+replace', lambda: legacy_template_body(template)),
+        ('serialize_template', lambda: serialize_template(template)),
+        ('write_template buffer', lambda: write_template(template, StringIO())),
+        ('write_template compact', lambda: write_template(template, StringIO(), compact=True)),
+        ('write_template file', lambda: write_template(template, devnull))
+    ]
+    print '{:<24} {:>10} {:>10}'.format('case', 'seconds', 'bytes')
+    for name, func in cases:
+        size = func()
+        size = len(size) if isinstance(size, str) else size
+        print '{:<24} {:>10.4f} {:>10}'.format(name, best_of(func, args.repeat), size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Compare stringify and render_template against the previous recursive stringify.
+
+    python -m benchmarks.bench_stringify [--resources 5000]
+
+Each case runs in a forked child so its peak memory (growth of the maximum resident set
+size over the child's starting point) is measured on its own.
+"""
+import argparse
+import os
+import resource
+import time
+import cPickle
+from jinja2 import DictLoader
+from cloudforge import render
+from cloudforge.render import Renderer, stringify
+
+RESOURCE_TEMPLATE = ('Type: AWS::EC2::Instance\n'
+                     'Properties:\n'
+                     '  ImageId: ami-{{index}}\n'
+                     '  InstanceType: t2.micro\n'
+                     '  EbsOptimized: false\n'
+                     '  BlockDeviceMappings:\n'
+                     '  - DeviceName: /dev/sda1\n'
+                     '    Ebs:\n'
+                     '      VolumeSize: {{index}}\n'
+                     '      DeleteOnTermination: true\n'
+                     '  Tags:\n'
+                     '  - Key: Index\n'
+                     '    Value: {{index}}\n')
+
+
+def legacy_stringify(thing):
+    if isinstance(thing, dict):
+        return {k: legacy_stringify(v) for k, v in thing.items()}
+    elif isinstance(thing, list):
+        return [legacy_stringify(v) for v in thing]
+    elif isinstance(thing, int) or isinstance(thing, bool):
+        return str(thing)
+    else:
+        return thing
+
+
+def make_tree(resources):
+    return {'AWSTemplateFormatVersion': '2010-09-09',
+            'Resources': {'Instance{}'.format(i): {
+                'Type': 'AWS::EC2::Instance',
+                'Properties': {'ImageId': 'ami-{}'.format(i), 'EbsOptimized': False,
+                               'BlockDeviceMappings': [{'DeviceName': '/dev/sda1',
+                                                        'Ebs': {'VolumeSize': i, 'DeleteOnTermination': True}}],
+                               'Tags': [{'Key': 'Index', 'Value': i}]}
+            } for i in range(resources)}}
+
+
+def make_stack_def(resources):
+    return {'resources': {'Instance{}'.format(i): {'template': 'instance.yaml', 'variables': {'index': i}}
+                          for i in range(resources)}}
+
+
+def legacy_render_template(renderer, stack_def):
+    # Render without stringifying resources, then stringify the whole template like before
+    saved = render.stringify
+    render.stringify = lambda thing, in_place=False: thing
+    try:
+        return legacy_stringify(renderer.render_template(stack_def))
+    finally:
+        render.stringify = saved
+
+
+def measure(func):
+    """Run func in a forked child and return (seconds, peak memory growth in KiB)."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+        os.write(write_fd, cPickle.dumps((elapsed, peak)))
+        os._exit(0)
+    os.close(write_fd)
+    data = os.read(read_fd, 4096)
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    return cPickle.loads(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--resources', type=int, default=5000)
+    args = parser.parse_args()
+    tree = make_tree(args.resources)
+    stack_def = make_stack_def(args.resources)
+    renderer = Renderer(DictLoader({'instance.yaml': RESOURCE_TEMPLATE}))
+    renderer.env.get_template('instance.yaml')
+    cases = [
+        ('legacy stringify', lambda: legacy_stringify(tree)),
+        ('stringify copy', lambda: stringify(tree)),
+        ('stringify in place', lambda: stringify(tree, in_place=True)),
+        ('legacy render_template', lambda: legacy_render_template(renderer, stack_def)),
+        ('render_template', lambda: renderer.render_template(stack_def))
+    ]
+    print '{:<24} {:>10} {:>12}'.format('case', 'seconds', 'peak (KiB)')
+    for name, func in cases:
+        print '{:<24} {:>10.4f} {:>12}'.format(name, *measure(func))
+
+
+if __name__ == '__main__':
+    main()
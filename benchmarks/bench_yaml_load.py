@@ -0,0 +1,74 @@
+"""Compare loading a large definitions file with pure Python PyYAML, libyaml and the parsed file cache.
+
+    python -m benchmarks.bench_yaml_load [--stacks 500]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import yaml
+from cloudforge.cli import read_yamlfile
+from cloudforge.yamlload import SafeLoader
+
+
+def make_definitions(stacks):
+    lines = ['big:', '  region: us-west-2', '  stacks:']
+    for i in range(stacks):
+        lines += ['    stack{}:'.format(i),
+                  '      requires: [stack{}]'.format(i - 1) if i else '      requires: []',
+                  '      parameters:',
+                  '        VPC:',
+                  '          type: String',
+                  '          source: {{stack: vpc, type: resource, name: VPC{}}}'.format(i),
+                  '      resources:',
+                  '        instance:',
+                  '          variables:',
+                  '            index: {}'.format(i),
+                  '            enabled: true',
+                  '            tags: [a, b, c]']
+    return '\n'.join(lines) + '\n'
+
+
+def best_of(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stacks', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'definitions.yaml')
+        with open(path, 'w') as fp:
+            fp.write(make_definitions(args.stacks))
+        cache_dir = os.path.join(tmp, 'cache')
+        read_yamlfile(path, cache_dir)
+
+        def load(loader):
+            with open(path) as fp:
+                return yaml.load(fp, Loader=loader)
+
+        cases = [
+            ('pure python', lambda: load(yaml.SafeLoader)),
+            ('{}'.format(SafeLoader.__name__), lambda: load(SafeLoader)),
+            ('cache hit', lambda: read_yamlfile(path, cache_dir))
+        ]
+        with open(path) as fp:
+            print '{} lines'.format(len(fp.readlines()))
+        print '{:<16} {:>10}'.format('case', 'seconds')
+        for name, func in cases:
+            print '{:<16} {:>10.4f}'.format(name, best_of(func, args.repeat))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""In-memory stand-in for a boto CloudFormationConnection, so runs need no network."""
+import datetime
+import itertools
+import json
+from collections import Counter
+from boto.exception import BotoServerError
+
+
+class Page(list):
+    def __init__(self, items, next_token=None):
+        super(Page, self).__init__(items)
+        self.next_token = next_token
+
+
+class Record(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def stack_error(message):
+    error = BotoServerError(400, 'Bad Request')
+    error.error_message = message
+    return error
+
+
+class FakeStack(object):
+    def __init__(self, connection, name, resources, parameters):
+        self.connection = connection
+        self.stack_name = name
+        self.stack_status = 'CREATE_IN_PROGRESS'
+        self.resource_names = resources
+        self.parameters = [Record(key=k, value=v) for k, v in parameters or []]
+        self.outputs = []
+        self.events = []
+        self.pending = list(resources)
+        self.final_status = 'CREATE_COMPLETE'
+
+    def update(self):
+        self.connection.calls['stack.update'] += 1
+
+    def add_event(self, logical_id, status, resource_type='AWS::EC2::Instance'):
+        self.events.append(Record(event_id=next(self.connection.ids), timestamp=datetime.datetime.utcnow(),
+                                  resource_status=status, resource_type=resource_type,
+                                  logical_resource_id=logical_id, physical_resource_id=logical_id + '-id',
+                                  resource_status_reason=None))
+
+    def advance(self, count):
+        """Finish up to ``count`` pending resources, then the stack itself."""
+        for _ in range(min(count, len(self.pending))):
+            self.add_event(self.pending.pop(0), self.stack_status.replace('_IN_PROGRESS', '_COMPLETE'))
+        if not self.pending and self.stack_status.endswith('_IN_PROGRESS'):
+            self.stack_status = self.final_status
+            self.add_event(self.stack_name, self.stack_status, 'AWS::CloudFormation::Stack')
+
+
+class FakeCloudFormation(object):
+    """Stacks progress by ``events_per_poll`` resources every time their events are read.
+
+    Every API call is counted in ``calls``.
+    """
+
+    def __init__(self, events_per_poll=5, page_size=100):
+        self.events_per_poll = events_per_poll
+        self.page_size = page_size
+        self.stacks = {}
+        self.calls = Counter()
+        self.ids = ('event-{}'.format(i) for i in itertools.count())
+
+    def get_stack(self, name):
+        if name not in self.stacks:
+            raise stack_error('Stack:{} does not exist'.format(name))
+        return self.stacks[name]
+
+    def validate_template(self, template_body=None, template_url=None):
+        self.calls['validate_template'] += 1
+        if template_body is not None:
+            json.loads(template_body)
+        return Record(capabilities=[])
+
+    def create_stack(self, name, template_body=None, template_url=None, parameters=None, capabilities=None):
+        self.calls['create_stack'] += 1
+        if name in self.stacks:
+            raise stack_error('Stack [{}] already exists'.format(name))
+        resources = sorted(json.loads(template_body)['Resources']) if template_body else []
+        stack = self.stacks[name] = FakeStack(self, name, resources, parameters)
+        stack.add_event(name, 'CREATE_IN_PROGRESS', 'AWS::CloudFormation::Stack')
+        return name
+
+    def delete_stack(self, name):
+        self.calls['delete_stack'] += 1
+        stack = self.get_stack(name)
+        stack.stack_status = 'DELETE_IN_PROGRESS'
+        stack.final_status = 'DELETE_COMPLETE'
+        stack.pending = list(stack.resource_names)
+        stack.add_event(name, 'DELETE_IN_PROGRESS', 'AWS::CloudFormation::Stack')
+
+    def describe_stacks(self, name=None, next_token=None):
+        self.calls['describe_stacks'] += 1
+        if name:
+            return Page([self.get_stack(name)])
+        return Page(self.stacks.values())
+
+    def describe_stack_events(self, name, next_token=None):
+        self.calls['describe_stack_events'] += 1
+        stack = self.get_stack(name)
+        if next_token is None:
+            stack.advance(self.events_per_poll)
+            if stack.stack_status == 'DELETE_COMPLETE':
+                del self.stacks[name]
+        start = int(next_token or 0)
+        events = list(reversed(stack.events))[start:start + self.page_size]
+        more = start + self.page_size < len(stack.events)
+        return Page(events, str(start + self.page_size) if more else None)
+
+    def list_stack_resources(self, name, next_token=None):
+        self.calls['list_stack_resources'] += 1
+        stack = self.get_stack(name)
+        return Page([Record(logical_resource_id=r, physical_resource_id=r + '-id') for r in stack.resource_names])
@@ -0,0 +1,162 @@
+"""Benchmark suite for ordering, rendering, serialization and watching.
+
+    python -m benchmarks.suite run [--quick] [--only NAME,...] [--save results.json]
+    python -m benchmarks.suite compare baseline.json [--threshold 0.2]
+
+``compare`` reruns the benchmarks recorded in the baseline with the same parameters and
+exits with status 1 if any got slower than the threshold allows.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from collections import OrderedDict
+from jinja2 import DictLoader
+from cloudforge.forge import Forge, order_stacks, make_template_body
+from cloudforge.render import Renderer
+from cloudforge.watcher import Watcher
+from benchmarks.fakecf import FakeCloudFormation
+from benchmarks.synthetic import make_definition
+
+NO_POLLING_DELAY = {'strategy': 'fixed', 'interval': 0}
+
+
+def bench_order_stacks(stacks, density):
+    definition, _ = make_definition(stacks, density, resources=1)
+    return lambda: order_stacks(definition['stacks'])
+
+
+def bench_render_template(resources, properties):
+    definition, templates = make_definition(1, 0, resources, properties)
+    renderer = Renderer(DictLoader(templates))
+    stack = definition['stacks']['stack0']
+    return lambda: renderer.render_template(stack)
+
+
+def bench_make_template_body(resources, properties):
+    definition, templates = make_definition(1, 0, resources, properties)
+    template = Renderer(DictLoader(templates)).render_template(definition['stacks']['stack0'])
+    renderer = Renderer(DictLoader({}))
+    # Time serialization only, the renderer hands back the already rendered template
+    renderer.render_template = lambda template_def, parent_variables=None: template
+    return lambda: make_template_body(renderer, None)
+
+
+def bench_watch(resources, events_per_poll):
+    def run():
+        connection = FakeCloudFormation(events_per_poll)
+        connection.create_stack('stack', json.dumps({'Resources': {'R{}'.format(i): {} for i in range(resources)}}))
+        Watcher(connection, 'warning', NO_POLLING_DELAY).watch('stack', ['CREATE_IN_PROGRESS'])
+    return run
+
+
+def bench_create_definition(stacks, density, resources, concurrency):
+    definition, templates = make_definition(stacks, density, resources, properties=2)
+    renderer = Renderer(DictLoader(templates))
+
+    def run():
+        forge = Forge(FakeCloudFormation(), renderer, 'warning', concurrency, NO_POLLING_DELAY)
+        forge.create_definition('bench', definition)
+    return run
+
+
+# name: (setup function, parameters, parameters with --quick)
+BENCHMARKS = OrderedDict([
+    ('order_stacks', (bench_order_stacks, {'stacks': 5000, 'density': 3}, {'stacks': 500, 'density': 3})),
+    ('render_template', (bench_render_template, {'resources': 1000, 'properties': 10},
+                         {'resources': 50, 'properties': 10})),
+    ('make_template_body', (bench_make_template_body, {'resources': 5000, 'properties': 10},
+                            {'resources': 200, 'properties': 10})),
+    ('watch', (bench_watch, {'resources': 2000, 'events_per_poll': 5}, {'resources': 100, 'events_per_poll': 5})),
+    ('create_definition', (bench_create_definition, {'stacks': 50, 'density': 2, 'resources': 20, 'concurrency': 4},
+                           {'stacks': 5, 'density': 2, 'resources': 5, 'concurrency': 2}))
+])
+
+
+def run_benchmark(name, params, repeat):
+    setup = BENCHMARKS[name][0]
+    func = setup(**params)
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    times.sort()
+    return {'params': params, 'best': times[0], 'median': times[len(times) // 2], 'repeat': repeat}
+
+
+def run_suite(names, repeat, quick=False, params=None):
+    results = OrderedDict()
+    for name in names:
+        bench_params = (params or {}).get(name) or BENCHMARKS[name][2 if quick else 1]
+        results[name] = run_benchmark(name, bench_params, repeat)
+    return results
+
+
+def compare(baseline, results, threshold):
+    """Return (name, baseline best, current best, ratio, verdict) for every benchmark in both."""
+    rows = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]['best']
+        ratio = result['best'] / base if base else float('inf')
+        if ratio > 1 + threshold:
+            verdict = 'REGRESSION'
+        elif ratio < 1 - threshold:
+            verdict = 'faster'
+        else:
+            verdict = 'ok'
+        rows.append((name, base, result['best'], ratio, verdict))
+    return rows
+
+
+def environment():
+    return {'python': platform.python_version(), 'platform': platform.platform()}
+
+
+def print_results(results):
+    print '{:<20} {:>10} {:>10}  {}'.format('benchmark', 'best', 'median', 'params')
+    for name, result in results.items():
+        params = ' '.join('{}={}'.format(k, v) for k, v in sorted(result['params'].items()))
+        print '{:<20} {:>10.4f} {:>10.4f}  {}'.format(name, result['best'], result['median'], params)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command')
+    run_p = subparsers.add_parser('run', help='Run benchmarks and optionally save them as a baseline')
+    run_p.add_argument('--save', help='Write results to this JSON file')
+    run_p.add_argument('--only', help='Comma separated benchmarks to run (default: all)')
+    compare_p = subparsers.add_parser('compare', help='Rerun the benchmarks of a baseline and flag regressions')
+    compare_p.add_argument('baseline', help='JSON file written by run --save')
+    compare_p.add_argument('--threshold', type=float, default=0.2,
+                           help='Flag benchmarks more than this fraction slower (default: 0.2)')
+    run_p.add_argument('--quick', action='store_true', help='Use small sizes, for smoke testing')
+    for p in [run_p, compare_p]:
+        p.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        names = args.only.split(',') if args.only else list(BENCHMARKS)
+        results = run_suite(names, args.repeat, args.quick)
+        print_results(results)
+        if args.save:
+            with open(args.save, 'w') as fp:
+                json.dump({'environment': environment(), 'results': results}, fp, indent=2)
+        return 0
+
+    with open(args.baseline) as fp:
+        baseline = json.load(fp, object_pairs_hook=OrderedDict)['results']
+    names = [name for name in baseline if name in BENCHMARKS]
+    results = run_suite(names, args.repeat, params={name: baseline[name]['params'] for name in names})
+    rows = compare(baseline, results, args.threshold)
+    print '{:<20} {:>10} {:>10} {:>7}  {}'.format('benchmark', 'baseline', 'current', 'ratio', 'verdict')
+    for row in rows:
+        print '{:<20} {:>10.4f} {:>10.4f} {:>6.2f}x  {}'.format(*row)
+    return 1 if any(row[4] == 'REGRESSION' for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,40 @@
+"""Generators for synthetic definitions and resource templates."""
+import random
+
+RESOURCE_TEMPLATE_NAME = 'resource.yaml'
+
+
+def make_resource_template(properties):
+    """Return a resource template rendering ``properties`` padding properties besides the usual ones."""
+    lines = ['Type: AWS::EC2::Instance',
+             'Properties:',
+             '  ImageId: ami-{{index}}',
+             '  InstanceType: t2.micro',
+             '  EbsOptimized: false',
+             '  Tags:',
+             '  - Key: Index',
+             '    Value: {{index}}']
+    lines += ['  Property{0}: "value {0} of {{{{stack}}}}/{{{{index}}}}"'.format(i) for i in range(properties)]
+    return '\n'.join(lines) + '\n'
+
+
+def make_stack(index, resources):
+    return {'resources': {'Resource{}'.format(i): {'template': RESOURCE_TEMPLATE_NAME,
+                                                  'variables': {'index': i, 'stack': 'stack{}'.format(index)}}
+                          for i in range(resources)}}
+
+
+def make_definition(stacks=10, density=1, resources=10, properties=5, seed=0):
+    """Return a definition and its templates (for a DictLoader).
+
+    Every stack after the first requires up to ``density`` randomly chosen earlier stacks,
+    and has ``resources`` resources of ``properties`` padding properties each.
+    """
+    rand = random.Random(seed)
+    definition = {'stacks': {}}
+    for i in range(stacks):
+        stack = make_stack(i, resources)
+        if i and density:
+            stack['requires'] = sorted({'stack{}'.format(rand.randrange(i)) for _ in range(density)})
+        definition['stacks']['stack{}'.format(i)] = stack
+    return definition, {RESOURCE_TEMPLATE_NAME: make_resource_template(properties)}
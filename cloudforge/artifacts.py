@@ -0,0 +1,76 @@
+import hashlib
+import os
+import threading
+import urllib
+
+
+def artifact_key(body, prefix=''):
+    return '{}{}.json'.format(prefix, hashlib.sha256(body).hexdigest())
+
+
+class ArtifactStore(object):
+    """Content addressed store of template bodies.
+
+    Each body is stored under the hash of its contents, so a body already stored by this
+    or an earlier run is never uploaded again.
+    """
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.stored = set()
+
+    def upload(self, body):
+        """Store body unless it already is, and return its URL."""
+        key = artifact_key(body, self.prefix)
+        with self.lock:
+            stored = key in self.stored
+        if not stored and not self.exists(key):
+            self.put(key, body)
+        with self.lock:
+            self.stored.add(key)
+        return self.url(key)
+
+
+class S3ArtifactStore(ArtifactStore):
+    def __init__(self, connection, bucket_name, region=None, prefix=''):
+        super(S3ArtifactStore, self).__init__(prefix)
+        self.bucket = connection.get_bucket(bucket_name, validate=False)
+        self.bucket_name = bucket_name
+        self.region = region
+
+    def exists(self, key):
+        return self.bucket.get_key(key) is not None
+
+    def put(self, key, body):
+        self.bucket.new_key(key).set_contents_from_string(body, headers={'Content-Type': 'application/json'})
+
+    def url(self, key):
+        host = 's3.{}.amazonaws.com'.format(self.region) if self.region else 's3.amazonaws.com'
+        return 'https://{}/{}/{}'.format(host, self.bucket_name, urllib.quote(key))
+
+
+class LocalArtifactStore(ArtifactStore):
+    """Stores bodies in a directory, a stand-in for S3 in tests and dry runs."""
+
+    def __init__(self, directory, prefix=''):
+        super(LocalArtifactStore, self).__init__(prefix)
+        self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def put(self, key, body):
+        path = self.path(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.current_thread().ident)
+        with open(tmp_path, 'w') as fp:
+            fp.write(body)
+        os.rename(tmp_path, path)
+
+    def url(self, key):
+        return 'file://' + urllib.pathname2url(os.path.abspath(self.path(key)))
@@ -1,7 +1,13 @@
+import json
 import logging
+import threading
 from mock import MagicMock, patch, sentinel
 import boto.sts as sts
 import boto.cloudformation as cf
+import boto.s3 as s3
+
+# Assumed role credentials are refreshed this many seconds before they expire
+CREDENTIALS_REFRESH_MARGIN = 300
 
 
 def assume_role(region, role_arn, role_session_name, role_opts=None):
@@ -12,26 +18,102 @@ def assume_role(region, role_arn, role_session_name, role_opts=None):
     return assumed_role.credentials
 
 
-def connect_to_cf(region, role_arn=None, role_session_name=None, role_opts=None):
+def credential_options(creds=None):
     connect_opts = {}
-    if role_arn:
-        if not role_session_name:
-            role_session_name = 'cloudplate'
-        creds = assume_role(region, role_arn, role_session_name, role_opts=role_opts)
+    if creds:
         connect_opts['aws_access_key_id'] = creds.access_key
         connect_opts['aws_secret_access_key'] = creds.secret_key
         connect_opts['security_token'] = creds.session_token
-    return cf.connect_to_region(region, **connect_opts)
+    return connect_opts
+
+
+def connect_with_credentials(region, creds=None):
+    return cf.connect_to_region(region, **credential_options(creds))
+
+
+def connect_to_cf(region, role_arn=None, role_session_name=None, role_opts=None):
+    creds = None
+    if role_arn:
+        creds = assume_role(region, role_arn, role_session_name or 'cloudplate', role_opts=role_opts)
+    return connect_with_credentials(region, creds)
 
 
-def connect(definition):
-    conn_opts = {}
+def connection_options(definition):
+    conn_opts = {'region': definition['region']}
     role = definition.get('role')
     if role:
-        conn_opts['role_arn'] = role.pop('role_arn')
-        conn_opts['role_session_name'] = role.pop('role_session_name')
-        conn_opts['role_opts'] = role
-    return connect_to_cf(definition['region'], **conn_opts)
+        conn_opts['role_arn'] = role['role_arn']
+        conn_opts['role_session_name'] = role.get('role_session_name')
+        conn_opts['role_opts'] = {k: v for k, v in role.items() if k not in ['role_arn', 'role_session_name']}
+    return conn_opts
+
+
+def credentials_expiring(creds, margin=CREDENTIALS_REFRESH_MARGIN):
+    return bool(creds.expiration) and creds.is_expired(time_offset_seconds=margin)
+
+
+class ConnectionCache(object):
+    """Reuse assumed role credentials until shortly before they expire, and connections per thread."""
+
+    def __init__(self):
+        self.credentials = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def get_credentials(self, region, role_arn, role_session_name=None, role_opts=None):
+        role_session_name = role_session_name or 'cloudplate'
+        key = (region, role_arn, role_session_name, json.dumps(role_opts, sort_keys=True))
+        with self.lock:
+            creds = self.credentials.get(key)
+            if not creds or credentials_expiring(creds):
+                creds = assume_role(region, role_arn, role_session_name, role_opts=role_opts)
+                self.credentials[key] = creds
+            return creds
+
+    def get_connection(self, region, role_arn=None, role_session_name=None, role_opts=None):
+        connections = getattr(self.local, 'connections', None)
+        if connections is None:
+            connections = self.local.connections = {}
+        creds = self.get_credentials(region, role_arn, role_session_name, role_opts) if role_arn else None
+        key = (region, role_arn, role_session_name, json.dumps(role_opts, sort_keys=True))
+        connection, connection_creds = connections.get(key, (None, None))
+        if connection is None or connection_creds is not creds:
+            connection = connect_with_credentials(region, creds)
+            connections[key] = (connection, creds)
+        return connection
+
+    def clear(self):
+        with self.lock:
+            self.credentials.clear()
+        self.local = threading.local()
+
+
+class CachedConnection(object):
+    """CloudFormation connection that hands each thread its own connection from a ConnectionCache."""
+
+    def __init__(self, cache, **conn_opts):
+        self.cache = cache
+        self.conn_opts = conn_opts
+        self.cache.get_connection(**conn_opts)
+
+    def __getattr__(self, name):
+        return getattr(self.cache.get_connection(**self.conn_opts), name)
+
+
+connection_cache = ConnectionCache()
+
+
+def connect(definition, cache=None):
+    return CachedConnection(cache or connection_cache, **connection_options(definition))
+
+
+def connect_s3(definition, cache=None):
+    """S3 connection to the definition's region, with the definition's role if it has one."""
+    conn_opts = connection_options(definition)
+    creds = None
+    if conn_opts.get('role_arn'):
+        creds = (cache or connection_cache).get_credentials(**conn_opts)
+    return s3.connect_to_region(conn_opts['region'], **credential_options(creds))
 
 
 class LoggingMock(MagicMock):
@@ -52,4 +134,4 @@ def dry_run_connection(definition):
         with patch('cloudforge.aws.sts') as mock_sts:
             mock_sts.connect_to_region = stsctr
             mock_cf.connect_to_region = cfctr
-            return connect(definition)
\ No newline at end of file
+            return connect_to_cf(**connection_options(definition))
\ No newline at end of file
@@ -1,10 +1,19 @@
 import argparse
 import json
 import os
-import yaml
+import sys
 from cloudforge.render import make_renderer
-from cloudforge.forge import Forge, make_template_body
-from cloudforge.aws import connect, dry_run_connection
+from cloudforge.forge import Forge, AsyncForge, select_stacks
+from cloudforge.artifacts import S3ArtifactStore
+from cloudforge.aws import connect, connect_s3, dry_run_connection
+from cloudforge.export import export_definition
+from cloudforge.manifest import Manifest
+from cloudforge.metrics import DeployMetrics
+from cloudforge.profiling import PhaseTimings, ThreadedProfile
+from cloudforge.serialize import write_template
+from cloudforge.targets import expand_targets, target_name, run_targets, format_report, TargetsFailedError
+from cloudforge.watcher import POLLING_STRATEGIES
+from cloudforge.yamlload import safe_load, ParsedFileCache, CACHE_DIR_ENV
 
 
 class DefinitionLookupError(LookupError):
@@ -25,47 +34,219 @@ class StackLookupError(LookupError):
         return 'Stack {} not found in {}'.format(self.stack_name, self.definition_name)
 
 
-def read_yamlfile(path):
+def parse_yamlfile(path):
     with open(path) as f:
-        return yaml.safe_load(f)
+        return safe_load(f)
 
 
-def load_definition(yamlfile, definition_name):
-    definitions = read_yamlfile(yamlfile)
+def read_yamlfile(path, cache_dir=None):
+    cache_dir = cache_dir or os.environ.get(CACHE_DIR_ENV)
+    if cache_dir:
+        return ParsedFileCache(cache_dir).get(path, parse_yamlfile)
+    return parse_yamlfile(path)
+
+
+def load_definition(yamlfile, definition_name, cache_dir=None):
+    definitions = read_yamlfile(yamlfile, cache_dir)
     if definition_name not in definitions:
         raise DefinitionLookupError(definition_name, yamlfile)
     return definitions[definition_name]
 
 
+def timed(args, stack_name, phase, func):
+    """Return func, timed into the run's phase timings when profiling."""
+    timings = getattr(args, 'timings', None)
+    if timings is None:
+        return func
+    return timings.timed(stack_name, phase, func)
+
+
+def load_args_definition(args):
+    return timed(args, None, 'load_definition', load_definition)(args.yamlfile, args.definition_name, args.cache_dir)
+
+
 def dump(args):
-    definition = load_definition(args.yamlfile, args.definition_name)
+    definition = load_args_definition(args)
     if args.stack_name not in definition['stacks']:
         raise StackLookupError(args.stack_name, args.definition_name)
-    return make_template_body(make_renderer(definition), definition['stacks'][args.stack_name])
+    renderer = make_renderer(definition, args.render_processes)
+    template = timed(args, args.stack_name, 'render', renderer.render_template)(definition['stacks'][args.stack_name])
+    timed(args, args.stack_name, 'serialize', write_template)(template, sys.stdout)
+    sys.stdout.write('\n')
 
 
-def create(args):
-    definition = load_definition(args.yamlfile, args.definition_name)
+def dump_all(args):
+    definition = load_args_definition(args)
+    renderer = make_renderer(definition, args.render_processes)
+    manifest = export_definition(renderer, definition, args.output_dir, args.workers, args.ordered, args.compact)
+    entries = manifest['stacks'].values()
+    return 'Wrote {} templates ({} bytes) to {}'.format(len(entries), sum(e['bytes'] for e in entries),
+                                                        args.output_dir)
+
+
+def make_artifact_store(args, definition):
+    artifacts = definition.get('artifacts') or {}
+    bucket = args.artifact_bucket or artifacts.get('bucket')
+    if bucket and not args.noop:
+        prefix = args.artifact_prefix if args.artifact_prefix is not None else artifacts.get('prefix', '')
+        return S3ArtifactStore(connect_s3(definition), bucket, definition['region'], prefix)
+
+
+def make_forge(args, definition, manifest=None, metrics=None, label=None):
     if args.noop:
         connection = dry_run_connection(definition)
     else:
         connection = connect(definition)
-    forge = Forge(connection, make_renderer(definition))
-    forge.create_definition(args.definition_name, definition)
+    options = {
+        'concurrency': args.concurrency,
+        'polling': args.polling or definition.get('polling'),
+        'manifest': manifest,
+        'timings': getattr(args, 'timings', None),
+        'metrics': metrics,
+        'artifacts': make_artifact_store(args, definition),
+        'preflight': args.preflight or definition.get('preflight', False),
+        'label': label
+    }
+    renderer = make_renderer(definition, args.render_processes)
+    if (args.engine or definition.get('engine')) == 'async':
+        return AsyncForge(connection, renderer,
+                          stack_timeout=args.stack_timeout or definition.get('stack_timeout'), **options)
+    return Forge(connection, renderer, **options)
+
+
+def load_manifest(args, definition):
+    manifest_path = args.manifest or definition.get('manifest')
+    if manifest_path and not args.noop:
+        return Manifest(manifest_path)
+
+
+def make_metrics(args):
+    if args.metrics_jsonl or args.metrics_prometheus:
+        return DeployMetrics(args.definition_name)
+
+
+def export_metrics(args, metrics):
+    if args.metrics_jsonl:
+        metrics.write_jsonl(args.metrics_jsonl)
+    if args.metrics_prometheus:
+        metrics.write_prometheus(args.metrics_prometheus)
+
+
+def run_definition(args, action):
+    definition = load_args_definition(args)
+    manifest = load_manifest(args, definition)
+    metrics = make_metrics(args)
+    try:
+        return run_definition_targets(args, action, definition, manifest, metrics)
+    finally:
+        if metrics:
+            export_metrics(args, metrics)
+
+
+def run_definition_targets(args, action, definition, manifest=None, metrics=None):
+    if 'targets' not in definition:
+        action(make_forge(args, definition, manifest, metrics), definition)
+        return
+
+    def run_target(target_definition):
+        name = target_name(target_definition)
+        action(make_forge(args, target_definition, manifest and manifest.scope(name), metrics and metrics.scope(name),
+                          name),
+               target_definition)
+
+    results = run_targets(expand_targets(definition), run_target)
+    if not all(r.ok for r in results):
+        raise TargetsFailedError(results)
+    return format_report(results)
+
+
+def select_args_stacks(args, definition):
+    """Return the stacks selected by --only and friends, or None for every stack."""
+    if not args.only:
+        return None
+    for stack_name in args.only:
+        if stack_name not in definition['stacks']:
+            raise StackLookupError(stack_name, args.definition_name)
+    return select_stacks(definition['stacks'], args.only, args.with_deps, args.with_dependents)
+
+
+def create(args):
+    return run_definition(args, lambda forge, definition: forge.create_definition(
+        args.definition_name, definition, select_args_stacks(args, definition)))
+
+
+def update(args):
+    return run_definition(args, lambda forge, definition: forge.update_definition(
+        args.definition_name, definition, select_args_stacks(args, definition)))
 
 
 def delete(args):
-    definition = load_definition(args.yamlfile, args.definition_name)
-    if args.noop:
-        connection = dry_run_connection(definition)
-    else:
-        connection = connect(definition)
-    forge = Forge(connection, make_renderer(definition))
-    forge.delete_definition(args.definition_name, definition)
+    return run_definition(args, lambda forge, definition: forge.delete_definition(
+        args.definition_name, definition, select_args_stacks(args, definition)))
+
+
+def add_render_arguments(parser):
+    parser.add_argument('--render-processes', type=int,
+                        help='Render resources on this many processes (default: definition render_processes or '
+                             'render serially)')
+    parser.add_argument('--cache-dir',
+                        help='Cache parsed definition files in this directory (default: ${})'.format(CACHE_DIR_ENV))
+
+
+def add_run_arguments(parser, verb):
+    parser.add_argument('yamlfile', help='The file to read the Cloudplate definitions from')
+    parser.add_argument('definition_name', help='The definition name')
+    parser.add_argument('--noop', action='store_true', help='Use a fake connection to simulate a run')
+    parser.add_argument('--only', metavar='STACK', action='append',
+                        help='Only {} this stack, may be given more than once (default: every stack)'.format(verb))
+    parser.add_argument('--with-deps', action='store_true',
+                        help='With --only, also {} the stacks the selected stacks require'.format(verb))
+    parser.add_argument('--with-dependents', action='store_true',
+                        help='With --only, also {} the stacks that require the selected stacks'.format(verb))
+    parser.add_argument('--concurrency', type=int,
+                        help='Maximum number of stacks to {} at once '
+                             '(default: definition concurrency or 1)'.format(verb))
+    parser.add_argument('--polling', choices=sorted(POLLING_STRATEGIES),
+                        help='How to poll stack events (default: definition polling or backoff)')
+    parser.add_argument('--engine', choices=['threaded', 'async'],
+                        help='Run stacks on a thread pool or on one event loop '
+                             '(default: definition engine or threaded)')
+    parser.add_argument('--stack-timeout', type=float,
+                        help='Fail stacks that take longer than this many seconds (async engine only)')
+    parser.add_argument('--manifest',
+                        help='File recording deployed template digests, unchanged stacks are skipped on create '
+                             '(default: definition manifest)')
+    parser.add_argument('--preflight', action='store_true',
+                        help='Read the status of every stack with a few batched calls before changing anything, '
+                             'skipping complete stacks and failing early on blocked ones (default: definition '
+                             'preflight)')
+    parser.add_argument('--metrics-jsonl', metavar='FILE', help='Append per stack deployment metrics to FILE')
+    parser.add_argument('--metrics-prometheus', metavar='FILE',
+                        help='Write per stack deployment metrics to FILE in the Prometheus textfile format')
+    parser.add_argument('--artifact-bucket',
+                        help='Upload templates to this S3 bucket under the hash of their contents and pass '
+                             'CloudFormation their URL (default: definition artifacts bucket)')
+    parser.add_argument('--artifact-prefix',
+                        help='Key prefix for uploaded templates (default: definition artifacts prefix)')
+    add_render_arguments(parser)
+
+
+def profile(args):
+    args.timings = PhaseTimings()
+    profiler = ThreadedProfile()
+    try:
+        return profiler.runcall(args.func, args)
+    finally:
+        profiler.dump_stats(args.profile)
+        args.timings.write(args.profile + '.phases.json')
+        print >> sys.stderr, args.timings.format_table()
 
 
 def cloudforge():
     parser = argparse.ArgumentParser(description='Forge CloudFormation stacks')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='Write a cProfile dump of the run to FILE and the time each stack spent in each '
+                             'phase to FILE.phases.json')
     subparsers = parser.add_subparsers()
 
     dump_p = subparsers.add_parser('dump', description='Dump template from Cloudforge definition')
@@ -73,20 +254,37 @@ def cloudforge():
     dump_p.add_argument('yamlfile', help='The file to read the Cloudplate definitions from')
     dump_p.add_argument('definition_name', help='The definition name')
     dump_p.add_argument('stack_name', help='The stack name')
+    add_render_arguments(dump_p)
+
+    dump_all_p = subparsers.add_parser('dump-all',
+                                       description='Dump the template of every stack in a Cloudforge definition')
+    dump_all_p.set_defaults(func=dump_all)
+    dump_all_p.add_argument('yamlfile', help='The file to read the Cloudplate definitions from')
+    dump_all_p.add_argument('definition_name', help='The definition name')
+    dump_all_p.add_argument('output_dir', help='The directory to write templates and manifest.json to')
+    dump_all_p.add_argument('--workers', type=int, default=4, help='Number of stacks to render at once (default: 4)')
+    dump_all_p.add_argument('--ordered', action='store_true',
+                            help='Render stacks only after the stacks they require')
+    dump_all_p.add_argument('--compact', action='store_true', help='Write templates without whitespace')
+    add_render_arguments(dump_all_p)
 
     create_p = subparsers.add_parser('create', description='Create stack in CloudFormation from Cloudforge definition')
     create_p.set_defaults(func=create)
-    create_p.add_argument('yamlfile', help='The file to read the Cloudplate definitions from')
-    create_p.add_argument('definition_name', help='The definition name')
-    create_p.add_argument('--noop', action='store_true', help='Use a fake connection to simulate a run')
+    add_run_arguments(create_p, 'create')
+
+    update_p = subparsers.add_parser('update', description='Update the stacks of a Cloudforge definition whose '
+                                                           'template or parameters changed, creating missing ones')
+    update_p.set_defaults(func=update)
+    add_run_arguments(update_p, 'update')
 
     delete_p = subparsers.add_parser('delete', description='Delete the stack definition from Cloudformation')
     delete_p.set_defaults(func=delete)
-    delete_p.add_argument('yamlfile', help='The file to read the Cloudplate definitions from')
-    delete_p.add_argument('definition_name', help='The definition name')
-    delete_p.add_argument('--noop', action='store_true', help='Use a fake connection to simulate a run')
+    add_run_arguments(delete_p, 'delete')
 
     args = parser.parse_args()
-    rv = args.func(args)
+    if args.profile:
+        rv = profile(args)
+    else:
+        rv = args.func(args)
     if rv:
         print rv
@@ -0,0 +1,244 @@
+"""Steps of a stack lifecycle and the engines that drive them.
+
+Stack lifecycles are written as generators that yield steps: a blocking ``Call``, a
+``Sleep`` or a ``Watch`` of a stack until it leaves some statuses. ``run_steps`` performs
+them one after another in the calling thread. ``EventLoop`` drives many lifecycles at
+once from a single thread, running calls on a small pool of worker threads and
+replacing sleeps with timers.
+"""
+import heapq
+import itertools
+import sys
+import threading
+import time
+import types
+from Queue import Queue, Empty
+from cloudforge.watcher import StackWatch
+
+
+class Call(object):
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self):
+        return self.func(*self.args, **self.kwargs)
+
+
+class Sleep(object):
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+
+class Watch(object):
+    def __init__(self, stack_name, while_statuses):
+        self.stack_name = stack_name
+        self.while_statuses = while_statuses
+
+
+def run_steps(steps, watcher):
+    """Perform the steps of a lifecycle in the calling thread, running yielded lifecycles in place."""
+    value, exc_info = None, None
+    while True:
+        try:
+            step = steps.throw(*exc_info) if exc_info else steps.send(value)
+        except StopIteration:
+            return
+        value, exc_info = None, None
+        try:
+            if isinstance(step, Call):
+                value = step()
+            elif isinstance(step, Sleep):
+                time.sleep(step.seconds)
+            elif isinstance(step, Watch):
+                value = watcher.watch(step.stack_name, step.while_statuses)
+            elif isinstance(step, types.GeneratorType):
+                run_steps(step, watcher)
+            else:
+                raise TypeError('Unknown step {!r}'.format(step))
+        except Exception:
+            exc_info = sys.exc_info()
+
+
+class CancelledError(Exception):
+    pass
+
+
+class StepTimeoutError(Exception):
+    def __init__(self, name, timeout):
+        self.name = name
+        self.timeout = timeout
+
+    def __str__(self):
+        return '{} did not finish within {} seconds'.format(self.name, self.timeout)
+
+
+# Posted on the results queue to resume a task that is not waiting for a call
+WAKE = object()
+
+
+def follow(stack_watch):
+    yield Call(stack_watch.start)
+    while not stack_watch.done:
+        yield Sleep(stack_watch.next_delay())
+        yield Call(stack_watch.poll)
+
+
+class Task(object):
+    def __init__(self, loop, name, steps, timeout=None, on_done=None):
+        self.loop = loop
+        self.name = name
+        self.generators = [(steps, None)]
+        self.timeout = timeout
+        self.deadline = time.time() + timeout if timeout else None
+        self.on_done = on_done
+        self.cancelled = False
+        self.exc_info = None
+        self.done = False
+        self.timer = None
+
+    def cancel(self):
+        """Throw CancelledError into the task when it next resumes, safe to call from any thread."""
+        if not self.done:
+            self.cancelled = True
+            self.loop.results.put((self, WAKE, None))
+
+    def step(self, value=None, exc_info=None):
+        self.timer = None
+        if self.cancelled:
+            value, exc_info = None, (CancelledError, CancelledError(self.name), None)
+        elif self.deadline and time.time() >= self.deadline:
+            value, exc_info = None, (StepTimeoutError, StepTimeoutError(self.name, self.timeout), None)
+        while True:
+            generator, result = self.generators[-1]
+            try:
+                step = generator.throw(*exc_info) if exc_info else generator.send(value)
+            except StopIteration:
+                self.generators.pop()
+                if not self.generators:
+                    return self.finish()
+                value, exc_info = result() if result else None, None
+                continue
+            except Exception:
+                self.generators.pop()
+                if not self.generators:
+                    return self.finish(sys.exc_info())
+                value, exc_info = None, sys.exc_info()
+                continue
+            value, exc_info = None, None
+            if isinstance(step, types.GeneratorType):
+                self.generators.append((step, None))
+            elif isinstance(step, Watch):
+                stack_watch = StackWatch(self.loop.watcher, step.stack_name, step.while_statuses,
+                                         prefix='{}: '.format(step.stack_name))
+                self.generators.append((follow(stack_watch), lambda: stack_watch.status))
+            elif isinstance(step, Call):
+                return self.loop.submit(self, step)
+            elif isinstance(step, Sleep):
+                return self.loop.call_later(self, step.seconds)
+            else:
+                exc_info = (TypeError, TypeError('Unknown step {!r}'.format(step)), None)
+
+    def finish(self, exc_info=None):
+        self.done = True
+        self.exc_info = exc_info
+        self.loop.tasks.discard(self)
+        if self.on_done:
+            self.on_done(self)
+
+
+class EventLoop(object):
+    """Drive many lifecycles from one thread with ``workers`` threads for blocking calls.
+
+    If given, every call of a task runs inside ``call_context(task.name)``.
+    """
+
+    def __init__(self, watcher, workers=4, call_context=None):
+        self.watcher = watcher
+        self.workers = workers
+        self.call_context = call_context
+        self.tasks = set()
+        self.timers = []
+        self.order = itertools.count()
+        self.calls = Queue()
+        self.results = Queue()
+        self.threads = []
+
+    def spawn(self, name, steps, timeout=None, on_done=None):
+        task = Task(self, name, steps, timeout, on_done)
+        self.tasks.add(task)
+        self.call_later(task, 0)
+        return task
+
+    def call_later(self, task, seconds):
+        when = time.time() + seconds
+        if task.deadline:
+            when = min(when, task.deadline)
+        task.timer = (when, next(self.order), task)
+        heapq.heappush(self.timers, task.timer)
+
+    def submit(self, task, call):
+        if not self.threads:
+            for _ in range(self.workers):
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+        self.calls.put((task, call))
+
+    def _work(self):
+        while True:
+            item = self.calls.get()
+            if item is None:
+                return
+            task, call = item
+            try:
+                if self.call_context:
+                    with self.call_context(task.name):
+                        value = call()
+                else:
+                    value = call()
+                self.results.put((task, value, None))
+            except Exception:
+                self.results.put((task, None, sys.exc_info()))
+
+    def cancel(self):
+        for task in list(self.tasks):
+            task.cancel()
+
+    def run(self):
+        try:
+            while self.tasks:
+                self._run_once()
+        except KeyboardInterrupt:
+            self.cancel()
+            while self.tasks:
+                self._run_once()
+            raise
+        finally:
+            for _ in self.threads:
+                self.calls.put(None)
+            self.threads = []
+
+    def _run_once(self):
+        now = time.time()
+        while self.timers and self.timers[0][0] <= now:
+            timer = heapq.heappop(self.timers)
+            task = timer[2]
+            if task.timer is timer and not task.done:
+                task.step()
+        while self.timers and (self.timers[0][2].timer is not self.timers[0] or self.timers[0][2].done):
+            heapq.heappop(self.timers)
+        if not self.tasks:
+            return
+        timeout = max(0, self.timers[0][0] - time.time()) if self.timers else 3600
+        try:
+            task, value, exc_info = self.results.get(True, timeout)
+        except Empty:
+            return
+        if value is WAKE:
+            if task.timer and not task.done:
+                task.step()
+        else:
+            task.step(value, exc_info)
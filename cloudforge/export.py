@@ -0,0 +1,61 @@
+import hashlib
+import json
+import os
+from cloudforge.forge import stack_dependencies, dependency_levels
+from cloudforge.scheduler import DependencyScheduler
+from cloudforge.serialize import write_template
+
+EXPORT_MANIFEST = 'manifest.json'
+
+
+class DigestWriter(object):
+    """Wraps a file, keeping the size and SHA-256 digest of everything written to it."""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.fp.write(data)
+        self.sha256.update(data)
+        self.size += len(data)
+
+
+def export_definition(renderer, definition, output_dir, workers=4, ordered=False, compact=False):
+    """Render every stack of a definition into output_dir and return the manifest written there.
+
+    Stacks are rendered by ``workers`` threads sharing the renderer. With ``ordered`` a stack
+    is only rendered once the stacks it requires are, and the manifest lists that order.
+    Each body is streamed to ``<stack>.json`` and ``manifest.json`` records its size and
+    SHA-256 digest.
+    """
+    stacks = definition['stacks']
+    order = None
+    if ordered:
+        dependencies = stack_dependencies(stacks)
+        order = [name for level in dependency_levels(dependencies) for name in level]
+    else:
+        dependencies = {name: set() for name in stacks}
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    variables = definition.get('variables')
+    entries = {}
+
+    def export_stack(name):
+        template = renderer.render_template(stacks[name], parent_variables=variables)
+        filename = name + '.json'
+        with open(os.path.join(output_dir, filename), 'w') as fp:
+            writer = DigestWriter(fp)
+            write_template(template, writer, compact)
+        entries[name] = {'file': filename, 'bytes': writer.size, 'sha256': writer.sha256.hexdigest()}
+
+    DependencyScheduler(dependencies, workers).run(export_stack)
+    manifest = {'stacks': entries}
+    if order:
+        manifest['order'] = order
+    manifest_path = os.path.join(output_dir, EXPORT_MANIFEST)
+    with open(manifest_path + '.tmp', 'w') as fp:
+        json.dump(manifest, fp, indent=2, sort_keys=True)
+    os.rename(manifest_path + '.tmp', manifest_path)
+    return manifest
@@ -1,62 +1,235 @@
 import json
+import time
+from contextlib import contextmanager
 from boto.exception import BotoServerError
+from cloudforge.engine import Call, Watch, EventLoop, run_steps
+from cloudforge.manifest import template_digest
+from cloudforge.metrics import CountingConnection
+from cloudforge.scheduler import DependencyScheduler, DependencyTracker, reverse_dependencies
+from cloudforge.serialize import serialize_template
+from cloudforge.shard import shard_template, parent_template, shard_assignment, moved_resources
 from cloudforge.watcher import Watcher
 
 
-def order_stacks(stack_definitions):
-    dep_graph = {}
-    satisfied_deps = []
-    sorted_stack_definitions = []
+def required_stacks(stack_definition):
+    """Names of the stacks a stack requires, explicitly or as the source of a parameter."""
+    deps = set()
+    if 'parameters' in stack_definition:
+        for p_name, p_def in stack_definition['parameters'].items():
+            if 'source' in p_def:
+                deps.add(p_def['source']['stack'])
+    if 'requires' in stack_definition:
+        deps.update(stack_definition['requires'])
+    return deps
+
+
+def stack_dependencies(stack_definitions):
+    dependencies = {}
     for name, stack_definition in stack_definitions.items():
-        deps = set()
-        if 'parameters' in stack_definition:
-            for p_name, p_def in stack_definition['parameters'].items():
-                if 'source' in p_def:
-                    deps.add(p_def['source']['stack'])
-        if 'requires' in stack_definition:
-            deps.update(stack_definition['requires'])
-        if deps:
-            for dep in deps:
-                if dep not in stack_definitions:
-                    raise MissingDependencyError(name, dep)
-            else:
-                dep_graph[name] = list(deps)
-        else:
-            satisfied_deps.append(name)
-    while len(satisfied_deps) > 0:
-        completed_name = satisfied_deps.pop()
-        sorted_stack_definitions.append((completed_name, stack_definitions[completed_name]))
-        for name, deps in dep_graph.items():
-            if completed_name in deps:
-                deps.remove(completed_name)
-                if not deps:
-                    satisfied_deps.append(name)
-                    del dep_graph[name]
-    if len(dep_graph) > 0:
-        raise CircularDependencyError(dep_graph.keys())
-    return sorted_stack_definitions
+        deps = required_stacks(stack_definition)
+        for dep in deps:
+            if dep not in stack_definitions:
+                raise MissingDependencyError(name, dep)
+        dependencies[name] = deps
+    return dependencies
+
+
+def dependency_levels(dependencies):
+    dependents = reverse_dependencies(dependencies)
+    unmet = {name: len(deps) for name, deps in dependencies.items()}
+    level = sorted(name for name, count in unmet.items() if not count)
+    levels = []
+    while level:
+        levels.append(level)
+        next_level = []
+        for completed_name in level:
+            for name in dependents[completed_name]:
+                unmet[name] -= 1
+                if not unmet[name]:
+                    next_level.append(name)
+        level = sorted(next_level)
+    if sum(len(l) for l in levels) < len(dependencies):
+        remaining = {name: deps for name, deps in dependencies.items() if unmet[name]}
+        raise CircularDependencyError(sorted(remaining), find_cycle(remaining))
+    return levels
+
+
+def find_cycle(dependencies):
+    path = []
+    positions = {}
+    name = min(dependencies)
+    while name not in positions:
+        positions[name] = len(path)
+        path.append(name)
+        name = min(dep for dep in dependencies[name] if dep in dependencies)
+    return path[positions[name]:] + [name]
+
+
+def transitive_closure(graph, names):
+    """Return every name reachable from names in graph, not counting names themselves."""
+    reached = set()
+    pending = list(names)
+    while pending:
+        for name in graph[pending.pop()]:
+            if name not in reached:
+                reached.add(name)
+                pending.append(name)
+    return reached - set(names)
+
+
+def select_stacks(stack_definitions, names, with_deps=False, with_dependents=False):
+    """Return names with the stacks they transitively require and/or the stacks that transitively require them."""
+    dependencies = stack_dependencies(stack_definitions)
+    selected = set(names)
+    if with_deps:
+        selected.update(transitive_closure(dependencies, names))
+    if with_dependents:
+        selected.update(transitive_closure(reverse_dependencies(dependencies), names))
+    return selected
+
+
+def definition_dependencies(definition, stack_names=None):
+    """Dependencies of the stacks of a definition, or of stack_names only.
+
+    Stacks outside stack_names are left alone, so they count as already deployed.
+    """
+    dependencies = stack_dependencies(definition['stacks'])
+    if stack_names is None:
+        return dependencies
+    return {name: dependencies[name] & set(stack_names) for name in stack_names}
+
+
+def order_stack_levels(stack_definitions):
+    return [[(name, stack_definitions[name]) for name in level]
+            for level in dependency_levels(stack_dependencies(stack_definitions))]
 
 
-def make_template_body(renderer, template, parent_variables=None):
-    return json.dumps(renderer.render_template(template, parent_variables=parent_variables)).replace(r'\\', '\\')
+def order_stacks(stack_definitions):
+    return [stack for level in order_stack_levels(stack_definitions) for stack in level]
 
 
-def get_cf_value(connection, stack_name, value_name, value_type):
-    if 'resource' == value_type:
-        rv = connection.describe_stack_resource(stack_name, value_name)
-        return rv['DescribeStackResourceResponse']['DescribeStackResourceResult']['StackResourceDetail'][
-            'PhysicalResourceId']
-    else:
-        stack = connection.describe_stacks(stack_name)[0]
-        if 'output' == value_type:
-            vals = [o.value for o in stack.outputs if o.key == value_name]
-        elif 'parameter' == value_type:
-            vals = [p.value for p in stack.parameters if p.key == value_name]
+# Statuses a stack can be updated from, and the statuses an update passes through
+UPDATABLE_STATUSES = ['CREATE_COMPLETE', 'UPDATE_COMPLETE', 'UPDATE_ROLLBACK_COMPLETE']
+UPDATE_IN_PROGRESS_STATUSES = ['UPDATE_IN_PROGRESS', 'UPDATE_COMPLETE_CLEANUP_IN_PROGRESS',
+                               'UPDATE_ROLLBACK_IN_PROGRESS', 'UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS']
+NO_UPDATES_MESSAGE = 'No updates are to be performed'
+# Statuses create can start from, None being a stack that does not exist
+CREATABLE_STATUSES = [None, 'CREATE_COMPLETE', 'CREATE_IN_PROGRESS']
+DELETE_BLOCKING_STATUSES = UPDATE_IN_PROGRESS_STATUSES + ['ROLLBACK_IN_PROGRESS', 'REVIEW_IN_PROGRESS']
+
+
+def is_blocked(action, status):
+    """Whether a stack in status cannot be created, updated or deleted, status is None if it does not exist."""
+    if action == 'create':
+        return status not in CREATABLE_STATUSES
+    if action == 'update':
+        return status is not None and status not in UPDATABLE_STATUSES
+    return status in DELETE_BLOCKING_STATUSES
+
+
+def template_differs(deployed_body, template_body):
+    if deployed_body == template_body:
+        return False
+    try:
+        return json.loads(deployed_body) != json.loads(template_body)
+    except ValueError:
+        return True
+
+
+def parameters_differ(stack, parameters):
+    deployed = {p.key: p.value for p in stack.parameters}
+    return any(deployed.get(key) != value for key, value in parameters or [])
+
+
+def make_template_body(renderer, template, parent_variables=None, compact=False):
+    return serialize_template(renderer.render_template(template, parent_variables=parent_variables), compact)
+
+
+class StackValueIndex(object):
+    """Outputs, parameters and resource ids of source stacks, fetched at most once per stack."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.stacks = {}
+        self.resources = {}
+
+    def add_stack(self, stack_name, stack):
+        self.stacks[stack_name] = {
+            'output': {o.key: o.value for o in stack.outputs},
+            'parameter': {p.key: p.value for p in stack.parameters}
+        }
+
+    def forget(self, stack_name):
+        self.stacks.pop(stack_name, None)
+        self.resources.pop(stack_name, None)
+
+    def stack_values(self, stack_name, value_type):
+        if stack_name not in self.stacks:
+            self.add_stack(stack_name, self.connection.describe_stacks(stack_name)[0])
+        return self.stacks[stack_name][value_type]
+
+    def resource_ids(self, stack_name):
+        if stack_name not in self.resources:
+            resources = {}
+            next_token = None
+            while True:
+                if next_token:
+                    page = self.connection.list_stack_resources(stack_name, next_token=next_token)
+                else:
+                    page = self.connection.list_stack_resources(stack_name)
+                for r in page:
+                    resources[r.logical_resource_id] = r.physical_resource_id
+                next_token = getattr(page, 'next_token', None)
+                if not next_token or not page:
+                    break
+            self.resources[stack_name] = resources
+        return self.resources[stack_name]
+
+    def get(self, stack_name, value_name, value_type):
+        if 'resource' == value_type:
+            values = self.resource_ids(stack_name)
+        elif value_type in ['output', 'parameter']:
+            values = self.stack_values(stack_name, value_type)
         else:
             raise BadCloudformationValueType(value_type)
-        if vals:
-            return vals[0]
-    raise CloudformationValueNotFound(stack_name, value_name, value_type)
+        if value_name in values:
+            return values[value_name]
+        raise CloudformationValueNotFound(stack_name, value_name, value_type)
+
+
+class StackStatusTable(object):
+    """The existing stacks among stack_names, read with paginated describe_stacks calls rather than one per stack."""
+
+    def __init__(self, connection, stack_names):
+        wanted = set(stack_names)
+        self.stacks = {}
+        next_token = None
+        while True:
+            if next_token:
+                page = connection.describe_stacks(next_token=next_token)
+            else:
+                page = connection.describe_stacks()
+            for stack in page:
+                if stack.stack_name in wanted:
+                    self.stacks[stack.stack_name] = stack
+            next_token = getattr(page, 'next_token', None)
+            if not next_token or not page:
+                break
+
+    def get(self, stack_name):
+        return self.stacks.get(stack_name)
+
+    def status(self, stack_name):
+        stack = self.stacks.get(stack_name)
+        return stack.stack_status if stack else None
+
+    def blocked(self, action, stack_names):
+        """Return the status of every stack of stack_names that action cannot start from."""
+        return {name: self.status(name) for name in stack_names if is_blocked(action, self.status(name))}
+
+
+def get_cf_value(connection, stack_name, value_name, value_type):
+    return StackValueIndex(connection).get(stack_name, value_name, value_type)
 
 
 class InvalidParameterDefinitionError(Exception):
@@ -68,12 +241,13 @@ class InvalidParameterDefinitionError(Exception):
         return 'Bad parameter {} defined as {}'.format(self.name, self.definition)
 
 
-def build_parameters(connection, parameters):
+def build_parameters(connection, parameters, index=None):
+    index = index or StackValueIndex(connection)
     cf_params = []
     for p_name, p_def in parameters.items():
         if isinstance(p_def, dict) and 'source' in p_def:
             remote_param_name = p_def['source'].get('name', p_name)
-            value = get_cf_value(connection, p_def['source']['stack'], remote_param_name, p_def['source']['type'])
+            value = index.get(p_def['source']['stack'], remote_param_name, p_def['source']['type'])
             cf_params.append((p_name, value))
         else:
             raise InvalidParameterDefinitionError(p_name, p_def)
@@ -107,6 +281,61 @@ class StackAlreadyExistsError(Exception):
         return 'Could not create {}, it already exists in status {}'.format(self.name, self.status)
 
 
+class StackUpdateError(Exception):
+    def __init__(self, name, status):
+        self.name = name
+        self.status = status
+
+    def __str__(self):
+        return 'Update of {} failed, got status: {}'.format(self.name, self.status)
+
+
+class StackNotUpdatableError(Exception):
+    def __init__(self, name, status):
+        self.name = name
+        self.status = status
+
+    def __str__(self):
+        return 'Could not update {}, it is in status {}'.format(self.name, self.status)
+
+
+class ShardingRequiresArtifactsError(Exception):
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return 'Stack {} needs to be split into nested stacks, which requires an artifact bucket'.format(self.name)
+
+
+class UnshardedStackError(Exception):
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return ('Stack {} is not deployed as nested stacks recording their resources, splitting it would '
+                'replace the resources it holds'.format(self.name))
+
+
+class ShardMoveError(Exception):
+    def __init__(self, name, resource_names):
+        self.name = name
+        self.resource_names = resource_names
+
+    def __str__(self):
+        return 'Updating {} would move {} to other nested stacks, replacing them'.format(
+            self.name, ', '.join(self.resource_names))
+
+
+class StacksBlockedError(Exception):
+    def __init__(self, action, statuses):
+        self.action = action
+        self.statuses = statuses
+
+    def __str__(self):
+        return 'Could not {} stacks, {}'.format(self.action, ', '.join(
+            '{} is in status {}'.format(name, status) for name, status in sorted(self.statuses.items())))
+
+
 class TemplateValidationError(Exception):
     def __init__(self, name, error):
         self.name = name
@@ -117,57 +346,358 @@ class TemplateValidationError(Exception):
 
 
 class Forge(object):
-    def __init__(self, connection, renderer, log_level='INFO'):
+    def __init__(self, connection, renderer, log_level='INFO', concurrency=None, polling=None, manifest=None,
+                 timings=None, metrics=None, artifacts=None, preflight=False, label=None):
+        if metrics:
+            connection = CountingConnection(connection, metrics)
         self.renderer = renderer
         self.connection = connection
-        self.watcher = Watcher(connection, log_level)
+        self.watcher = Watcher(connection, log_level, polling, label)
+        self.logger = self.watcher.logger
+        self.concurrency = concurrency
+        self.index = StackValueIndex(connection)
+        self.manifest = manifest
+        self.timings = timings
+        self.metrics = metrics
+        self.artifacts = artifacts
+        self.preflight = preflight
+        self.statuses = None
+
+    def get_concurrency(self, definition):
+        return self.concurrency or definition.get('concurrency', 1)
+
+    @contextmanager
+    def checked(self, action, definition, stack_names=None):
+        """With preflight on, read the status of every stack of definition up front for the steps to use.
+
+        Raises StacksBlockedError before anything changes if action cannot start from the
+        status of any selected stack.
+        """
+        if self.preflight:
+            statuses = self.timed(None, 'preflight', StackStatusTable)(self.connection, definition['stacks'])
+            blocked = statuses.blocked(action, definition['stacks'] if stack_names is None else stack_names)
+            if blocked:
+                raise StacksBlockedError(action, blocked)
+            for name, stack in statuses.stacks.items():
+                self.index.add_stack(name, stack)
+            self.statuses = statuses
+        try:
+            yield
+        finally:
+            self.statuses = None
 
-    def create_stack(self, name, stack_def, parent_variables=None):
+    def get_stack(self, name):
+        if self.statuses is not None:
+            return self.statuses.get(name)
+        try:
+            return self.connection.describe_stacks(name)[0]
+        except BotoServerError:
+            return None
+
+    def call_api(self, method, *args, **kwargs):
+        return getattr(self.connection, method)(*args, **kwargs)
+
+    def timed(self, stack_name, phase, func):
+        if self.timings is None and self.metrics is None:
+            return func
+
+        def timed_func(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add_timing(stack_name, phase, start)
+        return timed_func
+
+    def add_timing(self, stack_name, phase, start):
+        seconds = time.time() - start
+        if self.timings is not None:
+            self.timings.add(stack_name, phase, seconds)
+        if self.metrics is not None:
+            self.metrics.add_phase(stack_name, phase, seconds)
+
+    def start_stack(self, name, requires=None):
+        if self.metrics is not None:
+            self.metrics.stack_started(name, requires)
+
+    def finish_stack(self, name, status):
+        if self.metrics is not None:
+            self.metrics.stack_finished(name, status)
+
+    def run_stack_steps(self, name, steps):
+        if self.metrics is None:
+            return run_steps(steps, self.watcher)
+        with self.metrics.context(name):
+            return run_steps(steps, self.watcher)
+
+    def shard_stack_template(self, name, options, template, assignment=None):
+        """Return the template of a stack nesting the shards of template.
+
+        options is True or a dict of shard_template keyword arguments. Resources of assignment,
+        the {logical id: shard name} of the deployed stack, stay in their shard.
+        """
+        if not self.artifacts:
+            raise ShardingRequiresArtifactsError(name)
+        shards = shard_template(template, assignment=assignment, **(options if isinstance(options, dict) else {}))
+        moved = moved_resources(assignment or {}, shards)
+        if moved:
+            raise ShardMoveError(name, moved)
+        self.logger.info('Splitting stack {} into {} nested stacks'.format(name, len(shards)))
+        template_urls = [self.artifacts.upload(serialize_template(shard.template(template))) for shard in shards]
+        return parent_template(template, shards, template_urls)
+
+    def prepare_stack(self, name, stack_def, parent_variables=None, assignment=None):
+        """Build the parameters and template body of a stack, return them with their digest.
+
+        assignment is the {logical id: shard name} of the deployed stack if it is sharded.
+        """
         if 'parameters' in stack_def:
-            parameters = build_parameters(self.connection, stack_def['parameters'])
+            parameters = self.timed(name, 'parameters', build_parameters)(self.connection, stack_def['parameters'],
+                                                                          self.index)
         else:
             parameters = None
-        template_body = make_template_body(self.renderer, stack_def, parent_variables)
+        template = self.timed(name, 'render', self.renderer.render_template)(stack_def, parent_variables)
+        if stack_def.get('shard'):
+            template = self.timed(name, 'shard', self.shard_stack_template)(name, stack_def['shard'], template,
+                                                                            assignment)
+        template_body = self.timed(name, 'serialize', serialize_template)(template)
+        if self.metrics is not None:
+            self.metrics.set(name, 'template_bytes', len(template_body))
+        return parameters, template_body, template_digest(template_body, parameters)
+
+    def publish_template(self, name, template_body):
+        """Upload a template body if there is an artifact store and validate it.
+
+        Returns the template_body or template_url keyword argument to create or update the stack with.
+        """
+        if self.artifacts:
+            template_source = {'template_url': self.timed(name, 'upload', self.artifacts.upload)(template_body)}
+        else:
+            template_source = {'template_body': template_body}
         try:
-            self.connection.validate_template(template_body=template_body)
+            self.timed(name, 'validate', self.call_api)('validate_template', **template_source)
         except BotoServerError as e:
             raise TemplateValidationError(name, e)
-        try:
-            stack = self.connection.describe_stacks(name)[0]
-        except BotoServerError:
-            stack = None
+        return template_source
+
+    def create_stack(self, name, stack_def, parent_variables=None):
+        self.run_stack_steps(name, self.create_stack_steps(name, stack_def, parent_variables))
+
+    def create_stack_steps(self, name, stack_def, parent_variables=None):
+        self.start_stack(name, required_stacks(stack_def))
+        if self.statuses is not None and self.statuses.status(name) == 'CREATE_COMPLETE':
+            self.logger.info('Stack {} is already complete, skipping'.format(name))
+            self.finish_stack(name, 'CREATE_COMPLETE')
+            return
+        parameters, template_body, digest = yield Call(self.prepare_stack, name, stack_def, parent_variables)
+        if self.manifest and self.manifest.get(name) == digest:
+            self.logger.info('Stack {} is unchanged, skipping'.format(name))
+            self.finish_stack(name, 'SKIPPED')
+            return
+        template_source = yield Call(self.publish_template, name, template_body)
+        stack = yield Call(self.timed(name, 'describe', self.get_stack), name)
         if not stack:
-            self.connection.create_stack(name, template_body=template_body, parameters=parameters,
-                                         capabilities=['CAPABILITY_IAM'])
-        elif stack.stack_status not in ['CREATE_COMPLETE', 'CREATE_IN_PROGRESS']:
+            yield Call(self.timed(name, 'create', self.call_api), 'create_stack', name, parameters=parameters,
+                       capabilities=['CAPABILITY_IAM'], **template_source)
+        elif stack.stack_status == 'CREATE_COMPLETE':
+            self.index.add_stack(name, stack)
+        elif stack.stack_status != 'CREATE_IN_PROGRESS':
             raise StackAlreadyExistsError(name, stack.stack_status)
         if not stack or stack.stack_status in ['CREATE_IN_PROGRESS']:
-            status = self.watcher.watch(name, ['CREATE_IN_PROGRESS'])
+            start = time.time()
+            status = yield Watch(name, ['CREATE_IN_PROGRESS'])
+            self.add_timing(name, 'watch', start)
             if status != 'CREATE_COMPLETE':
+                self.finish_stack(name, status)
                 raise StackCreationError(name, status)
+            self.index.forget(name)
+        if self.manifest:
+            self.manifest.set(name, digest)
+        self.finish_stack(name, 'CREATE_COMPLETE')
+
+    def update_stack(self, name, stack_def, parent_variables=None):
+        self.run_stack_steps(name, self.update_stack_steps(name, stack_def, parent_variables))
 
-    def create_definition(self, name, definition):
-        stacks = order_stacks(definition['stacks'])
+    def deployed_template_body(self, stack_name):
+        response = self.connection.get_template(stack_name)
+        return response['GetTemplateResponse']['GetTemplateResult']['TemplateBody']
+
+    def stack_differs(self, stack, template_body, parameters):
+        if parameters_differ(stack, parameters):
+            return True
+        return template_differs(self.deployed_template_body(stack.stack_name), template_body)
+
+    def deployed_shards(self, stack):
+        """Return the {logical id: shard name} recorded by a deployed sharded stack.
+
+        Raises UnshardedStackError if the stack was deployed flat, or before shards recorded their resources.
+        """
+        try:
+            assignment = shard_assignment(json.loads(self.deployed_template_body(stack.stack_name)))
+        except ValueError:
+            assignment = None
+        if assignment is None:
+            raise UnshardedStackError(stack.stack_name)
+        return assignment
+
+    def update_stack_steps(self, name, stack_def, parent_variables=None):
+        """Update a stack if its template or parameters differ from the deployed ones, create it if missing."""
+        stack = yield Call(self.timed(name, 'describe', self.get_stack), name)
+        if not stack:
+            yield self.create_stack_steps(name, stack_def, parent_variables)
+            return
+        self.start_stack(name, required_stacks(stack_def))
+        if stack.stack_status not in UPDATABLE_STATUSES:
+            self.finish_stack(name, stack.stack_status)
+            raise StackNotUpdatableError(name, stack.stack_status)
+        if stack_def.get('shard'):
+            assignment = yield Call(self.timed(name, 'describe', self.deployed_shards), stack)
+        else:
+            assignment = None
+        parameters, template_body, digest = yield Call(self.prepare_stack, name, stack_def, parent_variables,
+                                                       assignment)
+        if self.manifest and self.manifest.get(name) == digest:
+            differs = False
+        else:
+            differs = yield Call(self.timed(name, 'diff', self.stack_differs), stack, template_body, parameters)
+        if not differs:
+            self.logger.info('Stack {} is unchanged, skipping'.format(name))
+            self.index.add_stack(name, stack)
+            if self.manifest and self.manifest.get(name) != digest:
+                self.manifest.set(name, digest)
+            self.finish_stack(name, 'UNCHANGED')
+            return
+        template_source = yield Call(self.publish_template, name, template_body)
+        try:
+            yield Call(self.timed(name, 'update', self.call_api), 'update_stack', name, parameters=parameters,
+                       capabilities=['CAPABILITY_IAM'], **template_source)
+        except BotoServerError as e:
+            if NO_UPDATES_MESSAGE not in (e.error_message or ''):
+                raise
+            self.logger.info('Stack {} has no updates to perform'.format(name))
+            self.index.add_stack(name, stack)
+        else:
+            start = time.time()
+            status = yield Watch(name, UPDATE_IN_PROGRESS_STATUSES)
+            self.add_timing(name, 'watch', start)
+            if status != 'UPDATE_COMPLETE':
+                self.finish_stack(name, status)
+                raise StackUpdateError(name, status)
+            self.index.forget(name)
+        if self.manifest:
+            self.manifest.set(name, digest)
+        self.finish_stack(name, 'UPDATE_COMPLETE')
+
+    def run_definition(self, action, definition, stack_names, make_steps):
+        """Run the make_steps(stack_name, stack_def, variables) lifecycle of each stack in dependency order."""
         variables = definition.get('variables')
-        for name, stack_def in stacks:
-            self.create_stack(name, stack_def, variables)
+        dependencies = definition_dependencies(definition, stack_names)
+        levels = dependency_levels(dependencies)
+        concurrency = self.get_concurrency(definition)
+
+        def run_stack(stack_name):
+            self.run_stack_steps(stack_name, make_steps(stack_name, definition['stacks'][stack_name], variables))
+        with self.checked(action, definition, stack_names):
+            if concurrency > 1:
+                DependencyScheduler(dependencies, concurrency).run(run_stack)
+            else:
+                for level in levels:
+                    for stack_name in level:
+                        run_stack(stack_name)
+
+    def update_definition(self, name, definition, stack_names=None):
+        self.run_definition('update', definition, stack_names, self.update_stack_steps)
+
+    def create_definition(self, name, definition, stack_names=None):
+        self.run_definition('create', definition, stack_names, self.create_stack_steps)
 
     def delete_stack(self, name):
-        try:
-            stack = self.connection.describe_stacks(name)[0]
-        except BotoServerError:
-            stack = None
+        self.run_stack_steps(name, self.delete_stack_steps(name))
+
+    def delete_stack_steps(self, name):
+        self.start_stack(name)
+        if self.manifest:
+            self.manifest.forget(name)
+        stack = yield Call(self.timed(name, 'describe', self.get_stack), name)
         if stack and stack.stack_status not in ['DELETE_COMPLETE', 'DELETE_IN_PROGRESS']:
-            self.connection.delete_stack(name)
+            yield Call(self.timed(name, 'delete', self.call_api), 'delete_stack', name)
         if stack and stack.stack_status not in ['DELETE_COMPLETE']:
-            status = self.watcher.watch(name, ['DELETE_IN_PROGRESS'])
+            start = time.time()
+            status = yield Watch(name, ['DELETE_IN_PROGRESS'])
+            self.add_timing(name, 'watch', start)
+            self.finish_stack(name, status)
             if status not in ['DELETE_COMPLETE', 'STACK_GONE']:
                 raise StackDeletionError(name, status)
+        else:
+            self.finish_stack(name, 'DELETE_COMPLETE')
+
+    def delete_definition(self, name, definition, stack_names=None):
+        dependencies = definition_dependencies(definition, stack_names)
+        levels = dependency_levels(dependencies)
+        concurrency = self.get_concurrency(definition)
+        with self.checked('delete', definition, stack_names):
+            if concurrency > 1:
+                DependencyScheduler(reverse_dependencies(dependencies), concurrency).run(self.delete_stack)
+            else:
+                for level in reversed(levels):
+                    for stack_name in reversed(level):
+                        self.delete_stack(stack_name)
+
+
+class AsyncForge(Forge):
+    """Forge that drives every stack of a definition as a coroutine on one event loop.
+
+    Blocking boto calls run on ``workers`` threads however many stacks are in flight,
+    and stacks that take longer than ``stack_timeout`` seconds fail with a
+    StepTimeoutError. Without a concurrency limit every ready stack is started at once.
+    """
+
+    def __init__(self, connection, renderer, workers=4, stack_timeout=None, **kwargs):
+        super(AsyncForge, self).__init__(connection, renderer, **kwargs)
+        self.workers = workers
+        self.stack_timeout = stack_timeout
+
+    def get_concurrency(self, definition):
+        return self.concurrency or definition.get('concurrency')
+
+    def run_graph(self, dependencies, make_steps, concurrency=None):
+        loop = EventLoop(self.watcher, self.workers, self.metrics and self.metrics.context)
+        tracker = DependencyTracker(dependencies)
+        errors = []
+
+        def start_ready():
+            while tracker.ready and not errors and (not concurrency or len(loop.tasks) < concurrency):
+                name = tracker.ready.pop(0)
+                loop.spawn(name, make_steps(name), self.stack_timeout, on_done)
+
+        def on_done(task):
+            if task.exc_info:
+                errors.append(task.exc_info)
+            else:
+                tracker.complete(task.name)
+            start_ready()
+
+        start_ready()
+        loop.run()
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
+
+    def run_definition(self, action, definition, stack_names, make_steps):
+        variables = definition.get('variables')
+        dependencies = definition_dependencies(definition, stack_names)
+        dependency_levels(dependencies)  # raises CircularDependencyError
+
+        def stack_steps(stack_name):
+            return make_steps(stack_name, definition['stacks'][stack_name], variables)
+        with self.checked(action, definition, stack_names):
+            self.run_graph(dependencies, stack_steps, self.get_concurrency(definition))
 
-    def delete_definition(self, name, definition):
-        stacks = reversed(order_stacks(definition['stacks']))
-        for name, _ in stacks:
-            self.delete_stack(name)
+    def delete_definition(self, name, definition, stack_names=None):
+        dependencies = definition_dependencies(definition, stack_names)
+        dependency_levels(dependencies)  # raises CircularDependencyError
+        with self.checked('delete', definition, stack_names):
+            self.run_graph(reverse_dependencies(dependencies), self.delete_stack_steps,
+                           self.get_concurrency(definition))
 
 
 class CloudformationValueNotFound(LookupError):
@@ -191,11 +721,12 @@ class BadCloudformationValueType(ValueError):
 
 
 class CircularDependencyError(Exception):
-    def __init__(self, remaining_dependencies):
+    def __init__(self, remaining_dependencies, cycle):
         self.remaining_dependencies = remaining_dependencies
+        self.cycle = cycle
 
     def __str__(self):
-        return 'Stacks {} have a circular dependency'.format(self.remaining_dependencies)
+        return 'Stacks {} have a circular dependency'.format(' -> '.join(self.cycle))
 
 
 class MissingDependencyError(Exception):
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+import threading
+
+
+def template_digest(template_body, parameters=None):
+    digest = hashlib.sha256(template_body)
+    digest.update(json.dumps(sorted(parameters or [])))
+    return digest.hexdigest()
+
+
+class Manifest(object):
+    """Local record of the template digest each stack was last deployed with."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as fp:
+                self.digests = json.load(fp)
+        else:
+            self.digests = {}
+
+    def get(self, stack_name):
+        return self.digests.get(stack_name)
+
+    def set(self, stack_name, digest):
+        with self.lock:
+            self.digests[stack_name] = digest
+            self.save()
+
+    def forget(self, stack_name):
+        with self.lock:
+            if self.digests.pop(stack_name, None):
+                self.save()
+
+    def scope(self, name):
+        return ManifestScope(self, name)
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(self.digests, fp, indent=2, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+
+class ManifestScope(object):
+    """View of a Manifest whose stack names are prefixed, so several targets can share one file."""
+
+    def __init__(self, manifest, name):
+        self.manifest = manifest
+        self.name = name
+
+    def key(self, stack_name):
+        return '{}:{}'.format(self.name, stack_name)
+
+    def get(self, stack_name):
+        return self.manifest.get(self.key(stack_name))
+
+    def set(self, stack_name, digest):
+        self.manifest.set(self.key(stack_name), digest)
+
+    def forget(self, stack_name):
+        self.manifest.forget(self.key(stack_name))
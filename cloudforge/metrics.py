@@ -0,0 +1,210 @@
+import datetime
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Per stack metrics, in export order, with their Prometheus help text
+METRICS = [
+    ('queue_wait_seconds', 'Seconds between the stacks a stack requires finishing and the stack starting'),
+    ('render_seconds', 'Seconds spent rendering the stack template'),
+    ('serialize_seconds', 'Seconds spent serializing the stack template'),
+    ('template_bytes', 'Size of the stack template body in bytes'),
+    ('validate_seconds', 'Seconds validate_template took'),
+    ('in_progress_seconds', 'Seconds the stack spent in CREATE_IN_PROGRESS or DELETE_IN_PROGRESS'),
+    ('deploy_seconds', 'Seconds from starting the stack to finishing it'),
+    ('api_calls', 'CloudFormation API calls made for the stack'),
+    ('polls', 'Stack event polls made while waiting for the stack')
+]
+PHASE_METRICS = {'render': 'render_seconds', 'serialize': 'serialize_seconds', 'validate': 'validate_seconds',
+                 'watch': 'in_progress_seconds'}
+QUANTILES = [0.5, 0.95]
+
+
+def percentile(values, fraction):
+    """Nearest rank percentile of a non empty list."""
+    return sorted(values)[max(0, int(math.ceil(fraction * len(values))) - 1)]
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    return '{' + ','.join('{}="{}"'.format(k, escape_label(v)) for k, v in labels) + '}'
+
+
+class DeployMetrics(object):
+    """Per stack deployment metrics of a run, exported as JSON lines or a Prometheus textfile.
+
+    API calls made through a CountingConnection are charged to the stack whose ``context``
+    the calling thread is in.
+    """
+
+    def __init__(self, definition_name):
+        self.definition_name = definition_name
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.records = OrderedDict()
+        self.finished = {}
+        self.run_started = time.time()
+
+    def record(self, stack_name, target):
+        key = (target, stack_name)
+        if key not in self.records:
+            self.records[key] = {'stack': stack_name, 'target': target}
+        return self.records[key]
+
+    def add(self, stack_name, key, value, target=None):
+        with self.lock:
+            record = self.record(stack_name, target)
+            record[key] = record.get(key, 0) + value
+
+    def set(self, stack_name, key, value, target=None):
+        with self.lock:
+            self.record(stack_name, target)[key] = value
+
+    def add_phase(self, stack_name, phase, seconds, target=None):
+        if phase in PHASE_METRICS:
+            self.add(stack_name, PHASE_METRICS[phase], seconds, target)
+
+    def stack_started(self, stack_name, requires=None, target=None):
+        """Mark a stack started, ``requires`` gives its queue wait unless it is None."""
+        now = time.time()
+        with self.lock:
+            record = self.record(stack_name, target)
+            record['started'] = now
+            if requires is not None:
+                ready = max([self.finished[(target, name)] for name in requires if (target, name) in self.finished]
+                            or [self.run_started])
+                record['queue_wait_seconds'] = now - ready
+
+    def stack_finished(self, stack_name, status, target=None):
+        now = time.time()
+        with self.lock:
+            record = self.record(stack_name, target)
+            record['status'] = status
+            if 'started' in record:
+                record['deploy_seconds'] = now - record['started']
+            self.finished[(target, stack_name)] = now
+
+    @contextmanager
+    def context(self, stack_name, target=None):
+        previous = getattr(self.local, 'stack', None)
+        self.local.stack = (stack_name, target)
+        try:
+            yield
+        finally:
+            self.local.stack = previous
+
+    def count_call(self, method, kwargs):
+        current = getattr(self.local, 'stack', None)
+        if current is None:
+            return
+        stack_name, target = current
+        self.add(stack_name, 'api_calls', 1, target)
+        if method == 'describe_stack_events' and not kwargs.get('next_token'):
+            self.add(stack_name, 'polls', 1, target)
+
+    def scope(self, target):
+        return MetricsScope(self, target)
+
+    def rows(self):
+        with self.lock:
+            records = [dict(record) for record in self.records.values()]
+        for record in records:
+            record.pop('started', None)
+            record['definition'] = self.definition_name
+            if record['target'] is None:
+                del record['target']
+        return records
+
+    def write_jsonl(self, path):
+        """Append one JSON object per stack to path."""
+        timestamp = datetime.datetime.utcnow().isoformat() + 'Z'
+        with open(path, 'a') as fp:
+            for row in self.rows():
+                row['time'] = timestamp
+                fp.write(json.dumps(row, sort_keys=True) + '\n')
+
+    def format_prometheus(self):
+        rows = self.rows()
+        lines = []
+        for name, help_text in METRICS:
+            metric = 'cloudforge_stack_' + name
+            samples = [row for row in rows if name in row]
+            if not samples:
+                continue
+            lines += ['# HELP {} {}'.format(metric, help_text), '# TYPE {} gauge'.format(metric)]
+            for row in samples:
+                labels = [('definition', self.definition_name)]
+                if 'target' in row:
+                    labels.append(('target', row['target']))
+                labels += [('stack', row['stack']), ('status', row.get('status', 'unknown'))]
+                lines.append('{}{} {}'.format(metric, format_labels(labels), repr(float(row[name]))))
+        deploy_times = [row['deploy_seconds'] for row in rows if 'deploy_seconds' in row]
+        if deploy_times:
+            metric = 'cloudforge_deploy_seconds'
+            lines += ['# HELP {} Quantiles of the deploy seconds of the stacks of a run'.format(metric),
+                      '# TYPE {} summary'.format(metric)]
+            labels = [('definition', self.definition_name)]
+            for quantile in QUANTILES:
+                lines.append('{}{} {}'.format(metric, format_labels(labels + [('quantile', quantile)]),
+                                              repr(float(percentile(deploy_times, quantile)))))
+            lines.append('{}_sum{} {}'.format(metric, format_labels(labels), repr(float(sum(deploy_times)))))
+            lines.append('{}_count{} {}'.format(metric, format_labels(labels), len(deploy_times)))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Write a node_exporter textfile, atomically so a scrape never sees half of it."""
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as fp:
+            fp.write(self.format_prometheus())
+        os.rename(tmp_path, path)
+
+
+class MetricsScope(object):
+    """View of DeployMetrics that labels every stack with a target, so several targets can share one run."""
+
+    def __init__(self, metrics, target):
+        self.metrics = metrics
+        self.target = target
+
+    def add_phase(self, stack_name, phase, seconds):
+        self.metrics.add_phase(stack_name, phase, seconds, self.target)
+
+    def set(self, stack_name, key, value):
+        self.metrics.set(stack_name, key, value, self.target)
+
+    def stack_started(self, stack_name, requires=None):
+        self.metrics.stack_started(stack_name, requires, self.target)
+
+    def stack_finished(self, stack_name, status):
+        self.metrics.stack_finished(stack_name, status, self.target)
+
+    def context(self, stack_name):
+        return self.metrics.context(stack_name, self.target)
+
+    def count_call(self, method, kwargs):
+        self.metrics.count_call(method, kwargs)
+
+
+class CountingConnection(object):
+    """Proxy of a connection that counts every API call made through it towards the current stack."""
+
+    def __init__(self, connection, metrics):
+        self.connection = connection
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self.connection, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self.metrics.count_call(name, kwargs)
+            return attr(*args, **kwargs)
+        return call
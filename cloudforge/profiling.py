@@ -0,0 +1,101 @@
+import cProfile
+import json
+import pstats
+import threading
+import time
+from collections import defaultdict
+
+# Phases in the order they happen to a stack, used to order timing columns
+PHASES = ['load_definition', 'preflight', 'parameters', 'render', 'shard', 'serialize', 'diff', 'upload', 'validate',
+          'describe', 'create', 'update', 'delete', 'watch']
+DEFINITION = '(definition)'
+
+
+class PhaseTimings(object):
+    """Wall clock seconds spent in each phase of a run, per stack. Safe to share between threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stacks = defaultdict(lambda: defaultdict(float))
+
+    def add(self, stack_name, phase, seconds):
+        with self.lock:
+            self.stacks[stack_name or DEFINITION][phase] += seconds
+
+    def timed(self, stack_name, phase, func):
+        """Return func wrapped to add the time each call takes to the stack's phase."""
+        def timed_func(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stack_name, phase, time.time() - start)
+        return timed_func
+
+    def phases(self):
+        seen = set(phase for phases in self.stacks.values() for phase in phases)
+        return [phase for phase in PHASES if phase in seen] + sorted(seen - set(PHASES))
+
+    def as_dict(self):
+        with self.lock:
+            stacks = {name: dict(phases) for name, phases in self.stacks.items()}
+        totals = defaultdict(float)
+        for phases in stacks.values():
+            for phase, seconds in phases.items():
+                totals[phase] += seconds
+        return {'phases': self.phases(), 'stacks': stacks, 'totals': dict(totals)}
+
+    def write(self, path):
+        with open(path, 'w') as fp:
+            json.dump(self.as_dict(), fp, indent=2, sort_keys=True)
+
+    def format_table(self):
+        timings = self.as_dict()
+        phases = timings['phases']
+        names = sorted(timings['stacks'], key=lambda name: (name != DEFINITION, name))
+        width = max([len('STACK'), len('TOTAL')] + [len(name) for name in names])
+        widths = [max(9, len(phase)) for phase in phases]
+
+        def row(name, values):
+            cells = ['{:>{w}}'.format('{:.3f}'.format(v) if v is not None else '-', w=w)
+                     for v, w in zip(values, widths)]
+            return '{:<{w}}  {}  {:>9.3f}'.format(name, '  '.join(cells), sum(v or 0 for v in values), w=width)
+
+        lines = ['{:<{w}}  {}  {:>9}'.format('STACK', '  '.join('{:>{w}}'.format(p.upper(), w=w)
+                                                               for p, w in zip(phases, widths)), 'TOTAL', w=width)]
+        for name in names:
+            lines.append(row(name, [timings['stacks'][name].get(phase) for phase in phases]))
+        lines.append(row('TOTAL', [timings['totals'].get(phase) for phase in phases]))
+        return '\n'.join(lines)
+
+
+class ThreadedProfile(object):
+    """cProfile of the calling thread and of every thread started while it runs."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiles = []
+
+    def new_profile(self):
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        return profile
+
+    def start_thread(self, frame, event, arg):
+        # Called once as a new thread starts, the profile replaces this hook
+        self.new_profile().enable()
+
+    def runcall(self, func, *args, **kwargs):
+        profile = self.new_profile()
+        threading.setprofile(self.start_thread)
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            threading.setprofile(None)
+
+    def dump_stats(self, path):
+        stats = pstats.Stats(self.profiles[0])
+        for profile in self.profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
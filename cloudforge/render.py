@@ -1,45 +1,170 @@
 import json
+import multiprocessing
+import threading
 import yaml
 import os
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+from cloudforge import yamlload
 
 TEMPLATE_BASE = {'AWSTemplateFormatVersion': '2010-09-09'}
+TEMPLATE_CACHE_ENV = 'CLOUDFORGE_TEMPLATE_CACHE'
 
+_renderers = {}
+_renderers_lock = threading.Lock()
+# Renderer of a render pool worker process
+_worker_renderer = None
 
-def make_renderer(definition):
-    if 'template_path' in definition:
-        return Renderer(FileSystemLoader(definition['template_path']))
-    else:
-        return Renderer(FileSystemLoader('./'))
+
+def make_renderer(definition, processes=None):
+    """Return the process wide renderer for a definition's template path and cache directory.
+
+    Compiled templates are kept for the life of the process. If the definition has a
+    ``template_cache`` directory (or ``CLOUDFORGE_TEMPLATE_CACHE`` is set) their bytecode
+    is also stored there, so later runs skip compilation. ``processes`` (default: the
+    definition's ``render_processes``) renders resources on a pool of that many processes.
+    """
+    template_path = definition.get('template_path', './')
+    cache_dir = definition.get('template_cache', os.environ.get(TEMPLATE_CACHE_ENV))
+    processes = processes or definition.get('render_processes')
+    key = (os.path.abspath(template_path), cache_dir and os.path.abspath(cache_dir), processes)
+    with _renderers_lock:
+        if key not in _renderers:
+            bytecode_cache = None
+            if cache_dir:
+                if not os.path.isdir(cache_dir):
+                    os.makedirs(cache_dir)
+                bytecode_cache = FileSystemBytecodeCache(cache_dir)
+            _renderers[key] = Renderer(FileSystemLoader(template_path), bytecode_cache, processes)
+        return _renderers[key]
 
 
-def stringify(thing):
-    if isinstance(thing, dict):
-        return {k: stringify(v) for k, v in thing.items()}
-    elif isinstance(thing, list):
-        return [stringify(v) for v in thing]
-    elif isinstance(thing, int) or isinstance(thing, bool):
+def stringify(thing, in_place=False):
+    """Return thing with every int and bool inside it turned into a string.
+
+    Nested dicts and lists are walked with an explicit stack instead of recursion. Unless
+    ``in_place`` is set they are copied first, leaving the original untouched.
+    """
+    if isinstance(thing, int):
         return str(thing)
-    else:
+    if not isinstance(thing, (dict, list)):
         return thing
+    root = thing if in_place else _copy_container(thing)
+    stack = [root]
+    while stack:
+        container = stack.pop()
+        items = container.iteritems() if isinstance(container, dict) else enumerate(container)
+        for key, value in items:
+            if isinstance(value, (dict, list)):
+                if not in_place:
+                    value = container[key] = _copy_container(value)
+                stack.append(value)
+            elif isinstance(value, int):
+                container[key] = str(value)
+    return root
+
+
+def _copy_container(container):
+    return dict(container) if isinstance(container, dict) else list(container)
+
+
+def resource_source(resource_def, variables=None):
+    """Return the name, template path and variables a resource is rendered with.
+
+    The resource's own variables are added to ``variables`` when it is not empty, so
+    resources rendered later in the same template see them as well.
+    """
+    variables = variables or {}
+    if resource_def[1]:
+        name = resource_def[1].get('name', resource_def[0])
+        template_path = resource_def[1].get('template', resource_def[0] + '.yaml')
+        variables.update(resource_def[1].get('variables', {}))
+    else:
+        name = resource_def[0]
+        template_path = resource_def[0] + '.yaml'
+    return name, template_path, variables
+
+
+def make_resource(name, resource):
+    # The loaded resource is ours alone, so it is stringified where it is
+    resource = stringify(resource, in_place=True)
+    return {name: {k[0].upper() + k[1:]: v for k, v in resource.items()}}
+
+
+def strip_marks(node):
+    """Drop the source positions of a YAML node tree, which hold the whole document."""
+    stack = [node]
+    while stack:
+        child = stack.pop()
+        if child.start_mark is None:
+            continue
+        child.start_mark = child.end_mark = None
+        if isinstance(child, yaml.MappingNode):
+            stack.extend(n for pair in child.value for n in pair)
+        elif isinstance(child, yaml.SequenceNode):
+            stack.extend(child.value)
+    return node
+
+
+def _init_render_worker(loader, bytecode_cache):
+    global _worker_renderer
+    _worker_renderer = Renderer(loader, bytecode_cache)
+
+
+def _compose_resource(job):
+    return _worker_renderer.compose_resource(*job)
 
 
 class Renderer(object):
-    def __init__(self, loader):
-        self.env = Environment(loader=loader)
+    def __init__(self, loader, bytecode_cache=None, processes=None):
+        self.env = Environment(loader=loader, bytecode_cache=bytecode_cache)
+        self.processes = processes
+        self.pool = None
+        self.pool_lock = threading.Lock()
 
     def render_resource(self, resource_def, parent_variables=None):
-        variables = parent_variables or {}
-        if resource_def[1]:
-            name = resource_def[1].get('name', resource_def[0])
-            template_path = resource_def[1].get('template', resource_def[0] + '.yaml')
-            variables.update(resource_def[1].get('variables', {}))
-        else:
-            name = resource_def[0]
-            template_path = resource_def[0] + '.yaml'
+        name, template_path, variables = resource_source(resource_def, parent_variables)
         template = self.env.get_template(template_path)
-        resource = yaml.safe_load(template.render(**variables))
-        return {name: {k[0].upper() + k[1:]: v for k, v in resource.items()}}
+        return make_resource(name, yamlload.safe_load(template.render(**variables)))
+
+    def compose_resource(self, template_path, variables):
+        """Render a resource template and parse it into a YAML node tree without constructing it."""
+        text = self.env.get_template(template_path).render(**variables)
+        node = yamlload.compose(text)
+        return node and strip_marks(node)
+
+    def get_pool(self):
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = multiprocessing.Pool(self.processes, _init_render_worker,
+                                                 (self.env.loader, self.env.bytecode_cache))
+            return self.pool
+
+    def close(self):
+        with self.pool_lock:
+            if self.pool is not None:
+                self.pool.terminate()
+                self.pool = None
+
+    def render_resources(self, resource_defs, variables):
+        """Render resources in order, on the process pool if the renderer has one."""
+        if not self.processes or len(resource_defs) < 2:
+            return [self.render_resource(resource_def, variables) for resource_def in resource_defs]
+        names = []
+        jobs = []
+        for resource_def in resource_defs:
+            name, template_path, resource_variables = resource_source(resource_def, variables)
+            names.append(name)
+            # Snapshot, as later resources can add to the shared variables
+            jobs.append((template_path, dict(resource_variables)))
+        # Fail on missing or broken templates here, as the serial path would
+        for template_path in set(job[0] for job in jobs):
+            self.env.get_template(template_path)
+        chunksize = max(1, len(jobs) // (self.processes * 4))
+        nodes = self.get_pool().map(_compose_resource, jobs, chunksize)
+        # Workers only parse, objects are constructed here exactly like yamlload.safe_load would
+        constructor = yamlload.SafeLoader('')
+        return [make_resource(name, node and constructor.construct_document(node))
+                for name, node in zip(names, nodes)]
 
     def render_template(self, template_def, parent_variables=None):
         template = TEMPLATE_BASE.copy()
@@ -47,15 +172,16 @@ class Renderer(object):
             parameters = {}
             parameters_def = template_def['parameters']
             for name, parameter_def in parameters_def.items():
-                param = {name: {k[0].upper() + k[1:]: v for k, v in parameter_def.items() if k != 'source'}}
+                param = {name: {k[0].upper() + k[1:]: stringify(v) for k, v in parameter_def.items()
+                                if k != 'source'}}
                 parameters.update(param)
             template['Parameters'] = parameters
         if 'mappings' in template_def:
-            template['Mappings'] = template_def['mappings']
-        variables = parent_variables or {}
+            template['Mappings'] = stringify(template_def['mappings'])
+        variables = dict(parent_variables or {})
         if 'resource_chunk' in template_def:
             with open(template_def['resource_chunk']) as fp:
-                rendered_resources = json.load(fp)
+                rendered_resources = stringify(json.load(fp), in_place=True)
         else:
             rendered_resources = {}
         if 'resources' in template_def:
@@ -64,12 +190,12 @@ class Renderer(object):
                 raise MalformedTemplateError(template_def, "bad resources definition")
             resource_defs = resources_def.items()
             variables.update(template_def.get('variables', {}))
-            for resource_def in resource_defs:
-                rendered_resources.update(self.render_resource(resource_def, variables))
+            for rendered_resource in self.render_resources(resource_defs, variables):
+                rendered_resources.update(rendered_resource)
         if not rendered_resources:
             raise NoResourcesError(template_def)
         template['Resources'] = rendered_resources
-        return stringify(template)
+        return template
 
 
 class MalformedTemplateError(Exception):
@@ -0,0 +1,88 @@
+import sys
+import threading
+from Queue import Queue
+
+
+def reverse_dependencies(dependencies):
+    dependents = {name: set() for name in dependencies}
+    for name, deps in dependencies.items():
+        for dep in deps:
+            dependents[dep].add(name)
+    return dependents
+
+
+class DependencyTracker(object):
+    """Track which nodes of a dependency graph are ready as others complete."""
+
+    def __init__(self, dependencies):
+        self.remaining = {name: set(deps) for name, deps in dependencies.items()}
+        self.dependents = reverse_dependencies(dependencies)
+        self.ready = sorted(name for name, deps in self.remaining.items() if not deps)
+
+    def complete(self, name):
+        for dependent in sorted(self.dependents[name]):
+            self.remaining[dependent].discard(name)
+            if not self.remaining[dependent]:
+                self.ready.append(dependent)
+
+
+class DependencyScheduler(object):
+    """Run a function for every node of a dependency graph on a bounded pool of threads.
+
+    A node is started as soon as all of its dependencies have finished. If a node
+    fails, nothing new is started, nodes already running are allowed to finish and
+    the first error is re-raised.
+    """
+
+    def __init__(self, dependencies, max_workers=1):
+        self.dependencies = dependencies
+        self.max_workers = max(1, max_workers)
+
+    def run(self, func):
+        tracker = DependencyTracker(self.dependencies)
+        tasks = Queue()
+        results = Queue()
+        workers = []
+        for _ in range(min(self.max_workers, len(self.dependencies))):
+            worker = threading.Thread(target=self._work, args=(func, tasks, results))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+        completed = []
+        in_flight = 0
+        error = None
+        try:
+            while True:
+                while tracker.ready and error is None:
+                    tasks.put(tracker.ready.pop(0))
+                    in_flight += 1
+                if not in_flight:
+                    break
+                name, exc_info = results.get()
+                in_flight -= 1
+                if exc_info:
+                    error = error or exc_info
+                    continue
+                completed.append(name)
+                tracker.complete(name)
+        finally:
+            for _ in workers:
+                tasks.put(None)
+        for worker in workers:
+            worker.join()
+        if error:
+            raise error[0], error[1], error[2]
+        return completed
+
+    @staticmethod
+    def _work(func, tasks, results):
+        while True:
+            name = tasks.get()
+            if name is None:
+                return
+            try:
+                func(name)
+            except Exception:
+                results.put((name, sys.exc_info()))
+            else:
+                results.put((name, None))
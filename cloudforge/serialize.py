@@ -0,0 +1,58 @@
+import json
+
+ENCODER = json.JSONEncoder()
+COMPACT_ENCODER = json.JSONEncoder(separators=(',', ':'))
+# Levels of dicts written key by key, the template and its sections, everything below a
+# section (each resource, output...) is encoded whole by the C encoder
+STREAM_DEPTH = 2
+# Chunks are joined into writes of about this many bytes
+WRITE_SIZE = 65536
+
+
+def iter_template_chunks(encoder, value, depth=STREAM_DEPTH):
+    if depth and isinstance(value, dict) and value and all(isinstance(key, basestring) for key in value):
+        separator = '{'
+        for key, item in value.iteritems():
+            yield separator + encoder.encode(key) + encoder.key_separator
+            separator = encoder.item_separator
+            for chunk in iter_template_chunks(encoder, item, depth - 1):
+                yield chunk
+        yield '}'
+    else:
+        yield encoder.encode(value)
+
+
+def write_template(template, fp, compact=False):
+    """Write a rendered template to fp as JSON and return its size in bytes.
+
+    The body is written one resource (or other section entry) at a time, so it is never held
+    in memory as a whole. Escaped backslashes are written unescaped, as CloudFormation
+    templates built from cloudlets expect. ``compact`` leaves out all optional whitespace.
+    """
+    encoder = COMPACT_ENCODER if compact else ENCODER
+    size = 0
+    pending = []
+    pending_size = 0
+    # Every chunk holds whole JSON strings, so an escaped backslash is never split across chunks
+    for chunk in iter_template_chunks(encoder, template):
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size >= WRITE_SIZE:
+            size += write_chunks(fp, pending)
+            pending = []
+            pending_size = 0
+    return size + write_chunks(fp, pending)
+
+
+def write_chunks(fp, chunks):
+    data = ''.join(chunks)
+    if '\\' in data:
+        data = data.replace(r'\\', '\\')
+    fp.write(data)
+    return len(data)
+
+
+def serialize_template(template, compact=False):
+    """Return a rendered template as a JSON string, with escaped backslashes unescaped."""
+    encoder = COMPACT_ENCODER if compact else ENCODER
+    return encoder.encode(template).replace(r'\\', '\\')
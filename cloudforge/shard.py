@@ -0,0 +1,399 @@
+"""Splitting of templates with too many resources or bytes into nested stacks.
+
+Resources are grouped by the Ref, Fn::GetAtt, Fn::Sub and DependsOn references between
+them. Groups that fit are packed together into shards, groups that do not are split in
+dependency order. References between shards become outputs of one shard and parameters
+of another, so CloudFormation creates shards that do not depend on each other in parallel.
+
+The parent records the resources of each shard in its metadata. Given that assignment of
+a deployed parent, resources stay in their shard and only new ones are placed, as moving
+a resource to another nested stack would delete and recreate it.
+"""
+import itertools
+import re
+from collections import defaultdict
+from cloudforge.serialize import serialize_template
+
+MAX_RESOURCES = 400
+MAX_BYTES = 800000
+SHARD_PREFIX = 'Shard'
+SHARD_METADATA = 'CloudforgeShardResources'
+SUB_VARIABLE = re.compile(r'\$\{([A-Za-z0-9]+)(?:\.([A-Za-z0-9.]+))?\}')
+
+
+def sub_parts(value):
+    """Split an Fn::Sub value into its string and variables."""
+    if isinstance(value, list):
+        return value[0], value[1] if len(value) > 1 else {}
+    return value, {}
+
+
+def iter_references(thing):
+    """Yield (logical id, attribute or None) of every Ref, Fn::GetAtt and Fn::Sub variable in thing."""
+    stack = [thing]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            if len(item) == 1 and 'Ref' in item:
+                yield item['Ref'], None
+            elif len(item) == 1 and 'Fn::GetAtt' in item:
+                value = item['Fn::GetAtt']
+                logical_id, attribute = value if isinstance(value, list) else value.split('.', 1)
+                yield logical_id, attribute
+            elif len(item) == 1 and 'Fn::Sub' in item:
+                string, variables = sub_parts(item['Fn::Sub'])
+                for match in SUB_VARIABLE.finditer(string):
+                    if match.group(1) not in variables:
+                        yield match.group(1), match.group(2)
+                stack.extend(variables.values())
+            else:
+                stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+
+
+def depends_on(resource):
+    value = resource.get('DependsOn', [])
+    return [value] if isinstance(value, basestring) else value
+
+
+def resource_dependencies(resources):
+    dependencies = {}
+    for name, resource in resources.items():
+        deps = set(logical_id for logical_id, _ in iter_references(resource))
+        deps.update(depends_on(resource))
+        deps.discard(name)
+        dependencies[name] = deps & set(resources)
+    return dependencies
+
+
+def components(dependencies):
+    """Return the groups of names connected by dependencies in either direction."""
+    neighbours = defaultdict(set)
+    for name, deps in dependencies.items():
+        for dep in deps:
+            neighbours[name].add(dep)
+            neighbours[dep].add(name)
+    seen = set()
+    groups = []
+    for name in sorted(dependencies):
+        if name in seen:
+            continue
+        group = []
+        pending = [name]
+        seen.add(name)
+        while pending:
+            current = pending.pop()
+            group.append(current)
+            for neighbour in neighbours[current]:
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    pending.append(neighbour)
+        groups.append(sorted(group))
+    return groups
+
+
+class ResourceCycleError(Exception):
+    def __init__(self, names):
+        self.names = names
+
+    def __str__(self):
+        return 'Resources {} have a circular dependency'.format(', '.join(self.names))
+
+
+def topological_order(names, dependencies):
+    names = set(names)
+    unmet = {name: len(dependencies[name] & names) for name in names}
+    dependents = defaultdict(list)
+    for name in names:
+        for dep in dependencies[name] & names:
+            dependents[dep].append(name)
+    ready = sorted((name for name, count in unmet.items() if not count), reverse=True)
+    order = []
+    while ready:
+        name = ready.pop()
+        order.append(name)
+        for dependent in dependents[name]:
+            unmet[dependent] -= 1
+            if not unmet[dependent]:
+                ready.append(dependent)
+        ready.sort(reverse=True)
+    if len(order) < len(names):
+        raise ResourceCycleError(sorted(names - set(order)))
+    return order
+
+
+class ShardCycleError(Exception):
+    def __init__(self, names):
+        self.names = names
+
+    def __str__(self):
+        return 'Shards {} would depend on each other in a cycle'.format(', '.join(self.names))
+
+
+def resource_sizes(resources):
+    return {name: len(serialize_template(resource)) for name, resource in resources.items()}
+
+
+def resource_groups(dependencies, sizes, max_resources=MAX_RESOURCES, max_bytes=MAX_BYTES):
+    """Return the connected groups within the limits, largest first, and the cuts of the others.
+
+    Groups that do not fit are cut in dependency order, so a cut only depends on earlier cuts.
+    """
+    bins = []
+    cuts = []
+    for group in components(dependencies):
+        group_bytes = sum(sizes[name] for name in group)
+        if len(group) <= max_resources and group_bytes <= max_bytes:
+            bins.append((group, group_bytes))
+            continue
+        cut, cut_bytes = [], 0
+        for name in topological_order(group, dependencies):
+            if cut and (len(cut) >= max_resources or cut_bytes + sizes[name] > max_bytes):
+                cuts.append(cut)
+                cut, cut_bytes = [], 0
+            cut.append(name)
+            cut_bytes += sizes[name]
+        cuts.append(cut)
+    return [group for group, _ in sorted(bins, key=lambda b: (-b[1], b[0]))], cuts
+
+
+def partition(resources, max_resources=MAX_RESOURCES, max_bytes=MAX_BYTES):
+    """Return lists of resource names, each within the limits unless a single resource is not.
+
+    Connected groups that fit are packed first fit decreasing. Groups that do not fit are
+    cut in dependency order, and every cut gets a shard of its own so shards never depend
+    on each other in a cycle.
+    """
+    sizes = resource_sizes(resources)
+    groups, cuts = resource_groups(resource_dependencies(resources), sizes, max_resources, max_bytes)
+    packed = []
+    for group in groups:
+        group_bytes = sum(sizes[name] for name in group)
+        for shard in packed:
+            if len(shard[0]) + len(group) <= max_resources and shard[1] + group_bytes <= max_bytes:
+                shard[0].extend(group)
+                shard[1] += group_bytes
+                break
+        else:
+            packed.append([list(group), group_bytes])
+    return [sorted(names) for names, _ in packed] + cuts
+
+
+class Shard(object):
+    """A nested stack holding some of the resources of a template."""
+
+    def __init__(self, name, resource_names):
+        self.name = name
+        self.resource_names = resource_names
+        self.resources = {}
+        self.parameters = {}
+        self.parameter_values = {}
+        self.outputs = {}
+        self.depends_on = set()
+
+    def template(self, base):
+        template = {'AWSTemplateFormatVersion': base['AWSTemplateFormatVersion']}
+        if self.parameters:
+            template['Parameters'] = self.parameters
+        if 'Mappings' in base:
+            template['Mappings'] = base['Mappings']
+        template['Resources'] = self.resources
+        if self.outputs:
+            template['Outputs'] = self.outputs
+        return template
+
+
+class ShardWiring(object):
+    """Rewrites the resources of each shard, turning references into other shards into parameters."""
+
+    def __init__(self, template, shards):
+        self.template_parameters = template.get('Parameters', {})
+        self.owners = {name: shard for shard in shards for name in shard.resource_names}
+
+    def reference(self, shard, logical_id, attribute):
+        """Return the name shard refers to logical_id (and attribute) by."""
+        owner = self.owners.get(logical_id)
+        if owner is None:
+            if logical_id in self.template_parameters:
+                shard.parameters[logical_id] = self.template_parameters[logical_id]
+                shard.parameter_values[logical_id] = {'Ref': logical_id}
+            return logical_id
+        if owner is shard:
+            return logical_id
+        if attribute:
+            name = 'GetAtt{}{}'.format(logical_id, attribute.replace('.', ''))
+            value = {'Fn::GetAtt': [logical_id, attribute]}
+        else:
+            name = 'Ref{}'.format(logical_id)
+            value = {'Ref': logical_id}
+        owner.outputs[name] = {'Value': value}
+        shard.parameters[name] = {'Type': 'String'}
+        shard.parameter_values[name] = {'Fn::GetAtt': [owner.name, 'Outputs.' + name]}
+        shard.depends_on.add(owner.name)
+        return name
+
+    def rewrite_sub(self, shard, value):
+        string, variables = sub_parts(value)
+
+        def replace(match):
+            logical_id, attribute = match.groups()
+            if logical_id in variables:
+                return match.group(0)
+            name = self.reference(shard, logical_id, attribute)
+            if name == logical_id:
+                return match.group(0)
+            return '${' + name + '}'
+
+        string = SUB_VARIABLE.sub(replace, string)
+        if isinstance(value, list):
+            return [string, self.rewrite(shard, variables)]
+        return string
+
+    def rewrite(self, shard, thing):
+        if isinstance(thing, dict):
+            if len(thing) == 1 and 'Ref' in thing:
+                return {'Ref': self.reference(shard, thing['Ref'], None)}
+            if len(thing) == 1 and 'Fn::GetAtt' in thing:
+                value = thing['Fn::GetAtt']
+                logical_id, attribute = value if isinstance(value, list) else value.split('.', 1)
+                name = self.reference(shard, logical_id, attribute)
+                return thing if name == logical_id else {'Ref': name}
+            if len(thing) == 1 and 'Fn::Sub' in thing:
+                return {'Fn::Sub': self.rewrite_sub(shard, thing['Fn::Sub'])}
+            return {k: self.rewrite(shard, v) for k, v in thing.items()}
+        if isinstance(thing, list):
+            return [self.rewrite(shard, item) for item in thing]
+        return thing
+
+    def rewrite_resource(self, shard, resource):
+        resource = self.rewrite(shard, resource)
+        if 'DependsOn' in resource:
+            local = []
+            for name in depends_on(resource):
+                owner = self.owners.get(name)
+                if owner is shard:
+                    local.append(name)
+                elif owner is not None:
+                    shard.depends_on.add(owner.name)
+            if local:
+                resource['DependsOn'] = local
+            else:
+                del resource['DependsOn']
+        return resource
+
+
+def shard_index(shard_name):
+    return int(shard_name[len(SHARD_PREFIX):])
+
+
+def shard_dependencies(dependencies, owners):
+    """Return the shards each shard of owners, a {logical id: shard name}, depends on."""
+    graph = {shard_name: set() for shard_name in owners.values()}
+    for name, deps in dependencies.items():
+        if name in owners:
+            graph[owners[name]].update(owners[dep] for dep in deps if dep in owners and owners[dep] != owners[name])
+    return graph
+
+
+def shard_cycle(dependencies, owners):
+    """Return the shards of owners in a dependency cycle, or an empty list."""
+    graph = shard_dependencies(dependencies, owners)
+    try:
+        topological_order(graph, graph)
+    except ResourceCycleError as e:
+        return e.names
+    return []
+
+
+def assign_shards(resources, assignment=None, max_resources=MAX_RESOURCES, max_bytes=MAX_BYTES):
+    """Return the {logical id: shard name} of resources.
+
+    Resources of assignment keep their shard. The others are grouped as partition does, and
+    each group goes into the first shard it fits in without shards depending on each other in
+    a cycle, trying the shards of the resources it is connected to first, or else a new shard.
+    Without an assignment this packs groups first fit decreasing, like partition.
+    """
+    dependencies = resource_dependencies(resources)
+    owners = {name: shard_name for name, shard_name in (assignment or {}).items() if name in resources}
+    new = set(resources) - set(owners)
+    sizes = resource_sizes(resources)
+    counts = defaultdict(int)
+    shard_bytes = defaultdict(int)
+    for name, shard_name in owners.items():
+        counts[shard_name] += 1
+        shard_bytes[shard_name] += sizes[name]
+    indexes = itertools.count(max([shard_index(shard_name) + 1 for shard_name in (assignment or {}).values()] or [0]))
+    groups, cuts = resource_groups({name: dependencies[name] & new for name in new}, sizes, max_resources,
+                                   max_bytes)
+    for part in groups + cuts:
+        part_bytes = sum(sizes[name] for name in part)
+        connected = set(owners.get(dep) for name in part for dep in dependencies[name])
+        connected.update(owners[name] for name, deps in dependencies.items() if name in owners and deps & set(part))
+        candidates = sorted(counts, key=lambda shard_name: (shard_name not in connected, shard_index(shard_name)))
+        for shard_name in candidates:
+            if counts[shard_name] + len(part) > max_resources or shard_bytes[shard_name] + part_bytes > max_bytes:
+                continue
+            placed = dict(owners)
+            placed.update((name, shard_name) for name in part)
+            if not shard_cycle(dependencies, placed):
+                break
+        else:
+            shard_name = '{}{}'.format(SHARD_PREFIX, next(indexes))
+        for name in part:
+            owners[name] = shard_name
+        counts[shard_name] += len(part)
+        shard_bytes[shard_name] += part_bytes
+    cycle = shard_cycle(dependencies, owners)
+    if cycle:
+        raise ShardCycleError(cycle)
+    return owners
+
+
+def shard_template(template, max_resources=MAX_RESOURCES, max_bytes=MAX_BYTES, assignment=None):
+    """Return the shards of template, keeping the resources of assignment in their shard."""
+    resources = template['Resources']
+    shard_resources = defaultdict(list)
+    for name, shard_name in assign_shards(resources, assignment, max_resources, max_bytes).items():
+        shard_resources[shard_name].append(name)
+    shards = [Shard(shard_name, sorted(shard_resources[shard_name]))
+              for shard_name in sorted(shard_resources, key=shard_index)]
+    wiring = ShardWiring(template, shards)
+    for shard in shards:
+        for name in shard.resource_names:
+            shard.resources[name] = wiring.rewrite_resource(shard, resources[name])
+    return shards
+
+
+def shard_assignment(parent):
+    """Return the {logical id: shard name} a deployed parent template records, None if it is not a parent."""
+    assignment = {}
+    for shard_name, resource in parent.get('Resources', {}).items():
+        names = resource.get('Metadata', {}).get(SHARD_METADATA)
+        if names is None:
+            return None
+        assignment.update((name, shard_name) for name in names)
+    return assignment
+
+
+def moved_resources(assignment, shards):
+    """Return the resources of assignment that shards put in another shard."""
+    return sorted(name for shard in shards for name in shard.resource_names
+                  if assignment.get(name, shard.name) != shard.name)
+
+
+def parent_template(template, shards, template_urls):
+    """Return the template of the stack nesting shards, whose templates are at template_urls."""
+    parent = {'AWSTemplateFormatVersion': template['AWSTemplateFormatVersion']}
+    if 'Parameters' in template:
+        parent['Parameters'] = template['Parameters']
+    parent['Resources'] = {}
+    for shard, template_url in zip(shards, template_urls):
+        resource = {'Type': 'AWS::CloudFormation::Stack', 'Properties': {'TemplateURL': template_url},
+                    'Metadata': {SHARD_METADATA: shard.resource_names}}
+        if shard.parameter_values:
+            resource['Properties']['Parameters'] = shard.parameter_values
+        if shard.depends_on:
+            resource['DependsOn'] = sorted(shard.depends_on)
+        parent['Resources'][shard.name] = resource
+    return parent
@@ -0,0 +1,75 @@
+import threading
+import time
+
+
+def expand_targets(definition):
+    """Return one definition per entry of the definition's ``targets`` list.
+
+    Each target's keys (usually ``region`` and ``role``) override the definition's own.
+    A definition without targets is its own single target.
+    """
+    if 'targets' not in definition:
+        return [definition]
+    target_definitions = []
+    for target in definition['targets']:
+        target_definition = {k: v for k, v in definition.items() if k != 'targets'}
+        target_definition.update(target)
+        target_definitions.append(target_definition)
+    return target_definitions
+
+
+def target_name(definition):
+    role = definition.get('role')
+    if role:
+        return '{}/{}'.format(definition['region'], role['role_arn'])
+    return definition['region']
+
+
+class TargetResult(object):
+    def __init__(self, name):
+        self.name = name
+        self.error = None
+        self.elapsed = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def run_targets(target_definitions, func):
+    """Call ``func(definition)`` for every target at once and return a TargetResult per target."""
+    results = [TargetResult(target_name(d)) for d in target_definitions]
+
+    def run(definition, result):
+        start = time.time()
+        try:
+            func(definition)
+        except Exception as e:
+            result.error = e
+        result.elapsed = time.time() - start
+
+    threads = [threading.Thread(target=run, args=(d, r)) for d, r in zip(target_definitions, results)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def format_report(results):
+    width = max(len('TARGET'), *[len(r.name) for r in results])
+    lines = ['{:<{w}}  {:<6}  {:>8}  {}'.format('TARGET', 'STATUS', 'SECONDS', 'ERROR', w=width)]
+    for r in results:
+        lines.append('{:<{w}}  {:<6}  {:>8.1f}  {}'.format(r.name, 'ok' if r.ok else 'failed', r.elapsed,
+                                                            r.error or '', w=width).rstrip())
+    return '\n'.join(lines)
+
+
+class TargetsFailedError(Exception):
+    def __init__(self, results):
+        self.results = results
+
+    def __str__(self):
+        failed = [r.name for r in self.results if not r.ok]
+        return '{} of {} targets failed: {}\n{}'.format(len(failed), len(self.results), ', '.join(failed),
+                                                        format_report(self.results))
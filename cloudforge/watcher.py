@@ -1,19 +1,64 @@
+import heapq
+import itertools
 import logging
+import random
+from collections import deque
 from boto.exception import BotoServerError
 import time
 
 
-def filter_events_before(last_event, events):
-    event_ids = [e.event_id for e in events]
-    if last_event.event_id not in event_ids:
+class EventReader(object):
+    """Read only the stack events that have not been seen yet, newest first.
+
+    Pages are followed until an already seen event shows up, so no events are lost
+    when more than a page arrives between two reads. The ids of the last
+    ``max_seen`` events are remembered.
+    """
+
+    def __init__(self, connection, stack_name, max_seen=1000):
+        self.connection = connection
+        self.stack_name = stack_name
+        self.seen_ids = set()
+        self.seen_order = deque()
+        self.max_seen = max_seen
+
+    def prime(self):
+        events = list(self.connection.describe_stack_events(self.stack_name))
+        self.remember(events)
         return events
-    else:
-        pos = [pos for pos, eid in enumerate(event_ids) if eid == last_event.event_id][0]
-        return events[:pos]
+
+    def read(self):
+        new_events = []
+        next_token = None
+        while True:
+            if next_token:
+                page = self.connection.describe_stack_events(self.stack_name, next_token=next_token)
+            else:
+                page = self.connection.describe_stack_events(self.stack_name)
+            page_events = 0
+            for event in page:
+                if event.event_id in self.seen_ids:
+                    self.remember(new_events)
+                    return new_events
+                new_events.append(event)
+                page_events += 1
+            next_token = getattr(page, 'next_token', None)
+            if not next_token or not page_events:
+                self.remember(new_events)
+                return new_events
+
+    def remember(self, events):
+        for event in reversed(events):
+            if event.event_id in self.seen_ids:
+                continue
+            if len(self.seen_order) >= self.max_seen:
+                self.seen_ids.discard(self.seen_order.popleft())
+            self.seen_order.append(event.event_id)
+            self.seen_ids.add(event.event_id)
 
 
-def log_event(logger, event):
-    logger.info('{} {} {} {} {} {}'.format(
+def log_event(logger, event, prefix=''):
+    logger.info(prefix + '{} {} {} {} {} {}'.format(
         event.timestamp.isoformat(),
         event.resource_status,
         event.resource_type,
@@ -23,43 +68,188 @@ def log_event(logger, event):
     ))
 
 
+class FixedPolling(object):
+    def __init__(self, interval=5):
+        self.interval = interval
+
+    def next_delay(self, new_events):
+        return self.interval
+
+
+class BackoffPolling(object):
+    """Poll quickly at first and whenever new events arrive, backing off exponentially while idle."""
+
+    def __init__(self, initial=1, maximum=30, factor=2, jitter=0.2):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.delay = None
+
+    def next_delay(self, new_events):
+        if new_events or self.delay is None:
+            self.delay = self.initial
+        else:
+            self.delay = min(self.delay * self.factor, self.maximum)
+        return random.uniform(self.delay * (1 - self.jitter), self.delay)
+
+
+POLLING_STRATEGIES = {
+    'fixed': FixedPolling,
+    'backoff': BackoffPolling
+}
+
+
+class UnknownPollingStrategyError(ValueError):
+    def __init__(self, strategy):
+        self.strategy = strategy
+
+    def __str__(self):
+        return 'Polling strategy {} is unknown, expected one of {}'.format(self.strategy,
+                                                                          ', '.join(sorted(POLLING_STRATEGIES)))
+
+
+def make_polling(spec=None):
+    """Return a factory of polling schedules for a strategy name, a dict or a callable.
+
+    A dict names its strategy under ``strategy`` and passes the remaining keys as options,
+    e.g. ``{'strategy': 'backoff', 'maximum': 60}``. A callable is used as the factory itself.
+    """
+    if callable(spec):
+        return spec
+    if spec is None:
+        spec = 'backoff'
+    if isinstance(spec, dict):
+        options = dict(spec)
+        strategy = options.pop('strategy', 'backoff')
+    else:
+        options = {}
+        strategy = spec
+    if strategy not in POLLING_STRATEGIES:
+        raise UnknownPollingStrategyError(strategy)
+    return lambda: POLLING_STRATEGIES[strategy](**options)
+
+
+# Shared by every Watcher, so several watchers (one per target) do not print each line several times
+HANDLER = logging.StreamHandler()
+
+
+class LabelAdapter(logging.LoggerAdapter):
+    """Prefixes every message with a label, such as the target a run is for."""
+
+    def process(self, msg, kwargs):
+        return '[{}] {}'.format(self.extra['label'], msg), kwargs
+
+
 class Watcher(object):
-    def __init__(self, connection, log_level='info'):
+    def __init__(self, connection, log_level='info', polling=None, label=None):
         self.connection = connection
-        self.logger = logging.getLogger(__name__)
-        self.logger.setLevel(getattr(logging, log_level.upper()))
-        self.logger.addHandler(logging.StreamHandler())
+        self.polling = make_polling(polling)
+        logger = logging.getLogger(__name__)
+        logger.setLevel(getattr(logging, log_level.upper()))
+        if HANDLER not in logger.handlers:
+            logger.addHandler(HANDLER)
+        self.logger = LabelAdapter(logger, {'label': label}) if label else logger
 
     def watch(self, stack_name, while_statuses):
+        stack_watch = StackWatch(self, stack_name, while_statuses)
+        stack_watch.start()
+        while not stack_watch.done:
+            time.sleep(stack_watch.next_delay())
+            stack_watch.poll()
+        return stack_watch.status
+
+    def watch_many(self, stack_names, while_statuses, polls_per_second=2, on_complete=None):
+        """Follow several stacks from one loop and return a dict of their final statuses.
+
+        Stacks are polled as their schedules come due, but never more often than
+        ``polls_per_second`` in total. ``on_complete(stack_name, status)`` is called as
+        soon as each stack leaves ``while_statuses``.
+        """
+        statuses = {}
+        queue = []
+        order = itertools.count()
+
+        def finish(stack_watch):
+            statuses[stack_watch.stack_name] = stack_watch.status
+            self.logger.info('{}: finished with status {}'.format(stack_watch.stack_name, stack_watch.status))
+            if on_complete:
+                on_complete(stack_watch.stack_name, stack_watch.status)
+
+        def schedule(stack_watch):
+            if stack_watch.done:
+                finish(stack_watch)
+            else:
+                heapq.heappush(queue, (time.time() + stack_watch.next_delay(), next(order), stack_watch))
+
+        for stack_name in stack_names:
+            stack_watch = StackWatch(self, stack_name, while_statuses, prefix='{}: '.format(stack_name))
+            stack_watch.start()
+            schedule(stack_watch)
+        next_poll = time.time()
+        while queue:
+            due, _, stack_watch = heapq.heappop(queue)
+            wait = max(due, next_poll) - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            next_poll = time.time() + 1.0 / polls_per_second
+            stack_watch.poll()
+            schedule(stack_watch)
+        return statuses
+
+
+class StackWatch(object):
+    """Polling state of a single stack followed by a Watcher."""
+
+    prev_event_count = 5
+
+    def __init__(self, watcher, stack_name, while_statuses, prefix=''):
+        self.connection = watcher.connection
+        self.logger = watcher.logger
+        self.polling = watcher.polling()
+        self.stack_name = stack_name
+        self.while_statuses = while_statuses
+        self.prefix = prefix
+        self.events = EventReader(self.connection, stack_name)
+        self.stack = None
+        self.new_events = True
+        self.status = None
+
+    @property
+    def done(self):
+        return self.status not in self.while_statuses
+
+    def next_delay(self):
+        return self.polling.next_delay(bool(self.new_events))
+
+    def start(self):
         try:
-            stack = self.connection.describe_stacks(stack_name)[0]
-            prev_events = self.connection.describe_stack_events(stack_name)
+            self.stack = self.connection.describe_stacks(self.stack_name)[0]
+            prev_events = self.events.prime()
         except BotoServerError as e:
-            if e.error_message == 'Stack:{} does not exist'.format(stack_name):
-                return 'STACK_GONE'
-            else:
-                raise e
-        prev_event_count = 5
-        self.logger.info('Last {} events for {} stack'.format(prev_event_count, stack_name))
-        for event in reversed(prev_events[:prev_event_count]):
-            log_event(self.logger, event)
-        self.logger.info('New events:')
-        last_event = prev_events[0]
-        status = stack.stack_status.encode('utf-8')
-        while status in while_statuses:
-            try:
-                events = self.connection.describe_stack_events(stack_name)
-            except BotoServerError as e:
-                if e.error_message == 'Stack:{} does not exist'.format(stack_name):
-                    return 'STACK_GONE'
-                else:
-                    raise e
-            new_events = filter_events_before(last_event, events)
-            if new_events:
-                for event in reversed(new_events):
-                    log_event(self.logger, event)
-                last_event = new_events[0]
-            stack.update()
-            status = stack.stack_status.encode('utf-8')
-            time.sleep(5)
-        return status
+            self.check_gone(e)
+            return
+        self.logger.info(self.prefix + 'Last {} events for {} stack'.format(self.prev_event_count, self.stack_name))
+        for event in reversed(prev_events[:self.prev_event_count]):
+            log_event(self.logger, event, self.prefix)
+        self.logger.info(self.prefix + 'New events:')
+        self.status = self.stack.stack_status.encode('utf-8')
+
+    def poll(self):
+        try:
+            self.new_events = self.events.read()
+        except BotoServerError as e:
+            self.check_gone(e)
+            return
+        if self.new_events:
+            for event in reversed(self.new_events):
+                log_event(self.logger, event, self.prefix)
+            # The stack status only changes alongside a new event, so skip the describe otherwise
+            self.stack.update()
+            self.status = self.stack.stack_status.encode('utf-8')
+
+    def check_gone(self, error):
+        if error.error_message == 'Stack:{} does not exist'.format(self.stack_name):
+            self.status = 'STACK_GONE'
+        else:
+            raise error
@@ -0,0 +1,58 @@
+import cPickle
+import hashlib
+import os
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+CACHE_DIR_ENV = 'CLOUDFORGE_CACHE_DIR'
+# Bump when the cached format or the way files are parsed changes
+CACHE_VERSION = 1
+
+
+def safe_load(stream):
+    """yaml.safe_load, using libyaml when PyYAML was built with it."""
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def compose(stream):
+    return yaml.compose(stream, Loader=SafeLoader)
+
+
+class ParsedFileCache(object):
+    """On disk cache of parsed files, keyed by path and invalidated by mtime and size."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def entry_path(self, path):
+        key = hashlib.sha1('{}:{}'.format(CACHE_VERSION, os.path.abspath(path))).hexdigest()
+        return os.path.join(self.cache_dir, key + '.pickle')
+
+    def get(self, path, parse):
+        """Return the cached data for path, calling ``parse(path)`` and caching it if stale."""
+        stat = os.stat(path)
+        stamp = (stat.st_mtime, stat.st_size)
+        entry_path = self.entry_path(path)
+        try:
+            with open(entry_path, 'rb') as fp:
+                entry_stamp, data = cPickle.load(fp)
+            if entry_stamp == stamp:
+                return data
+        except Exception:
+            # A missing, unreadable or corrupt entry is a miss
+            pass
+        data = parse(path)
+        self.put(entry_path, stamp, data)
+        return data
+
+    def put(self, entry_path, stamp, data):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        tmp_path = '{}.{}.tmp'.format(entry_path, os.getpid())
+        with open(tmp_path, 'wb') as fp:
+            cPickle.dump((stamp, data), fp, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, entry_path)
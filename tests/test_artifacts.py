@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+from boto.cloudformation import CloudFormationConnection
+from boto.exception import BotoServerError
+from jinja2 import DictLoader
+from cloudforge.artifacts import artifact_key, LocalArtifactStore, S3ArtifactStore
+from cloudforge.forge import Forge, make_template_body
+from cloudforge.render import Renderer
+
+resources = {'simple.yaml': ('Type: AWS::IAM::InstanceProfile\n'
+                             'Properties:\n'
+                             '  Path: /\n'
+                             '  Roles:\n'
+                             '  - TheRole\n')}
+stack_def = {'resources': {'simple': None}}
+
+
+class ArtifactStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_key_is_content_hash(self):
+        self.assertEqual(artifact_key('{}', 'templates/'), artifact_key('{}', 'templates/'))
+        self.assertNotEqual(artifact_key('{}'), artifact_key('{ }'))
+        self.assertTrue(artifact_key('{}', 'templates/').startswith('templates/'))
+
+    def test_local_store_skips_existing_keys(self):
+        store = LocalArtifactStore(self.tmp, 'templates/')
+        url = store.upload('{"a": 1}')
+        path = os.path.join(self.tmp, artifact_key('{"a": 1}', 'templates/'))
+        self.assertEqual('file://' + path, url)
+        with open(path) as fp:
+            self.assertEqual('{"a": 1}', fp.read())
+        with mock.patch.object(LocalArtifactStore, 'put') as mock_put:
+            self.assertEqual(url, LocalArtifactStore(self.tmp, 'templates/').upload('{"a": 1}'))
+            self.assertFalse(mock_put.called)
+
+    def test_s3_store_uploads_missing_keys_once(self):
+        conn = mock.MagicMock()
+        bucket = conn.get_bucket.return_value
+        bucket.get_key.return_value = None
+        store = S3ArtifactStore(conn, 'templates', 'us-west-2')
+        key = artifact_key('{}')
+        self.assertEqual('https://s3.us-west-2.amazonaws.com/templates/' + key, store.upload('{}'))
+        store.upload('{}')
+        bucket.get_key.assert_called_once_with(key)
+        bucket.new_key.assert_called_once_with(key)
+        bucket.new_key.return_value.set_contents_from_string.assert_called_once_with(
+            '{}', headers={'Content-Type': 'application/json'})
+
+    def test_s3_store_skips_existing_keys(self):
+        conn = mock.MagicMock()
+        bucket = conn.get_bucket.return_value
+        S3ArtifactStore(conn, 'templates').upload('{}')
+        self.assertFalse(bucket.new_key.called)
+
+    def test_forge_passes_template_url(self):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        conn.describe_stacks.side_effect = BotoServerError(None, None)
+        store = LocalArtifactStore(self.tmp)
+        forge = Forge(conn, Renderer(DictLoader(resources)), artifacts=store)
+        forge.watcher = mock.MagicMock()
+        forge.watcher.watch.return_value = 'CREATE_COMPLETE'
+        forge.create_stack('simple', stack_def)
+        body = make_template_body(Renderer(DictLoader(resources)), stack_def)
+        url = store.url(artifact_key(body))
+        conn.validate_template.assert_called_once_with(template_url=url)
+        conn.create_stack.assert_called_once_with('simple', template_url=url, parameters=None,
+                                                  capabilities=['CAPABILITY_IAM'])
+
+
+if __name__ == '__main__':
+    unittest.main()
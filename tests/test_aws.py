@@ -1,10 +1,35 @@
+import copy
+import datetime
+import threading
 import unittest
 import mock
 from boto.sts.credentials import Credentials, AssumedRole
 from cloudforge import aws
 
 
+def make_role(expires_in=3600):
+    creds = Credentials()
+    creds.access_key = 'access_key'
+    creds.secret_key = 'secret_key'
+    creds.session_token = 'session_token'
+    expiration = datetime.datetime.utcnow() + datetime.timedelta(seconds=expires_in)
+    creds.expiration = expiration.strftime('%Y-%m-%dT%H:%M:%SZ')
+    return AssumedRole(credentials=creds)
+
+
+role_defn = {
+    'region': 'us-east-1',
+    'role': {
+        'role_arn': 'fake-role-arn',
+        'role_session_name': 'my-session'
+    }
+}
+
+
 class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        aws.connection_cache.clear()
+
     @mock.patch('cloudforge.aws.sts.connect_to_region')
     def test_assume_role(self, ctr_mock):
         region = 'us-east-1'
@@ -53,6 +78,39 @@ class MyTestCase(unittest.TestCase):
         cfctr_mock.assert_called_once_with(region, aws_access_key_id='access_key', aws_secret_access_key='secret_key',
                                            security_token='session_token')
 
+    @mock.patch('cloudforge.aws.cf.connect_to_region')
+    @mock.patch('cloudforge.aws.sts.connect_to_region')
+    def test_connect_reuses_credentials_and_connection(self, stsctr_mock, cfctr_mock):
+        stsctr_mock.return_value.assume_role.return_value = make_role()
+        defn = copy.deepcopy(role_defn)
+        aws.connect(defn).describe_stacks('a')
+        aws.connect(defn).describe_stacks('b')
+        self.assertEqual(1, stsctr_mock.return_value.assume_role.call_count)
+        self.assertEqual(1, cfctr_mock.call_count)
+        self.assertEqual(role_defn, defn)
+
+    @mock.patch('cloudforge.aws.cf.connect_to_region')
+    @mock.patch('cloudforge.aws.sts.connect_to_region')
+    def test_connect_refreshes_expiring_credentials(self, stsctr_mock, cfctr_mock):
+        stsctr_mock.return_value.assume_role.side_effect = [make_role(60), make_role()]
+        aws.connect(role_defn)
+        aws.connect(role_defn)
+        self.assertEqual(2, stsctr_mock.return_value.assume_role.call_count)
+        self.assertEqual(2, cfctr_mock.call_count)
+
+    @mock.patch('cloudforge.aws.cf.connect_to_region')
+    @mock.patch('cloudforge.aws.sts.connect_to_region')
+    def test_connection_per_thread(self, stsctr_mock, cfctr_mock):
+        stsctr_mock.return_value.assume_role.return_value = make_role()
+        cfctr_mock.side_effect = lambda *args, **kwargs: mock.MagicMock()
+        conn = aws.connect(role_defn)
+        thread = threading.Thread(target=lambda: conn.describe_stacks('a'))
+        thread.start()
+        thread.join()
+        conn.describe_stacks('b')
+        self.assertEqual(2, cfctr_mock.call_count)
+        self.assertEqual(1, stsctr_mock.return_value.assume_role.call_count)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,36 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from benchmarks import suite
+
+
+class BenchSuiteTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'baseline.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_run_and_compare(self):
+        self.assertEqual(0, suite.main(['run', '--quick', '--repeat', '1', '--save', self.path]))
+        with open(self.path) as fp:
+            baseline = json.load(fp)
+        self.assertEqual(list(suite.BENCHMARKS), sorted(baseline['results'], key=list(suite.BENCHMARKS).index))
+        baseline['results'] = {'watch': baseline['results']['watch']}
+        baseline['results']['watch']['best'] = 1e-9
+        with open(self.path, 'w') as fp:
+            json.dump(baseline, fp)
+        self.assertEqual(1, suite.main(['compare', self.path, '--repeat', '1']))
+
+    def test_compare_verdicts(self):
+        baseline = {'a': {'best': 1.0}, 'b': {'best': 1.0}, 'c': {'best': 1.0}}
+        results = {'a': {'best': 1.5}, 'b': {'best': 0.5}, 'c': {'best': 1.1}, 'd': {'best': 1.0}}
+        self.assertEqual([('a', 'REGRESSION'), ('b', 'faster'), ('c', 'ok')],
+                         sorted((row[0], row[4]) for row in suite.compare(baseline, results, 0.2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,26 +22,29 @@ resources = {'plain.yaml': ('Type: AWS::IAM::InstanceProfile\n'
 
 
 class DumpTest(unittest.TestCase):
+    @mock.patch('sys.stdout', new_callable=StringIO)
     @mock.patch('cloudforge.cli.make_renderer')
     @mock.patch('cloudforge.cli.open', create=True)
-    def test_dump_template(self, mock_open, mock_renderer):
+    def test_dump_template(self, mock_open, mock_renderer, mock_stdout):
         mock_open.return_value.__enter__.return_value = StringIO(plain_stack)
         mock_renderer.return_value = Renderer(DictLoader(resources))
-        args = Namespace(definition_name='plain', stack_name='my_stack', yamlfile='test.yaml')
+        args = Namespace(definition_name='plain', stack_name='my_stack', yamlfile='test.yaml', render_processes=None,
+                         cache_dir=None)
+        self.assertIsNone(dump(args))
         self.assertEqual(json.dumps({'AWSTemplateFormatVersion': '2010-09-09',
                                      'Resources': {
                                          'plain': {'Type': 'AWS::IAM::InstanceProfile',
                                                    'Properties': {
                                                        'Path': '/',
                                                        'Roles': ['TheRole']
-                                                   }}}}), dump(args))
+                                                   }}}}) + '\n', mock_stdout.getvalue())
 
     @mock.patch('cloudforge.cli.make_renderer')
     @mock.patch('cloudforge.cli.open', create=True)
     def test_dump_bad_definition_fails(self, mock_open, mock_renderer):
         mock_open.return_value.__enter__.return_value = StringIO(plain_stack)
         mock_renderer.return_value = Renderer(DictLoader(resources))
-        args = Namespace(definition_name='fake', stack_name='my_stack', yamlfile='test.yaml')
+        args = Namespace(definition_name='fake', stack_name='my_stack', yamlfile='test.yaml', cache_dir=None)
         self.assertRaises(DefinitionLookupError, dump, args)
 
     @mock.patch('cloudforge.cli.make_renderer')
@@ -49,7 +52,7 @@ class DumpTest(unittest.TestCase):
     def test_dump_bad_template_fails(self, mock_open, mock_renderer):
         mock_open.return_value.__enter__.return_value = StringIO(plain_stack)
         mock_renderer.return_value = Renderer(DictLoader(resources))
-        args = Namespace(definition_name='plain', stack_name='fake_stack', yamlfile='test.yaml')
+        args = Namespace(definition_name='plain', stack_name='fake_stack', yamlfile='test.yaml', cache_dir=None)
         self.assertRaises(StackLookupError, dump, args)
 
 
@@ -0,0 +1,171 @@
+import time
+import unittest
+import mock
+from boto.cloudformation import CloudFormationConnection
+from boto.exception import BotoServerError
+from jinja2 import DictLoader
+from cloudforge.engine import Call, Sleep, Watch, EventLoop, run_steps, CancelledError, StepTimeoutError
+from cloudforge.forge import AsyncForge, StackCreationError
+from cloudforge.render import Renderer
+from cloudforge.watcher import Watcher
+from .test_watcher import make_growing_events
+
+resources = {'simple.yaml': ('Type: AWS::IAM::InstanceProfile\n'
+                             'Properties:\n'
+                             '  Path: /\n'
+                             '  Roles:\n'
+                             '  - TheRole\n')}
+
+
+def sleeper(seconds, log):
+    yield Sleep(seconds)
+    log.append(seconds)
+
+
+class RunStepsTest(unittest.TestCase):
+    def test_run_steps_sends_results_and_raises_errors(self):
+        log = []
+
+        def steps():
+            log.append((yield Call(lambda x: x * 2, 21)))
+            try:
+                yield Call(int, 'nope')
+            except ValueError:
+                log.append('caught')
+            log.append((yield Watch('test', ['CREATE_IN_PROGRESS'])))
+
+        watcher = mock.MagicMock()
+        watcher.watch.return_value = 'CREATE_COMPLETE'
+        run_steps(steps(), watcher)
+        self.assertEqual([42, 'caught', 'CREATE_COMPLETE'], log)
+
+    def test_run_steps_runs_nested_lifecycles(self):
+        log = []
+
+        def steps():
+            yield sleeper(0, log)
+            log.append('after')
+
+        run_steps(steps(), mock.MagicMock())
+        self.assertEqual([0, 'after'], log)
+
+
+class EventLoopTest(unittest.TestCase):
+    def test_sleeps_do_not_block_each_other(self):
+        log = []
+        loop = EventLoop(mock.MagicMock())
+        start = time.time()
+        for seconds in [0.2, 0.1, 0.2]:
+            loop.spawn('sleeper', sleeper(seconds, log))
+        loop.run()
+        self.assertTrue(time.time() - start < 0.4)
+        self.assertEqual([0.1, 0.2, 0.2], log)
+
+    def test_call_errors_are_thrown_into_the_task(self):
+        def steps():
+            yield Call(int, 'nope')
+
+        loop = EventLoop(mock.MagicMock())
+        task = loop.spawn('bad', steps())
+        loop.run()
+        self.assertEqual(ValueError, task.exc_info[0])
+
+    def test_timeout(self):
+        log = []
+        loop = EventLoop(mock.MagicMock())
+        task = loop.spawn('slow', sleeper(10, log), timeout=0.05)
+        loop.run()
+        self.assertEqual(StepTimeoutError, task.exc_info[0])
+        self.assertEqual([], log)
+
+    def test_cancel(self):
+        log = []
+        loop = EventLoop(mock.MagicMock())
+        task = loop.spawn('slow', sleeper(10, log))
+        loop.spawn('canceller', (step for step in [Call(task.cancel)]))
+        loop.run()
+        self.assertEqual(CancelledError, task.exc_info[0])
+
+    def test_watch_follows_the_stack(self):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        stack = conn.describe_stacks.return_value.__getitem__.return_value
+        stack.stack_status.encode.side_effect = ['CREATE_IN_PROGRESS'] * 3 + ['CREATE_COMPLETE']
+        conn.describe_stack_events.side_effect = make_growing_events(4)
+        log = []
+
+        def steps():
+            log.append((yield Watch('test', ['CREATE_IN_PROGRESS'])))
+
+        loop = EventLoop(Watcher(conn, polling={'strategy': 'fixed', 'interval': 0}))
+        loop.spawn('test', steps())
+        loop.run()
+        self.assertEqual(['CREATE_COMPLETE'], log)
+        self.assertEqual(3, stack.update.call_count)
+
+
+class AsyncForgeTest(unittest.TestCase):
+    def make_forge(self, conn, **kwargs):
+        forge = AsyncForge(conn, Renderer(DictLoader(resources)), polling={'strategy': 'fixed', 'interval': 0},
+                           **kwargs)
+        return forge
+
+    def test_create_definition(self):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        for method in ['validate_template', 'describe_stacks', 'create_stack', 'describe_stack_events']:
+            getattr(conn, method)
+        stacks = {}
+        events = {}
+
+        def describe_stacks(name):
+            if name not in stacks:
+                raise BotoServerError(None, None)
+            return [stacks[name]]
+
+        def create_stack(name, **kwargs):
+            stacks[name] = mock.MagicMock()
+            stacks[name].stack_status.encode.side_effect = ['CREATE_IN_PROGRESS', 'CREATE_COMPLETE']
+            events[name] = iter(make_growing_events(2))
+
+        conn.describe_stacks.side_effect = describe_stacks
+        conn.create_stack.side_effect = create_stack
+        conn.describe_stack_events.side_effect = lambda name: next(events[name])
+        self.make_forge(conn).create_definition('plain', {'stacks': {
+            'plain': {'resources': {'simple': None}},
+            'plain2': {'resources': {'simple': None}},
+            'plain3': {'requires': ['plain', 'plain2'], 'resources': {'simple': None}}
+        }})
+        names = [c[0][0] for c in conn.create_stack.call_args_list]
+        self.assertEqual(['plain', 'plain2'], sorted(names[:2]))
+        self.assertEqual('plain3', names[2])
+
+    def test_create_definition_stops_on_failure(self):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        conn.create_stack
+        conn.describe_stacks.side_effect = BotoServerError(None, None)
+        forge = self.make_forge(conn)
+        forge.watcher = mock.MagicMock()
+        with mock.patch('cloudforge.engine.StackWatch') as mock_watch:
+            mock_watch.return_value.done = True
+            mock_watch.return_value.status = 'ROLLBACK_COMPLETE'
+            self.assertRaises(StackCreationError, forge.create_definition, 'plain', {'stacks': {
+                'plain': {'resources': {'simple': None}},
+                'plain2': {'requires': ['plain'], 'resources': {'simple': None}}
+            }})
+        self.assertEqual(1, conn.create_stack.call_count)
+
+    def test_concurrency_limit(self):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        stack = conn.describe_stacks.return_value.__getitem__.return_value
+        stack.stack_status = 'CREATE_COMPLETE'
+        forge = self.make_forge(conn, concurrency=1)
+        with mock.patch('cloudforge.forge.EventLoop.spawn', autospec=True,
+                        side_effect=EventLoop.spawn) as mock_spawn:
+            forge.create_definition('plain', {'stacks': {
+                'a': {'resources': {'simple': None}},
+                'b': {'resources': {'simple': None}}
+            }})
+        self.assertEqual(2, mock_spawn.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
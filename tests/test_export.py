@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+from argparse import Namespace
+from jinja2 import DictLoader
+from cloudforge.cli import dump_all
+from cloudforge.export import export_definition
+from cloudforge.forge import make_template_body, CircularDependencyError
+from cloudforge.render import Renderer
+
+resources = {'vared.yaml': ('Type: AWS::IAM::InstanceProfile\n'
+                            'Properties:\n'
+                            '  Path: /\n'
+                            '  Roles:\n'
+                            '  - {{role}}\n')}
+definition = {'variables': {'role': 'DatRole'},
+              'stacks': {
+                  'app': {'requires': ['network'], 'resources': {'vared': None}},
+                  'network': {'resources': {'vared': {'variables': {'role': 'NetRole'}}}},
+                  'db': {'requires': ['network'], 'resources': {'vared': None}}
+              }}
+
+
+class ExportTest(unittest.TestCase):
+    renderer = Renderer(DictLoader(resources))
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_export_writes_bodies_and_manifest(self):
+        manifest = export_definition(self.renderer, definition, self.tmp, workers=2)
+        self.assertEqual(['app', 'db', 'network'], sorted(manifest['stacks']))
+        self.assertNotIn('order', manifest)
+        for name, entry in manifest['stacks'].items():
+            with open(os.path.join(self.tmp, entry['file'])) as fp:
+                body = fp.read()
+            self.assertEqual(make_template_body(self.renderer, definition['stacks'][name], definition['variables']),
+                             body)
+            self.assertEqual(len(body), entry['bytes'])
+            self.assertEqual(hashlib.sha256(body).hexdigest(), entry['sha256'])
+        with open(os.path.join(self.tmp, 'manifest.json')) as fp:
+            self.assertEqual(manifest, json.load(fp))
+
+    def test_export_ordered(self):
+        manifest = export_definition(self.renderer, definition, self.tmp, ordered=True)
+        self.assertEqual(['network', 'app', 'db'], manifest['order'])
+
+    def test_export_ordered_rejects_cycles(self):
+        stacks = {'a': {'requires': ['b'], 'resources': {'vared': None}},
+                  'b': {'requires': ['a'], 'resources': {'vared': None}}}
+        self.assertRaises(CircularDependencyError, export_definition, self.renderer, {'stacks': stacks}, self.tmp,
+                          ordered=True)
+
+    @mock.patch('cloudforge.cli.make_renderer')
+    @mock.patch('cloudforge.cli.load_definition')
+    def test_dump_all(self, mock_load, mock_renderer):
+        mock_load.return_value = definition
+        mock_renderer.return_value = self.renderer
+        output_dir = os.path.join(self.tmp, 'out')
+        args = Namespace(yamlfile='test.yaml', definition_name='plain', output_dir=output_dir, workers=4,
+                         ordered=False, compact=True, render_processes=None, cache_dir=None)
+        self.assertIn('Wrote 3 templates', dump_all(args))
+        self.assertEqual(['app.json', 'db.json', 'manifest.json', 'network.json'], sorted(os.listdir(output_dir)))
+
+
+if __name__ == '__main__':
+    unittest.main()
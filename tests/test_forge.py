@@ -4,7 +4,7 @@ import mock
 import json
 from boto.cloudformation import CloudFormationConnection
 from jinja2 import DictLoader
-from cloudforge.forge import Forge
+from cloudforge.forge import Forge, StackCreationError
 from cloudforge.render import Renderer
 from .util import byteify
 
@@ -33,16 +33,19 @@ def make_renderer(d):
     return Renderer(DictLoader(d))
 
 
-def mock_resource_id(mock_conn, value):
-    mock_conn.describe_stack_resource.return_value = {
-        'DescribeStackResourceResponse': {
-            'DescribeStackResourceResult': {
-                'StackResourceDetail': {
-                    'PhysicalResourceId': value
-                }
-            }
-        }
-    }
+def mock_resource_id(mock_conn, name, value):
+    resource = mock.MagicMock()
+    resource.logical_resource_id = name
+    resource.physical_resource_id = value
+    mock_conn.list_stack_resources.return_value = [resource]
+
+
+def make_threadsafe_conn():
+    conn = mock.MagicMock(spec=CloudFormationConnection)
+    # Child mocks are created lazily, creating one from two threads at once can lose calls
+    for method in ['validate_template', 'describe_stacks', 'create_stack', 'delete_stack']:
+        getattr(conn, method)
+    return conn
 
 
 class ForgeTest(unittest.TestCase):
@@ -95,7 +98,7 @@ class ForgeTest(unittest.TestCase):
     def test_create_stack_with_params(self):
         conn = mock.MagicMock(spec=CloudFormationConnection)
         conn.describe_stacks.side_effect = BotoServerError(None, None)
-        mock_resource_id(conn, 'vpc-12345')
+        mock_resource_id(conn, 'VPC', 'vpc-12345')
         body = {'AWSTemplateFormatVersion': '2010-09-09',
                 'Parameters': {
                     'VPC': {
@@ -127,7 +130,7 @@ class ForgeTest(unittest.TestCase):
         self.assertEqual(body, byteify(json.loads(kwargs['template_body'])))
         self.assertEqual([('VPC', 'vpc-12345')], kwargs['parameters'])
         conn.describe_stacks.assert_called_once_with('params')
-        conn.describe_stack_resource.assert_called_once_with('vpc', 'VPC')
+        conn.list_stack_resources.assert_called_once_with('vpc')
 
     def test_forge_definition(self):
         conn = mock.MagicMock(spec=CloudFormationConnection)
@@ -183,6 +186,100 @@ class ForgeTest(unittest.TestCase):
         self.assertTrue(call1[1]['parameters'] is None)
         self.assertTrue(call2[1]['parameters'] is None)
 
+    def test_forge_definition_concurrently(self):
+        conn = make_threadsafe_conn()
+        conn.describe_stacks.side_effect = BotoServerError(None, None)
+        r = make_renderer(resources)
+        forge = Forge(conn, r)
+        forge.watcher = mock.MagicMock()
+        forge.watcher.watch.return_value = 'CREATE_COMPLETE'
+        forge.create_definition('plain', {'concurrency': 2, 'stacks': {
+            'plain': {'resources': {'simple': None}},
+            'plain2': {'resources': {'simple': None}},
+            'plain3': {'requires': ['plain', 'plain2'], 'resources': {'simple': None}}
+        }})
+        self.assertEqual(3, conn.create_stack.call_count)
+        names = [c[0][0] for c in conn.create_stack.call_args_list]
+        self.assertEqual(['plain', 'plain2'], sorted(names[:2]))
+        self.assertEqual('plain3', names[2])
+
+    def test_forge_definition_concurrently_stops_on_failure(self):
+        conn = make_threadsafe_conn()
+        conn.describe_stacks.side_effect = BotoServerError(None, None)
+        r = make_renderer(resources)
+        forge = Forge(conn, r, concurrency=2)
+        forge.watcher = mock.MagicMock()
+        forge.watcher.watch.return_value = 'ROLLBACK_COMPLETE'
+        self.assertRaises(StackCreationError, forge.create_definition, 'plain', {'stacks': {
+            'plain': {'resources': {'simple': None}},
+            'plain2': {'requires': ['plain'], 'resources': {'simple': None}}
+        }})
+        conn.create_stack.assert_called_once_with('plain', template_body=mock.ANY, parameters=None,
+                                                  capabilities=['CAPABILITY_IAM'])
+
+    def test_create_stack_indexes_complete_stacks(self):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        vpc = mock.MagicMock()
+        vpc.stack_status = 'CREATE_COMPLETE'
+        vpc.outputs = [mock.MagicMock(key='VPC', value='vpc-12345')]
+        vpc.parameters = []
+        conn.describe_stacks.side_effect = lambda name: {'vpc': [vpc]}[name]
+        forge = Forge(conn, make_renderer(resources))
+        forge.watcher = mock.MagicMock()
+        forge.watcher.watch.return_value = 'CREATE_COMPLETE'
+        forge.create_stack('vpc', {'resources': {'simple': None}})
+        conn.describe_stacks.side_effect = BotoServerError(None, None)
+        forge.create_stack('params', {
+            'parameters': {'VPC': {'source': {'stack': 'vpc', 'type': 'output'}, 'type': 'String'}},
+            'resources': {'typed': None}})
+        self.assertEqual([('VPC', 'vpc-12345')], conn.create_stack.call_args[1]['parameters'])
+        self.assertEqual([mock.call('vpc'), mock.call('params')], conn.describe_stacks.call_args_list)
+
+    def test_delete_definition_concurrently(self):
+        conn = make_threadsafe_conn()
+        stack = conn.describe_stacks.return_value.__getitem__.return_value
+        stack.stack_status = 'CREATE_COMPLETE'
+        forge = Forge(conn, make_renderer(resources), concurrency=3)
+        forge.watcher = mock.MagicMock()
+        forge.watcher.watch.return_value = 'DELETE_COMPLETE'
+        forge.delete_definition('plain', {'stacks': {
+            'base': {'resources': {'simple': None}},
+            'app1': {'requires': ['base'], 'resources': {'simple': None}},
+            'app2': {'requires': ['base'], 'resources': {'simple': None}}
+        }})
+        names = [c[0][0] for c in conn.delete_stack.call_args_list]
+        self.assertEqual(['app1', 'app2'], sorted(names[:2]))
+        self.assertEqual('base', names[2])
+
+    def test_create_selected_stacks(self):
+        for concurrency in [None, 2]:
+            conn = make_threadsafe_conn()
+            conn.describe_stacks.side_effect = BotoServerError(None, None)
+            forge = Forge(conn, make_renderer(resources), concurrency=concurrency)
+            forge.watcher = mock.MagicMock()
+            forge.watcher.watch.return_value = 'CREATE_COMPLETE'
+            forge.create_definition('plain', {'stacks': {
+                'base': {'resources': {'simple': None}},
+                'app1': {'requires': ['base'], 'resources': {'simple': None}},
+                'app2': {'requires': ['app1'], 'resources': {'simple': None}}
+            }}, {'app1', 'app2'})
+            self.assertEqual(['app1', 'app2'], [c[0][0] for c in conn.create_stack.call_args_list])
+            self.assertNotIn(mock.call('base'), conn.describe_stacks.call_args_list)
+
+    def test_delete_selected_stacks(self):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        stack = conn.describe_stacks.return_value.__getitem__.return_value
+        stack.stack_status = 'CREATE_COMPLETE'
+        forge = Forge(conn, make_renderer(resources))
+        forge.watcher = mock.MagicMock()
+        forge.watcher.watch.return_value = 'DELETE_COMPLETE'
+        forge.delete_definition('plain', {'stacks': {
+            'base': {'resources': {'simple': None}},
+            'app1': {'requires': ['base'], 'resources': {'simple': None}},
+            'app2': {'requires': ['app1'], 'resources': {'simple': None}}
+        }}, {'base', 'app1'})
+        self.assertEqual(['app1', 'base'], [c[0][0] for c in conn.delete_stack.call_args_list])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+from cloudforge import render
+from cloudforge.render import make_renderer
+
+template = ('Type: AWS::IAM::InstanceProfile\n'
+            'Properties:\n'
+            '  Path: /\n'
+            '  Roles:\n'
+            '  - {{role}}\n')
+
+
+class MakeRendererTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.templates = os.path.join(self.tmp, 'templates')
+        self.cache = os.path.join(self.tmp, 'cache')
+        os.mkdir(self.templates)
+        for name in ['first.yaml', 'second.yaml']:
+            with open(os.path.join(self.templates, name), 'w') as fp:
+                fp.write(template)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    @mock.patch.dict(render._renderers, clear=True)
+    def test_renderer_is_shared_per_template_path(self):
+        definition = {'template_path': self.templates}
+        self.assertTrue(make_renderer(definition) is make_renderer(dict(definition)))
+        self.assertFalse(make_renderer(definition) is make_renderer({'template_path': self.tmp}))
+
+    @mock.patch.dict(render._renderers, clear=True)
+    def test_bytecode_cache_has_an_entry_per_template(self):
+        definition = {'template_path': self.templates, 'template_cache': self.cache}
+        renderer = make_renderer(definition)
+        renderer.render_template({'variables': {'role': 'DatRole'}, 'resources': {'first': None, 'second': None}})
+        self.assertEqual(2, len(os.listdir(self.cache)))
+
+    @mock.patch.dict(render._renderers, clear=True)
+    def test_bytecode_cache_is_reused(self):
+        definition = {'template_path': self.templates, 'template_cache': self.cache}
+        make_renderer(definition).render_resource(('first', None), {'role': 'DatRole'})
+        render._renderers.clear()
+        with mock.patch('jinja2.environment.Environment._compile') as mock_compile:
+            rv = make_renderer(definition).render_resource(('first', None), {'role': 'DatRole'})
+        self.assertFalse(mock_compile.called)
+        self.assertEqual(['DatRole'], rv['first']['Properties']['Roles'])
+
+    @mock.patch.dict(render._renderers, clear=True)
+    def test_identical_templates_keep_their_names(self):
+        definition = {'template_path': self.templates, 'template_cache': self.cache}
+        make_renderer(definition).env.get_template('first.yaml')
+        render._renderers.clear()
+        second = make_renderer(definition).env.get_template('second.yaml')
+        self.assertEqual('second.yaml', second.name)
+        self.assertEqual(os.path.join(self.templates, 'second.yaml'), second.filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+from boto.cloudformation import CloudFormationConnection
+from boto.exception import BotoServerError
+from jinja2 import DictLoader
+from cloudforge.forge import Forge, make_template_body
+from cloudforge.manifest import Manifest, template_digest
+from cloudforge.render import Renderer
+
+resources = {'simple.yaml': ('Type: AWS::IAM::InstanceProfile\n'
+                             'Properties:\n'
+                             '  Path: /\n'
+                             '  Roles:\n'
+                             '  - TheRole\n')}
+stack_def = {'resources': {'simple': None}}
+
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'manifest.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def make_forge(self, conn):
+        forge = Forge(conn, Renderer(DictLoader(resources)), manifest=Manifest(self.path))
+        forge.watcher = mock.MagicMock()
+        forge.watcher.watch.return_value = 'CREATE_COMPLETE'
+        return forge
+
+    def test_digest_depends_on_body_and_parameters(self):
+        digest = template_digest('{}', [('a', '1')])
+        self.assertEqual(digest, template_digest('{}', [('a', '1')]))
+        self.assertNotEqual(digest, template_digest('{}', [('a', '2')]))
+        self.assertNotEqual(digest, template_digest('{ }', [('a', '1')]))
+
+    def test_created_stack_is_recorded(self):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        conn.describe_stacks.side_effect = BotoServerError(None, None)
+        self.make_forge(conn).create_stack('simple', stack_def)
+        body = make_template_body(Renderer(DictLoader(resources)), stack_def)
+        with open(self.path) as fp:
+            self.assertEqual({'simple': template_digest(body)}, json.load(fp))
+
+    def test_unchanged_stack_is_skipped(self):
+        body = make_template_body(Renderer(DictLoader(resources)), stack_def)
+        Manifest(self.path).set('simple', template_digest(body))
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        self.make_forge(conn).create_stack('simple', stack_def)
+        self.assertFalse(conn.validate_template.called)
+        self.assertFalse(conn.describe_stacks.called)
+        self.assertFalse(conn.create_stack.called)
+
+    def test_changed_stack_is_not_skipped(self):
+        Manifest(self.path).set('simple', 'stale')
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        conn.describe_stacks.side_effect = BotoServerError(None, None)
+        self.make_forge(conn).create_stack('simple', stack_def)
+        self.assertTrue(conn.validate_template.called)
+        self.assertTrue(conn.create_stack.called)
+
+    def test_existing_complete_stack_is_recorded(self):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        stack = conn.describe_stacks.return_value.__getitem__.return_value
+        stack.stack_status = 'CREATE_COMPLETE'
+        for _ in range(2):
+            self.make_forge(conn).create_definition('plain', {'stacks': {'simple': stack_def}})
+        self.assertEqual(1, conn.validate_template.call_count)
+        self.assertFalse(conn.create_stack.called)
+        body = make_template_body(Renderer(DictLoader(resources)), stack_def)
+        self.assertEqual(template_digest(body), Manifest(self.path).get('simple'))
+
+    def test_unchanged_stack_is_recorded_on_update(self):
+        body = make_template_body(Renderer(DictLoader(resources)), stack_def)
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        stack = conn.describe_stacks.return_value.__getitem__.return_value
+        stack.stack_status = 'CREATE_COMPLETE'
+        stack.parameters = []
+        conn.get_template.return_value = {'GetTemplateResponse': {'GetTemplateResult': {'TemplateBody': body}}}
+        for _ in range(2):
+            self.make_forge(conn).update_definition('plain', {'stacks': {'simple': stack_def}})
+        self.assertEqual(1, conn.get_template.call_count)
+        self.assertFalse(conn.update_stack.called)
+        self.assertEqual(template_digest(body), Manifest(self.path).get('simple'))
+
+    def test_deleted_stack_is_forgotten(self):
+        Manifest(self.path).set('simple', 'digest')
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        conn.describe_stacks.side_effect = BotoServerError(None, None)
+        self.make_forge(conn).delete_stack('simple')
+        self.assertEqual(None, Manifest(self.path).get('simple'))
+
+    def test_scopes_share_one_file(self):
+        manifest = Manifest(self.path)
+        manifest.scope('us-east-1').set('simple', 'east')
+        manifest.scope('us-west-2').set('simple', 'west')
+        self.assertEqual('east', Manifest(self.path).scope('us-east-1').get('simple'))
+        self.assertEqual(None, Manifest(self.path).get('simple'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+from boto.cloudformation import CloudFormationConnection
+from boto.exception import BotoServerError
+from jinja2 import DictLoader
+from cloudforge.forge import Forge, AsyncForge
+from cloudforge.metrics import DeployMetrics, percentile
+from cloudforge.render import Renderer
+from benchmarks.fakecf import FakeCloudFormation
+from benchmarks.synthetic import make_definition
+
+definition, templates = make_definition(stacks=3, density=1, resources=4, properties=1)
+
+
+class DeployMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def deploy(self, forge_class, **kwargs):
+        metrics = DeployMetrics('bench')
+        connection = FakeCloudFormation(events_per_poll=2)
+        forge = forge_class(connection, Renderer(DictLoader(templates)), log_level='warning',
+                            polling={'strategy': 'fixed', 'interval': 0}, metrics=metrics, **kwargs)
+        forge.create_definition('bench', definition)
+        return metrics, connection
+
+    def check_rows(self, metrics, connection):
+        rows = {row['stack']: row for row in metrics.rows()}
+        self.assertEqual(sorted(definition['stacks']), sorted(rows))
+        for name, row in rows.items():
+            self.assertEqual('CREATE_COMPLETE', row['status'])
+            # 4 resources finishing 2 per poll
+            self.assertEqual(2, row['polls'])
+            self.assertTrue(row['template_bytes'] > 0)
+            for key in ['queue_wait_seconds', 'render_seconds', 'validate_seconds', 'in_progress_seconds',
+                        'deploy_seconds']:
+                self.assertIn(key, row)
+        self.assertEqual(sum(connection.calls.values()) - connection.calls['stack.update'],
+                         sum(row['api_calls'] for row in rows.values()))
+
+    def test_threaded_forge(self):
+        self.check_rows(*self.deploy(Forge, concurrency=2))
+
+    def test_async_forge(self):
+        self.check_rows(*self.deploy(AsyncForge))
+
+    def test_exports(self):
+        metrics, _ = self.deploy(Forge)
+        path = os.path.join(self.tmp, 'metrics.jsonl')
+        metrics.write_jsonl(path)
+        metrics.write_jsonl(path)
+        with open(path) as fp:
+            lines = [json.loads(line) for line in fp]
+        self.assertEqual(6, len(lines))
+        self.assertEqual('bench', lines[0]['definition'])
+        prom_path = os.path.join(self.tmp, 'cloudforge.prom')
+        metrics.write_prometheus(prom_path)
+        with open(prom_path) as fp:
+            text = fp.read()
+        self.assertIn('# TYPE cloudforge_stack_polls gauge', text)
+        self.assertIn('cloudforge_stack_template_bytes{definition="bench",stack="stack0",status="CREATE_COMPLETE"}',
+                      text)
+        self.assertIn('cloudforge_deploy_seconds{definition="bench",quantile="0.95"}', text)
+        self.assertIn('cloudforge_deploy_seconds_count{definition="bench"} 3', text)
+
+    @mock.patch('cloudforge.metrics.time')
+    def test_queue_wait_counts_parameter_sources(self, mock_time):
+        clock = [100.0]
+        mock_time.time.side_effect = lambda: clock[0]
+
+        def watch(name, statuses):
+            if name == 'vpc':
+                clock[0] += 30
+            return 'CREATE_COMPLETE'
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        conn.describe_stacks.side_effect = BotoServerError(None, None)
+        metrics = DeployMetrics('bench')
+        forge = Forge(conn, Renderer(DictLoader(templates)), metrics=metrics)
+        forge.watcher = mock.MagicMock()
+        forge.watcher.watch.side_effect = watch
+        stack = definition['stacks']['stack0']
+        with mock.patch('cloudforge.forge.build_parameters', return_value=[('VPC', 'vpc-1')]):
+            forge.create_definition('bench', {'stacks': {
+                'vpc': stack,
+                'app': dict(stack, parameters={'VPC': {'source': {'stack': 'vpc', 'type': 'output'}}})
+            }})
+        rows = {row['stack']: row for row in metrics.rows()}
+        self.assertEqual(30, rows['vpc']['deploy_seconds'])
+        self.assertEqual(0, rows['app']['queue_wait_seconds'])
+
+    def test_percentile(self):
+        self.assertEqual(5, percentile(range(1, 11), 0.5))
+        self.assertEqual(10, percentile(range(1, 11), 0.95))
+        self.assertEqual(7, percentile([7], 0.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
-from cloudforge.forge import order_stacks, MissingDependencyError, CircularDependencyError
+from cloudforge.forge import order_stacks, order_stack_levels, select_stacks, definition_dependencies, \
+    MissingDependencyError, CircularDependencyError
 
 
 class OrderStacksTest(unittest.TestCase):
@@ -63,6 +64,61 @@ class OrderStacksTest(unittest.TestCase):
         self.assertEqual([('a', stacks['a']), ('b', stacks['b'])],
                          order_stacks(stacks))
 
+    def test_order_is_deterministic(self):
+        def_ = {'resources': {'fake': None}}
+        stacks = {name: def_ for name in 'edcba'}
+        self.assertEqual(['a', 'b', 'c', 'd', 'e'], [name for name, _ in order_stacks(stacks)])
+
+    def test_order_levels(self):
+        stacks = {
+            'a': {'resources': {'fake': None}},
+            'b': {'requires': ['a'], 'resources': {'fake': None}},
+            'c': {'requires': ['a', 'b'], 'resources': {'fake': None}},
+            'd': {'resources': {'fake': None}}
+        }
+        self.assertEqual([['a', 'd'], ['b'], ['c']],
+                         [[name for name, _ in level] for level in order_stack_levels(stacks)])
+
+    def test_circular_deps_error_lists_cycle(self):
+        stacks = {
+            'a': {'resources': {'fake': None}},
+            'b': {'requires': ['a', 'd'], 'resources': {'fake': None}},
+            'c': {'requires': ['b'], 'resources': {'fake': None}},
+            'd': {'requires': ['c'], 'resources': {'fake': None}},
+            'e': {'requires': ['d'], 'resources': {'fake': None}}
+        }
+        with self.assertRaises(CircularDependencyError) as cm:
+            order_stacks(stacks)
+        self.assertEqual(['b', 'd', 'c', 'b'], cm.exception.cycle)
+        self.assertEqual(['b', 'c', 'd', 'e'], cm.exception.remaining_dependencies)
+        self.assertEqual('Stacks b -> d -> c -> b have a circular dependency', str(cm.exception))
+
+
+graph = {
+    'vpc': {'resources': {'fake': None}},
+    'db': {'requires': ['vpc'], 'resources': {'fake': None}},
+    'app': {'parameters': {'DB': {'source': {'stack': 'db', 'type': 'output'}}}, 'resources': {'fake': None}},
+    'dns': {'requires': ['app'], 'resources': {'fake': None}},
+    'other': {'requires': ['vpc'], 'resources': {'fake': None}}
+}
+
+
+class SelectStacksTest(unittest.TestCase):
+    def test_select_only(self):
+        self.assertEqual({'app'}, select_stacks(graph, ['app']))
+
+    def test_select_with_deps(self):
+        self.assertEqual({'vpc', 'db', 'app'}, select_stacks(graph, ['app'], with_deps=True))
+
+    def test_select_with_dependents(self):
+        self.assertEqual({'db', 'app', 'dns'}, select_stacks(graph, ['db'], with_dependents=True))
+        self.assertEqual({'vpc', 'db', 'app', 'dns'},
+                         select_stacks(graph, ['db'], with_deps=True, with_dependents=True))
+
+    def test_dependencies_outside_the_selection_are_dropped(self):
+        self.assertEqual({'app': set(), 'dns': {'app'}},
+                         definition_dependencies({'stacks': graph}, {'app', 'dns'}))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,10 @@
 import unittest
 import mock
-from cloudforge.forge import build_parameters
+from cloudforge.forge import build_parameters, StackValueIndex, CloudformationValueNotFound
 from collections import namedtuple
 
 KeyValue = namedtuple('KeyValue', ['key', 'value'])
+StackResource = namedtuple('StackResource', ['logical_resource_id', 'physical_resource_id'])
 
 
 class MyTestCase(unittest.TestCase):
@@ -17,15 +18,8 @@ class MyTestCase(unittest.TestCase):
             }
         }
         conn = mock.MagicMock()
-        rv = mock.MagicMock(spec=dict)
-        conn.describe_stack_resource.return_value = rv
-        resp = mock.MagicMock(spec=dict)
-        rv.__getitem__.return_value = resp
-        res_result = mock.MagicMock(spec=dict)
-        resp.__getitem__.return_value = res_result
-        res_detail = mock.MagicMock(spec=dict)
-        res_result.__getitem__.return_value = res_detail
-        res_detail.__getitem__.return_value = 'vpc-12345'
+        conn.list_stack_resources.return_value = [StackResource('other', 'sg-12345'),
+                                                  StackResource('thing', 'vpc-12345')]
         self.assertEqual([('thing', 'vpc-12345')], build_parameters(conn, params))
 
     def test_remote_parameter_parameters(self):
@@ -54,6 +48,38 @@ class MyTestCase(unittest.TestCase):
         conn.describe_stacks.return_value.__getitem__.return_value.outputs = [KeyValue('abc', 'nope'), KeyValue('thing', '10.0.0.0/16')]
         self.assertEqual([('thing', '10.0.0.0/16')], build_parameters(conn, params))
 
+    def test_parameters_from_one_stack_share_a_describe(self):
+        params = {
+            'cidr': {'source': {'stack': 'vpc', 'type': 'output'}},
+            'subnet': {'source': {'stack': 'vpc', 'type': 'output'}},
+            'env': {'source': {'stack': 'vpc', 'type': 'parameter'}}
+        }
+        conn = mock.MagicMock()
+        stack = conn.describe_stacks.return_value.__getitem__.return_value
+        stack.outputs = [KeyValue('cidr', '10.0.0.0/16'), KeyValue('subnet', 'subnet-1')]
+        stack.parameters = [KeyValue('env', 'prod')]
+        index = StackValueIndex(conn)
+        self.assertEqual(sorted([('cidr', '10.0.0.0/16'), ('subnet', 'subnet-1'), ('env', 'prod')]),
+                         sorted(build_parameters(conn, params, index)))
+        self.assertEqual([('cidr', '10.0.0.0/16')], build_parameters(conn, {'cidr': params['cidr']}, index))
+        conn.describe_stacks.assert_called_once_with('vpc')
+
+    def test_resources_are_listed_across_pages(self):
+        conn = mock.MagicMock()
+        page1 = mock.MagicMock()
+        page1.__iter__.return_value = [StackResource('a', 'id-a')]
+        page1.next_token = 'token'
+        conn.list_stack_resources.side_effect = [page1, [StackResource('b', 'id-b')]]
+        index = StackValueIndex(conn)
+        self.assertEqual('id-b', index.get('test', 'b', 'resource'))
+        self.assertEqual('id-a', index.get('test', 'a', 'resource'))
+        self.assertEqual(mock.call('test', next_token='token'), conn.list_stack_resources.call_args)
+
+    def test_missing_value_fails(self):
+        conn = mock.MagicMock()
+        conn.describe_stacks.return_value.__getitem__.return_value.outputs = []
+        index = StackValueIndex(conn)
+        self.assertRaises(CloudformationValueNotFound, index.get, 'test', 'thing', 'output')
 
 
 if __name__ == '__main__':
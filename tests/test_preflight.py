@@ -0,0 +1,95 @@
+import unittest
+import mock
+from boto.cloudformation import CloudFormationConnection
+from jinja2 import DictLoader
+from cloudforge.forge import Forge, AsyncForge, StackStatusTable, StacksBlockedError
+from cloudforge.render import Renderer
+from benchmarks.fakecf import FakeCloudFormation, FakeStack, Page
+
+resources = {'simple.yaml': ('Type: AWS::IAM::InstanceProfile\n'
+                             'Properties:\n'
+                             '  Path: /\n'
+                             '  Roles:\n'
+                             '  - TheRole\n')}
+definition = {'stacks': {
+    'base': {'resources': {'simple': None}},
+    'app': {'requires': ['base'], 'resources': {'simple': None}},
+    'web': {'requires': ['app'], 'resources': {'simple': None}}
+}}
+
+
+def add_stack(connection, name, status):
+    stack = connection.stacks[name] = FakeStack(connection, name, [], None)
+    stack.stack_status = status
+    return stack
+
+
+class PreflightTest(unittest.TestCase):
+    def make_forge(self, connection, forge_class=Forge):
+        return forge_class(connection, Renderer(DictLoader(resources)), log_level='warning', preflight=True,
+                           polling={'strategy': 'fixed', 'interval': 0})
+
+    def test_table_follows_pages(self):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        stacks = [mock.MagicMock(stack_name=name, stack_status='CREATE_COMPLETE') for name in ['a', 'other', 'b']]
+        conn.describe_stacks.side_effect = [Page(stacks[:2], 'token'), Page(stacks[2:])]
+        table = StackStatusTable(conn, ['a', 'b', 'c'])
+        self.assertEqual(['a', 'b'], sorted(table.stacks))
+        self.assertEqual([mock.call(), mock.call(next_token='token')], conn.describe_stacks.call_args_list)
+        self.assertEqual(None, table.status('c'))
+        self.assertEqual('CREATE_COMPLETE', table.status('a'))
+
+    def test_blocked_statuses(self):
+        conn = FakeCloudFormation()
+        add_stack(conn, 'base', 'CREATE_COMPLETE')
+        add_stack(conn, 'app', 'UPDATE_IN_PROGRESS')
+        add_stack(conn, 'web', 'ROLLBACK_COMPLETE')
+        table = StackStatusTable(conn, ['base', 'app', 'web', 'new'])
+        self.assertEqual({'app': 'UPDATE_IN_PROGRESS', 'web': 'ROLLBACK_COMPLETE'},
+                         table.blocked('create', ['base', 'app', 'web', 'new']))
+        self.assertEqual({'app': 'UPDATE_IN_PROGRESS', 'web': 'ROLLBACK_COMPLETE'},
+                         table.blocked('update', ['base', 'app', 'web', 'new']))
+        self.assertEqual({'app': 'UPDATE_IN_PROGRESS'}, table.blocked('delete', ['base', 'app', 'web', 'new']))
+
+    def check_complete_stacks_are_skipped(self, forge_class):
+        conn = FakeCloudFormation()
+        add_stack(conn, 'base', 'CREATE_COMPLETE')
+        self.make_forge(conn, forge_class).create_definition('plain', definition)
+        self.assertEqual(['app', 'base', 'web'], sorted(conn.stacks))
+        self.assertEqual(2, conn.calls['validate_template'])
+        self.assertEqual(2, conn.calls['create_stack'])
+        # One preflight page, then only the describes of watching the two new stacks
+        self.assertEqual(3, conn.calls['describe_stacks'])
+
+    def test_complete_stacks_are_skipped(self):
+        self.check_complete_stacks_are_skipped(Forge)
+
+    def test_complete_stacks_are_skipped_async(self):
+        self.check_complete_stacks_are_skipped(AsyncForge)
+
+    def test_blocked_stacks_fail_before_any_change(self):
+        conn = FakeCloudFormation()
+        add_stack(conn, 'web', 'UPDATE_ROLLBACK_IN_PROGRESS')
+        forge = self.make_forge(conn)
+        with self.assertRaises(StacksBlockedError) as cm:
+            forge.create_definition('plain', definition)
+        self.assertEqual('Could not create stacks, web is in status UPDATE_ROLLBACK_IN_PROGRESS', str(cm.exception))
+        self.assertEqual(0, conn.calls['create_stack'])
+        self.assertIsNone(forge.statuses)
+
+    def test_blocked_stacks_outside_the_selection_are_ignored(self):
+        conn = FakeCloudFormation()
+        add_stack(conn, 'web', 'UPDATE_ROLLBACK_IN_PROGRESS')
+        self.make_forge(conn).create_definition('plain', definition, {'base'})
+        self.assertEqual(1, conn.calls['create_stack'])
+
+    def test_missing_stacks_are_not_deleted(self):
+        conn = FakeCloudFormation()
+        add_stack(conn, 'app', 'CREATE_COMPLETE')
+        self.make_forge(conn).delete_definition('plain', definition)
+        self.assertEqual(1, conn.calls['delete_stack'])
+        self.assertEqual({}, conn.stacks)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import unittest
+import mock
+from argparse import Namespace
+from boto.cloudformation import CloudFormationConnection
+from boto.exception import BotoServerError
+from jinja2 import DictLoader
+from cloudforge.cli import profile
+from cloudforge.forge import Forge
+from cloudforge.profiling import PhaseTimings
+from cloudforge.render import Renderer
+
+resources = {'simple.yaml': ('Type: AWS::IAM::InstanceProfile\n'
+                             'Properties:\n'
+                             '  Path: /\n'
+                             '  Roles:\n'
+                             '  - TheRole\n')}
+
+
+class PhaseTimingsTest(unittest.TestCase):
+    def test_table_and_totals(self):
+        timings = PhaseTimings()
+        timings.add('b', 'watch', 2.0)
+        timings.add('a', 'render', 0.5)
+        timings.add('a', 'render', 0.25)
+        timings.add(None, 'load_definition', 0.1)
+        rv = timings.as_dict()
+        self.assertEqual(['load_definition', 'render', 'watch'], rv['phases'])
+        self.assertEqual({'render': 0.75, 'watch': 2.0, 'load_definition': 0.1}, rv['totals'])
+        lines = timings.format_table().splitlines()
+        self.assertEqual(['STACK', '(definition)', 'a', 'b', 'TOTAL'], [line.split()[0] for line in lines])
+        self.assertTrue(lines[2].endswith('0.750'))
+
+    def test_forge_records_phases(self):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        conn.describe_stacks.side_effect = BotoServerError(None, None)
+        timings = PhaseTimings()
+        forge = Forge(conn, Renderer(DictLoader(resources)), timings=timings)
+        forge.watcher = mock.MagicMock()
+        forge.watcher.watch.return_value = 'CREATE_COMPLETE'
+        forge.create_stack('simple', {'resources': {'simple': None}})
+        self.assertEqual(['render', 'serialize', 'validate', 'describe', 'create', 'watch'], timings.phases())
+        self.assertEqual(['simple'], list(timings.stacks))
+
+
+class ProfileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_profile_writes_dump_and_phases(self):
+        def worker():
+            sorted(range(1000))
+
+        def run(args):
+            thread = threading.Thread(target=args.timings.timed('simple', 'render', worker))
+            thread.start()
+            thread.join()
+            return 'done'
+
+        path = os.path.join(self.tmp, 'run.prof')
+        with mock.patch('sys.stderr'):
+            self.assertEqual('done', profile(Namespace(func=run, profile=path)))
+        functions = [func[2] for func in pstats.Stats(path).stats]
+        self.assertIn('worker', functions)
+        with open(path + '.phases.json') as fp:
+            self.assertEqual(['render'], json.load(fp)['phases'])
+
+
+if __name__ == '__main__':
+    unittest.main()
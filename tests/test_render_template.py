@@ -3,7 +3,8 @@ import unittest
 import mock
 from jinja2 import DictLoader
 from StringIO import StringIO
-from cloudforge.render import Renderer, NoResourcesError, MalformedTemplateError
+from cloudforge.render import Renderer, NoResourcesError, MalformedTemplateError, stringify
+from cloudforge.serialize import serialize_template
 from .util import byteify
 
 resources = {'plain.yaml': ('Type: AWS::IAM::InstanceProfile\n'
@@ -24,7 +25,15 @@ resources = {'plain.yaml': ('Type: AWS::IAM::InstanceProfile\n'
                             '    - IpProtocol: "-1"\n'
                             '      FromPort: "0"\n'
                             '      ToPort: "65535"\n'
-                            '      CidrIp: 0.0.0.0/0')}
+                            '      CidrIp: 0.0.0.0/0'),
+             'numbered.yaml': ('Type: AWS::AutoScaling::AutoScalingGroup\n'
+                               'Properties:\n'
+                               '  MinSize: 1\n'
+                               '  MaxSize: {{max}}\n'
+                               '  Tags:\n'
+                               '  - Key: Spot\n'
+                               '    Value: true\n'
+                               '    PropagateAtLaunch: false\n')}
 
 
 class RenderTemplateTest(unittest.TestCase):
@@ -142,6 +151,72 @@ class RenderTemplateTest(unittest.TestCase):
                                             'Roles': ['TheRole']
                                         }}}}, byteify(self.renderer.render_template(stack_def)))
 
+    def test_render_template_stringifies_numbers(self):
+        mappings = {'Sizes': {'small': {'Max': 2}}}
+        stack_def = {'mappings': mappings,
+                     'resources': {'numbered': {'variables': {'max': 4}}}}
+        rv = self.renderer.render_template(stack_def)
+        self.assertEqual({'MinSize': '1', 'MaxSize': '4',
+                          'Tags': [{'Key': 'Spot', 'Value': 'True', 'PropagateAtLaunch': 'False'}]},
+                         rv['Resources']['numbered']['Properties'])
+        self.assertEqual({'Sizes': {'small': {'Max': '2'}}}, rv['Mappings'])
+        self.assertEqual(2, mappings['Sizes']['small']['Max'])
+
+
+class StringifyTest(unittest.TestCase):
+    def test_stringify_copies(self):
+        thing = {'a': [1, {'b': True}], 'c': 'd'}
+        self.assertEqual({'a': ['1', {'b': 'True'}], 'c': 'd'}, stringify(thing))
+        self.assertEqual({'a': [1, {'b': True}], 'c': 'd'}, thing)
+
+    def test_stringify_in_place(self):
+        thing = {'a': [1, {'b': False}]}
+        self.assertIs(thing, stringify(thing, in_place=True))
+        self.assertEqual({'a': ['1', {'b': 'False'}]}, thing)
+
+    def test_stringify_deep_nesting(self):
+        thing = leaf = []
+        for _ in range(5000):
+            leaf.append([])
+            leaf = leaf[0]
+        leaf.append(1)
+        rv = stringify(thing)
+        for _ in range(5000):
+            rv = rv[0]
+        self.assertEqual(['1'], rv)
+
+
+class ParallelRenderTest(unittest.TestCase):
+    def setUp(self):
+        templates = dict(resources)
+        templates['anchored.yaml'] = ('Type: AWS::EC2::Instance\n'
+                                      'Properties:\n'
+                                      '  Tags: &tags\n'
+                                      '  - Key: Role\n'
+                                      '    Value: {{role}}\n'
+                                      '  Copy: *tags\n'
+                                      '  Size: {{size}}\n')
+        self.serial = Renderer(DictLoader(templates))
+        self.parallel = Renderer(DictLoader(templates), processes=2)
+
+    def tearDown(self):
+        self.parallel.close()
+
+    def test_parallel_matches_serial(self):
+        stack_def = {'variables': {'role': 'Default', 'size': 1},
+                     'mappings': {'Sizes': {'small': {'Max': 2}}},
+                     'resources': dict(('Res{}'.format(i), {'template': 'anchored.yaml',
+                                                           'variables': {'size': i} if i % 3 else {}})
+                                       for i in range(50))}
+        stack_def['resources']['plain'] = None
+        stack_def['resources']['vared'] = {'name': 'Res7', 'variables': {'role': 'Leaked'}}
+        self.assertEqual(serialize_template(self.serial.render_template(stack_def)),
+                         serialize_template(self.parallel.render_template(stack_def)))
+
+    def test_parallel_without_shared_variables(self):
+        stack_def = {'resources': {'vared': {'variables': {'role': 'MuhRole'}}, 'plain': None}}
+        self.assertEqual(self.serial.render_template(stack_def), self.parallel.render_template(stack_def))
+
 
 if __name__ == '__main__':
     unittest.main()
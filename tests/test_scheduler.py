@@ -0,0 +1,42 @@
+import threading
+import unittest
+from cloudforge.scheduler import DependencyScheduler, reverse_dependencies
+
+
+class SchedulerTest(unittest.TestCase):
+    def test_runs_dependencies_first(self):
+        deps = {'a': set(), 'b': {'a'}, 'c': {'b'}}
+        rv = DependencyScheduler(deps, 4).run(lambda name: None)
+        self.assertEqual(['a', 'b', 'c'], rv)
+
+    def test_runs_independent_nodes_concurrently(self):
+        barrier = threading.Event()
+        started = []
+
+        def work(name):
+            started.append(name)
+            if len(started) == 2:
+                barrier.set()
+            self.assertTrue(barrier.wait(5))
+
+        DependencyScheduler({'a': set(), 'b': set()}, 2).run(work)
+        self.assertEqual(['a', 'b'], sorted(started))
+
+    def test_failure_stops_dependents(self):
+        ran = []
+
+        def work(name):
+            ran.append(name)
+            if name == 'a':
+                raise ValueError(name)
+
+        scheduler = DependencyScheduler({'a': set(), 'b': {'a'}}, 2)
+        self.assertRaises(ValueError, scheduler.run, work)
+        self.assertEqual(['a'], ran)
+
+    def test_reverse_dependencies(self):
+        self.assertEqual({'a': {'b'}, 'b': set()}, reverse_dependencies({'a': set(), 'b': {'a'}}))
+
+
+if __name__ == '__main__':
+    unittest.main()
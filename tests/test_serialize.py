@@ -0,0 +1,37 @@
+import json
+import unittest
+from StringIO import StringIO
+from cloudforge.serialize import write_template, serialize_template
+
+template = {'AWSTemplateFormatVersion': '2010-09-09',
+            'Resources': {
+                'script': {'Type': 'AWS::EC2::Instance',
+                           'Properties': {'UserData': 'echo "a\\\\nb" \\\\ c', 'Count': '2'}},
+                'queue': {'Type': 'AWS::SQS::Queue'}},
+            'Parameters': {},
+            'Outputs': {'Url': {'Value': {'Ref': 'queue'}}, 'Script': {'Value': 'a\\\\b'}}}
+
+
+class SerializeTest(unittest.TestCase):
+    def test_matches_unescaped_dumps(self):
+        self.assertEqual(json.dumps(template).replace(r'\\', '\\'), serialize_template(template))
+
+    def test_compact(self):
+        rv = serialize_template(template, compact=True)
+        self.assertFalse(' "' in rv or ', ' in rv or ': ' in rv)
+        self.assertEqual(json.dumps(template, separators=(',', ':')).replace(r'\\', '\\'), rv)
+
+    def test_write_reports_size(self):
+        fp = StringIO()
+        size = write_template(template, fp)
+        self.assertEqual(len(fp.getvalue()), size)
+        self.assertEqual(serialize_template(template), fp.getvalue())
+
+    def test_write_compact(self):
+        fp = StringIO()
+        write_template(template, fp, compact=True)
+        self.assertEqual(serialize_template(template, compact=True), fp.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
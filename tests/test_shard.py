@@ -0,0 +1,196 @@
+import json
+import shutil
+import tempfile
+import unittest
+import mock
+from boto.cloudformation import CloudFormationConnection
+from boto.exception import BotoServerError
+from jinja2 import DictLoader
+from cloudforge.artifacts import LocalArtifactStore
+from cloudforge.forge import Forge, ShardingRequiresArtifactsError, UnshardedStackError, ShardMoveError
+from cloudforge.render import Renderer
+from cloudforge.shard import iter_references, partition, shard_template, parent_template, shard_assignment, \
+    ResourceCycleError, ShardCycleError
+from .test_update import deployed_stack, template_response
+
+
+def queue(**properties):
+    return {'Type': 'AWS::SQS::Queue', 'Properties': properties}
+
+
+template = {
+    'AWSTemplateFormatVersion': '2010-09-09',
+    'Parameters': {'Env': {'Type': 'String'}},
+    'Resources': {
+        'Dead': queue(QueueName={'Ref': 'Env'}),
+        'Main': queue(RedrivePolicy={'deadLetterTargetArn': {'Fn::GetAtt': ['Dead', 'Arn']}}),
+        'Named': queue(QueueName={'Fn::Sub': '${Main.QueueName}-${AWS::Region}-${!Literal}'}),
+        'After': dict(queue(), DependsOn='Main'),
+        'Lonely': queue(),
+        'Other': queue()
+    }
+}
+
+
+class ShardTest(unittest.TestCase):
+    def test_iter_references(self):
+        self.assertEqual({('Dead', 'Arn'), ('Env', None), ('Main', 'QueueName')},
+                         set(iter_references(template['Resources'])))
+        self.assertEqual([('Main', None)], list(iter_references({'Fn::Sub': ['${Main}-${Var}', {'Var': 'x'}]})))
+
+    def test_template_within_limits_is_one_shard(self):
+        shards = shard_template(template)
+        self.assertEqual(['Shard0'], [shard.name for shard in shards])
+        self.assertEqual(sorted(template['Resources']), shards[0].resource_names)
+
+    def test_connected_resources_stay_together(self):
+        self.assertEqual([['After', 'Dead', 'Main', 'Named'], ['Lonely', 'Other']],
+                         partition(template['Resources'], max_resources=4))
+
+    def test_oversized_groups_are_cut_in_dependency_order(self):
+        self.assertEqual([['Lonely', 'Other'], ['Dead', 'Main'], ['After', 'Named']],
+                         partition(template['Resources'], max_resources=2))
+
+    def test_cycles_are_rejected(self):
+        resources = {'A': queue(Q={'Ref': 'B'}), 'B': queue(Q={'Ref': 'A'})}
+        self.assertRaises(ResourceCycleError, partition, resources, max_resources=1)
+
+    def test_references_between_shards_are_wired(self):
+        shards = {shard.name: shard for shard in shard_template(template, max_resources=2)}
+        self.assertEqual(['Shard0', 'Shard1', 'Shard2'], sorted(shards))
+        dead_main, after_named = shards['Shard1'], shards['Shard2']
+        self.assertEqual({'Env': {'Ref': 'Env'}}, dead_main.parameter_values)
+        self.assertEqual({'GetAttMainQueueName': {'Value': {'Fn::GetAtt': ['Main', 'QueueName']}}},
+                         dead_main.outputs)
+        self.assertEqual({'GetAttMainQueueName': {'Fn::GetAtt': ['Shard1', 'Outputs.GetAttMainQueueName']}},
+                         after_named.parameter_values)
+        self.assertEqual({'Fn::Sub': '${GetAttMainQueueName}-${AWS::Region}-${!Literal}'},
+                         after_named.resources['Named']['Properties']['QueueName'])
+        self.assertNotIn('DependsOn', after_named.resources['After'])
+        self.assertEqual({'Shard1'}, after_named.depends_on)
+        child = after_named.template(template)
+        self.assertEqual({'GetAttMainQueueName': {'Type': 'String'}}, child['Parameters'])
+
+        parent = parent_template(template, [shards[name] for name in sorted(shards)], ['url0', 'url1', 'url2'])
+        self.assertEqual(template['Parameters'], parent['Parameters'])
+        self.assertEqual({'Type': 'AWS::CloudFormation::Stack',
+                          'Properties': {'TemplateURL': 'url2',
+                                         'Parameters': after_named.parameter_values},
+                          'Metadata': {'CloudforgeShardResources': ['After', 'Named']},
+                          'DependsOn': ['Shard1']}, parent['Resources']['Shard2'])
+        self.assertNotIn('DependsOn', parent['Resources']['Shard0'])
+        self.assertEqual({name: shard.name for shard in shards.values() for name in shard.resource_names},
+                         shard_assignment(parent))
+
+    def test_added_resources_leave_deployed_ones_in_their_shard(self):
+        assignment = {'Dead': 'Shard0', 'Main': 'Shard0', 'Named': 'Shard1', 'After': 'Shard1', 'Lonely': 'Shard2',
+                      'Other': 'Shard2'}
+        grown = dict(template, Resources=dict(template['Resources'],
+                                              Big=queue(Q={'Ref': 'Lonely'}),
+                                              Reader=queue(Q={'Fn::GetAtt': ['Main', 'Arn']})))
+        shards = shard_template(grown, max_resources=3, assignment=assignment)
+        self.assertEqual([('Shard0', ['Dead', 'Main', 'Reader']), ('Shard1', ['After', 'Named']),
+                          ('Shard2', ['Big', 'Lonely', 'Other'])],
+                         [(shard.name, shard.resource_names) for shard in shards])
+        bigger = dict(grown, Resources=dict(grown['Resources'], Extra=queue()))
+        shards = shard_template(bigger, max_resources=3, assignment=shard_assignment(
+            parent_template(grown, shards, ['url0', 'url1', 'url2'])))
+        self.assertEqual([('Shard0', ['Dead', 'Main', 'Reader']), ('Shard1', ['After', 'Extra', 'Named']),
+                          ('Shard2', ['Big', 'Lonely', 'Other'])],
+                         [(shard.name, shard.resource_names) for shard in shards])
+
+    def test_full_shards_get_a_new_shard_after_them(self):
+        assignment = {'Dead': 'Shard0', 'Main': 'Shard0', 'Named': 'Shard0', 'After': 'Shard0', 'Lonely': 'Shard3',
+                      'Other': 'Shard3'}
+        grown = dict(template, Resources=dict(template['Resources'], New=queue(Q={'Ref': 'Dead'})))
+        shards = shard_template(grown, max_resources=4, assignment=assignment)
+        self.assertEqual([('Shard0', ['After', 'Dead', 'Main', 'Named']), ('Shard3', ['Lonely', 'New', 'Other'])],
+                         [(shard.name, shard.resource_names) for shard in shards])
+        shards = shard_template(grown, max_resources=2, assignment=assignment)
+        self.assertEqual(['Shard0', 'Shard3', 'Shard4'], [shard.name for shard in shards])
+        self.assertEqual({'Shard0'}, shards[2].depends_on)
+
+    def test_shard_cycles_are_rejected(self):
+        assignment = {'Dead': 'Shard0', 'Main': 'Shard0', 'Named': 'Shard0', 'After': 'Shard0'}
+        grown = dict(template, Resources=dict(template['Resources'],
+                                              Dead=queue(QueueName={'Ref': 'New'}),
+                                              New=queue(Q={'Ref': 'Main'})))
+        self.assertRaises(ShardCycleError, shard_template, grown, max_resources=4, assignment=assignment)
+
+
+resources = {'queue.yaml': 'Type: AWS::SQS::Queue\n'}
+stack_def = {'shard': {'max_resources': 2}, 'resources': {'A': {'template': 'queue.yaml'},
+                                                         'B': {'template': 'queue.yaml'},
+                                                         'C': {'template': 'queue.yaml'}}}
+
+
+def load_url(url):
+    with open(url[len('file://'):]) as fp:
+        return json.load(fp)
+
+
+class ForgeShardTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def make_forge(self, conn, **kwargs):
+        forge = Forge(conn, Renderer(DictLoader(resources)), **kwargs)
+        forge.watcher = mock.MagicMock()
+        forge.watcher.watch.return_value = 'CREATE_COMPLETE'
+        return forge
+
+    def test_create_sharded_stack(self):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        conn.describe_stacks.side_effect = BotoServerError(None, None)
+        self.make_forge(conn, artifacts=LocalArtifactStore(self.tmp)).create_stack('big', stack_def)
+        parent = load_url(conn.create_stack.call_args[1]['template_url'])
+        self.assertEqual(['Shard0', 'Shard1'], sorted(parent['Resources']))
+        children = []
+        for resource in parent['Resources'].values():
+            self.assertEqual('AWS::CloudFormation::Stack', resource['Type'])
+            children.append(sorted(load_url(resource['Properties']['TemplateURL'])['Resources']))
+        self.assertEqual([['A', 'B'], ['C']], sorted(children))
+
+    def test_sharding_requires_artifacts(self):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        self.assertRaises(ShardingRequiresArtifactsError, self.make_forge(conn).create_stack, 'big', stack_def)
+
+    def make_deployed_conn(self, parent):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        conn.describe_stacks.side_effect = lambda name: [deployed_stack(name)]
+        conn.get_template.return_value = template_response(json.dumps(parent))
+        return conn
+
+    def test_update_keeps_resources_in_their_shard(self):
+        # A fresh split would put A and B in Shard0
+        parent = {'Resources': {'Shard0': {'Metadata': {'CloudforgeShardResources': ['C']}},
+                                'Shard1': {'Metadata': {'CloudforgeShardResources': ['A']}}}}
+        conn = self.make_deployed_conn(parent)
+        forge = self.make_forge(conn, artifacts=LocalArtifactStore(self.tmp))
+        forge.watcher.watch.return_value = 'UPDATE_COMPLETE'
+        forge.update_stack('big', stack_def)
+        updated = load_url(conn.update_stack.call_args[1]['template_url'])
+        self.assertEqual({'A': 'Shard1', 'B': 'Shard0', 'C': 'Shard0'}, shard_assignment(updated))
+
+    def test_update_refuses_to_shard_a_flat_stack(self):
+        conn = self.make_deployed_conn({'Resources': {'A': {'Type': 'AWS::SQS::Queue'}}})
+        forge = self.make_forge(conn, artifacts=LocalArtifactStore(self.tmp))
+        self.assertRaises(UnshardedStackError, forge.update_stack, 'big', stack_def)
+        self.assertFalse(conn.update_stack.called)
+
+    def test_update_refuses_to_move_resources(self):
+        parent = {'Resources': {'Shard0': {'Metadata': {'CloudforgeShardResources': ['A', 'B']}},
+                                'Shard1': {'Metadata': {'CloudforgeShardResources': ['C']}}}}
+        conn = self.make_deployed_conn(parent)
+        forge = self.make_forge(conn, artifacts=LocalArtifactStore(self.tmp))
+        moved = shard_template({'AWSTemplateFormatVersion': '2010-09-09', 'Resources': {'A': {}, 'B': {}, 'C': {}}})
+        with mock.patch('cloudforge.forge.shard_template', return_value=moved):
+            self.assertRaises(ShardMoveError, forge.update_stack, 'big', stack_def)
+        self.assertFalse(conn.update_stack.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import threading
+import unittest
+import mock
+from argparse import Namespace
+from cloudforge.cli import create
+from cloudforge.targets import expand_targets, run_targets, format_report, TargetsFailedError
+
+definition = {
+    'region': 'us-east-1',
+    'stacks': {'plain': {'resources': {'simple': None}}},
+    'targets': [
+        {'region': 'us-west-2'},
+        {'region': 'eu-west-1', 'role': {'role_arn': 'arn:aws:iam::123:role/deploy'}}
+    ]
+}
+
+
+class TargetsTest(unittest.TestCase):
+    def test_expand_targets(self):
+        rv = expand_targets(definition)
+        self.assertEqual(['us-west-2', 'eu-west-1'], [d['region'] for d in rv])
+        self.assertEqual({'role_arn': 'arn:aws:iam::123:role/deploy'}, rv[1]['role'])
+        self.assertTrue(all('targets' not in d and d['stacks'] is definition['stacks'] for d in rv))
+
+    def test_expand_without_targets(self):
+        self.assertEqual([{'region': 'us-east-1'}], expand_targets({'region': 'us-east-1'}))
+
+    def test_run_targets_concurrently(self):
+        barrier = threading.Event()
+        started = []
+
+        def work(d):
+            started.append(d['region'])
+            if len(started) == 2:
+                barrier.set()
+            if not barrier.wait(5):
+                raise RuntimeError('targets ran serially')
+
+        results = run_targets(expand_targets(definition), work)
+        self.assertTrue(all(r.ok for r in results))
+        self.assertEqual(['us-west-2', 'eu-west-1/arn:aws:iam::123:role/deploy'], [r.name for r in results])
+
+    def test_run_targets_collects_errors(self):
+        def work(d):
+            if d['region'] == 'us-west-2':
+                raise ValueError('boom')
+
+        results = run_targets(expand_targets(definition), work)
+        self.assertEqual([False, True], [r.ok for r in results])
+        report = format_report(results)
+        self.assertIn('us-west-2', report)
+        self.assertIn('boom', report)
+
+    @mock.patch('cloudforge.cli.Forge')
+    @mock.patch('cloudforge.cli.connect')
+    @mock.patch('cloudforge.cli.load_definition')
+    def test_create_runs_every_target(self, mock_load, mock_connect, mock_forge):
+        mock_load.return_value = definition
+        # Create the child mock up front, target threads creating it at once can lose calls
+        mock_forge.return_value.create_definition
+        args = Namespace(yamlfile='test.yaml', definition_name='multi', noop=False, concurrency=None, polling=None,
+                         manifest=None, engine=None, stack_timeout=None, render_processes=None, cache_dir=None,
+                         metrics_jsonl=None, metrics_prometheus=None, artifact_bucket=None, artifact_prefix=None,
+                         only=None, with_deps=False, with_dependents=False, preflight=False)
+        report = create(args)
+        self.assertEqual(['us-west-2', 'eu-west-1'], sorted([c[0][0]['region'] for c in mock_connect.call_args_list],
+                                                            reverse=True))
+        self.assertEqual(2, mock_forge.return_value.create_definition.call_count)
+        self.assertEqual(['eu-west-1/arn:aws:iam::123:role/deploy', 'us-west-2'],
+                         sorted(c[1]['label'] for c in mock_forge.call_args_list))
+        self.assertIn('eu-west-1', report)
+
+    @mock.patch('cloudforge.cli.Forge')
+    @mock.patch('cloudforge.cli.connect')
+    @mock.patch('cloudforge.cli.load_definition')
+    def test_create_fails_if_any_target_fails(self, mock_load, mock_connect, mock_forge):
+        mock_load.return_value = definition
+        mock_forge.return_value.create_definition.side_effect = [None, ValueError('boom')]
+        args = Namespace(yamlfile='test.yaml', definition_name='multi', noop=False, concurrency=None, polling=None,
+                         manifest=None, engine=None, stack_timeout=None, render_processes=None, cache_dir=None,
+                         metrics_jsonl=None, metrics_prometheus=None, artifact_bucket=None, artifact_prefix=None,
+                         only=None, with_deps=False, with_dependents=False, preflight=False)
+        self.assertRaises(TargetsFailedError, create, args)
+
+
+if __name__ == '__main__':
+    unittest.main()
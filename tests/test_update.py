@@ -0,0 +1,139 @@
+import json
+import unittest
+import mock
+from boto.cloudformation import CloudFormationConnection
+from boto.exception import BotoServerError
+from jinja2 import DictLoader
+from cloudforge.forge import Forge, AsyncForge, StackUpdateError, StackNotUpdatableError, make_template_body, \
+    template_differs
+from cloudforge.render import Renderer
+from .test_forge import make_threadsafe_conn
+
+resources = {'simple.yaml': ('Type: AWS::IAM::InstanceProfile\n'
+                             'Properties:\n'
+                             '  Path: /\n'
+                             '  Roles:\n'
+                             '  - TheRole\n')}
+stack_def = {'resources': {'simple': None}}
+body = make_template_body(Renderer(DictLoader(resources)), stack_def)
+
+
+def deployed_stack(name, status='CREATE_COMPLETE', parameters=None):
+    stack = mock.MagicMock()
+    stack.stack_name = name
+    stack.stack_status = status
+    stack.parameters = [mock.MagicMock(key=key, value=value) for key, value in parameters or []]
+    stack.outputs = []
+    return stack
+
+
+def template_response(template_body):
+    return {'GetTemplateResponse': {'GetTemplateResult': {'TemplateBody': template_body}}}
+
+
+class UpdateTest(unittest.TestCase):
+    def make_forge(self, conn, forge_class=Forge, **kwargs):
+        forge = forge_class(conn, Renderer(DictLoader(resources)), **kwargs)
+        forge.watcher = mock.MagicMock()
+        forge.watcher.watch.return_value = 'UPDATE_COMPLETE'
+        return forge
+
+    def make_conn(self, deployed_body=body):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        conn.describe_stacks.side_effect = lambda name: [deployed_stack(name)]
+        conn.get_template.return_value = template_response(deployed_body)
+        return conn
+
+    def test_template_differs(self):
+        self.assertFalse(template_differs('{"a": 1, "b": 2}', '{"b":2,"a":1}'))
+        self.assertTrue(template_differs('{"a": 1}', '{"a": 2}'))
+        self.assertTrue(template_differs('a: 1', '{"a": 1}'))
+
+    def test_unchanged_stack_is_not_updated(self):
+        conn = self.make_conn()
+        forge = self.make_forge(conn)
+        forge.update_stack('simple', stack_def)
+        conn.get_template.assert_called_once_with('simple')
+        self.assertFalse(conn.update_stack.called)
+        self.assertFalse(forge.watcher.watch.called)
+
+    def test_changed_template_is_updated(self):
+        conn = self.make_conn(json.dumps({'Resources': {}}))
+        forge = self.make_forge(conn)
+        forge.update_stack('simple', stack_def)
+        conn.update_stack.assert_called_once_with('simple', template_body=body, parameters=None,
+                                                  capabilities=['CAPABILITY_IAM'])
+        self.assertEqual('UPDATE_IN_PROGRESS', forge.watcher.watch.call_args[0][1][0])
+
+    def test_changed_parameters_are_updated(self):
+        conn = self.make_conn()
+        conn.describe_stacks.side_effect = lambda name: [deployed_stack(name, parameters=[('Role', 'old')])]
+        forge = self.make_forge(conn)
+        with mock.patch('cloudforge.forge.build_parameters', return_value=[('Role', 'new')]):
+            forge.update_stack('simple', dict(stack_def, parameters={
+                'Role': {'source': {'stack': 'base', 'type': 'output'}}}))
+        self.assertFalse(conn.get_template.called)
+        self.assertEqual([('Role', 'new')], conn.update_stack.call_args[1]['parameters'])
+
+    def test_no_updates_is_success_without_waiting(self):
+        conn = self.make_conn(json.dumps({'Resources': {}}))
+        error = BotoServerError(400, 'Bad Request')
+        error.error_message = 'No updates are to be performed.'
+        conn.update_stack.side_effect = error
+        forge = self.make_forge(conn)
+        forge.update_stack('simple', stack_def)
+        self.assertFalse(forge.watcher.watch.called)
+
+    def test_failed_update(self):
+        conn = self.make_conn(json.dumps({'Resources': {}}))
+        forge = self.make_forge(conn)
+        forge.watcher.watch.return_value = 'UPDATE_ROLLBACK_COMPLETE'
+        self.assertRaises(StackUpdateError, forge.update_stack, 'simple', stack_def)
+
+    def test_stack_in_progress_is_not_updatable(self):
+        conn = self.make_conn()
+        conn.describe_stacks.side_effect = lambda name: [deployed_stack(name, 'CREATE_IN_PROGRESS')]
+        self.assertRaises(StackNotUpdatableError, self.make_forge(conn).update_stack, 'simple', stack_def)
+
+    def test_missing_stack_is_created(self):
+        conn = self.make_conn()
+        conn.describe_stacks.side_effect = BotoServerError(None, None)
+        forge = self.make_forge(conn)
+        forge.watcher.watch.return_value = 'CREATE_COMPLETE'
+        forge.update_stack('simple', stack_def)
+        conn.create_stack.assert_called_once_with('simple', template_body=body, parameters=None,
+                                                  capabilities=['CAPABILITY_IAM'])
+        self.assertFalse(conn.update_stack.called)
+
+    def check_update_definition(self, forge_class, **kwargs):
+        conn = make_threadsafe_conn()
+        for method in ['get_template', 'update_stack', 'describe_stack_events']:
+            getattr(conn, method)
+        updated = set()
+        conn.describe_stacks.side_effect = lambda name: [
+            deployed_stack(name, 'UPDATE_COMPLETE' if name in updated else 'CREATE_COMPLETE')]
+        conn.get_template.side_effect = lambda name: template_response(body if name == 'same' else '{}')
+        conn.update_stack.side_effect = lambda name, **kwargs: updated.add(name)
+        conn.describe_stack_events.return_value = []
+        forge = forge_class(conn, Renderer(DictLoader(resources)), polling={'strategy': 'fixed', 'interval': 0},
+                            **kwargs)
+        forge.update_definition('plain', {'stacks': {
+            'same': {'resources': {'simple': None}},
+            'changed': {'resources': {'simple': None}},
+            'last': {'requires': ['same', 'changed'], 'resources': {'simple': None}}
+        }})
+        names = [c[0][0] for c in conn.update_stack.call_args_list]
+        self.assertEqual(['changed', 'last'], names)
+
+    def test_update_definition(self):
+        self.check_update_definition(Forge)
+
+    def test_update_definition_concurrently(self):
+        self.check_update_definition(Forge, concurrency=2)
+
+    def test_update_definition_async(self):
+        self.check_update_definition(AsyncForge)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,15 @@
 import unittest
 import datetime
+import logging
 import mock
 
 from boto.exception import BotoServerError
+from boto.resultset import ResultSet
 from boto.cloudformation.stack import StackEvent
 from boto.cloudformation.connection import CloudFormationConnection
 
-from cloudforge.watcher import filter_events_before, Watcher
+from cloudforge.watcher import EventReader, Watcher, BackoffPolling, FixedPolling, make_polling, \
+    UnknownPollingStrategyError
 
 
 def make_events(count):
@@ -14,10 +17,23 @@ def make_events(count):
     for i in range(count):
         e = StackEvent()
         e.event_id = i
+        e.timestamp = datetime.datetime.now()
         events.append(e)
     return list(reversed(events))
 
 
+def make_growing_events(count):
+    events = make_events(count)
+    return [events[count - i:] for i in range(1, count + 1)]
+
+
+def make_page(events, next_token=None):
+    page = ResultSet()
+    page.extend(events)
+    page.next_token = next_token
+    return page
+
+
 def make_fake_event():
     fake_event = mock.MagicMock(spec=StackEvent)
     fake_event.timestamp = datetime.datetime.now()
@@ -30,24 +46,52 @@ def make_fake_event():
     return fake_event
 
 
-class WatcherTest(unittest.TestCase):
-    def test_filter_events_no_matching_event(self):
+class EventReaderTest(unittest.TestCase):
+    def test_read_returns_only_new_events(self):
         events = make_events(10)
-        last_event = StackEvent()
-        last_event.event_id = -1
-        self.assertEqual(events, filter_events_before(last_event, events))
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        conn.describe_stack_events.side_effect = [events[7:], events[4:], events[4:]]
+        reader = EventReader(conn, 'test')
+        self.assertEqual(events[7:], reader.prime())
+        self.assertEqual(events[4:7], reader.read())
+        self.assertEqual([], reader.read())
 
-    def test_filter_events_first_matching_event(self):
+    def test_read_follows_pages_until_a_seen_event(self):
         events = make_events(10)
-        self.assertEqual(events[:0], filter_events_before(events[0], events))
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        conn.describe_stack_events.side_effect = [make_page(events[8:]),
+                                                  make_page(events[:3], 'page2'),
+                                                  make_page(events[3:6], 'page3'),
+                                                  make_page(events[6:9], 'page4')]
+        reader = EventReader(conn, 'test')
+        reader.prime()
+        self.assertEqual(events[:8], reader.read())
+        self.assertEqual(mock.call('test', next_token='page3'), conn.describe_stack_events.call_args)
+        self.assertEqual(4, conn.describe_stack_events.call_count)
+
+    def test_read_stops_at_last_page(self):
+        events = make_events(4)
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        conn.describe_stack_events.side_effect = [make_page([]), make_page(events[:2], 'page2'),
+                                                  make_page(events[2:])]
+        reader = EventReader(conn, 'test')
+        reader.prime()
+        self.assertEqual(events, reader.read())
 
-    def test_filter_events_last_matching_event(self):
+    def test_seen_ids_are_bounded(self):
         events = make_events(10)
-        self.assertEqual(events[:9], filter_events_before(events[-1], events))
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        conn.describe_stack_events.return_value = events
+        reader = EventReader(conn, 'test', max_seen=4)
+        reader.prime()
+        self.assertEqual({6, 7, 8, 9}, reader.seen_ids)
+
 
+class WatcherTest(unittest.TestCase):
     @mock.patch('cloudforge.watcher.time.sleep')
     def test_watch_stack(self, mock_sleep):
         conn = mock.MagicMock(spec=CloudFormationConnection)
+        conn.describe_stack_events.side_effect = make_growing_events(4)
         stack = conn.describe_stacks.return_value.__getitem__.return_value
         stack.stack_status.encode.side_effect = ['CREATE_IN_PROGRESS'] * 3 + ['CREATE_COMPLETE']
         watcher = Watcher(conn)
@@ -77,6 +121,109 @@ class WatcherTest(unittest.TestCase):
         rv = watcher.watch('test', ['CREATE_IN_PROGRESS'])
         self.assertEqual('STACK_GONE', rv)
 
+    @mock.patch('cloudforge.watcher.time.sleep')
+    def test_watch_skips_status_refresh_without_new_events(self, mock_sleep):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        stack = conn.describe_stacks.return_value.__getitem__.return_value
+        stack.stack_status.encode.side_effect = ['CREATE_IN_PROGRESS', 'CREATE_COMPLETE']
+        old_event = make_fake_event()
+        new_event = make_fake_event()
+        new_event.event_id = 'new'
+        conn.describe_stack_events.side_effect = [[old_event]] * 3 + [[new_event, old_event]]
+        watcher = Watcher(conn, polling='fixed')
+        rv = watcher.watch('test', ['CREATE_IN_PROGRESS'])
+        self.assertEqual('CREATE_COMPLETE', rv)
+        self.assertEqual(1, stack.update.call_count)
+        self.assertEqual([mock.call(5)] * 3, mock_sleep.call_args_list)
+
+    @mock.patch('cloudforge.watcher.time.sleep')
+    def test_watch_many_reports_each_stack_when_done(self, mock_sleep):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        stacks = {'fast': mock.MagicMock(), 'slow': mock.MagicMock()}
+        stacks['fast'].stack_status.encode.side_effect = ['CREATE_IN_PROGRESS', 'CREATE_COMPLETE']
+        stacks['slow'].stack_status.encode.side_effect = ['CREATE_IN_PROGRESS'] * 3 + ['ROLLBACK_COMPLETE']
+        conn.describe_stacks.side_effect = lambda name: [stacks[name]]
+        events = {'fast': iter(make_growing_events(2)), 'slow': iter(make_growing_events(4))}
+        conn.describe_stack_events.side_effect = lambda name: next(events[name])
+        completed = []
+        watcher = Watcher(conn, polling='fixed')
+        rv = watcher.watch_many(['slow', 'fast'], ['CREATE_IN_PROGRESS'],
+                                on_complete=lambda name, status: completed.append((name, status)))
+        self.assertEqual({'fast': 'CREATE_COMPLETE', 'slow': 'ROLLBACK_COMPLETE'}, rv)
+        self.assertEqual([('fast', 'CREATE_COMPLETE'), ('slow', 'ROLLBACK_COMPLETE')], completed)
+        self.assertEqual(3, stacks['slow'].update.call_count)
+        self.assertEqual(1, stacks['fast'].update.call_count)
+
+    @mock.patch('cloudforge.watcher.time.sleep')
+    def test_watch_many_handles_missing_stack(self, mock_sleep):
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        error = BotoServerError(None, None)
+        error.message = 'Stack:gone does not exist'
+        conn.describe_stacks.side_effect = error
+        watcher = Watcher(conn)
+        self.assertEqual({'gone': 'STACK_GONE'}, watcher.watch_many(['gone'], ['DELETE_IN_PROGRESS']))
+        self.assertFalse(mock_sleep.called)
+
+    @mock.patch('cloudforge.watcher.time.time')
+    @mock.patch('cloudforge.watcher.time.sleep')
+    def test_watch_many_respects_poll_budget(self, mock_sleep, mock_time):
+        mock_time.return_value = 100.0
+        conn = mock.MagicMock(spec=CloudFormationConnection)
+        stacks = {'a': mock.MagicMock(), 'b': mock.MagicMock()}
+        for stack in stacks.values():
+            stack.stack_status.encode.side_effect = ['CREATE_IN_PROGRESS', 'CREATE_COMPLETE']
+        conn.describe_stacks.side_effect = lambda name: [stacks[name]]
+        events = {'a': iter(make_growing_events(2)), 'b': iter(make_growing_events(2))}
+        conn.describe_stack_events.side_effect = lambda name: next(events[name])
+        watcher = Watcher(conn, polling={'strategy': 'fixed', 'interval': 0})
+        watcher.watch_many(['a', 'b'], ['CREATE_IN_PROGRESS'], polls_per_second=4)
+        mock_sleep.assert_called_once_with(0.25)
+
+
+class PollingTest(unittest.TestCase):
+    def test_fixed_polling(self):
+        polling = FixedPolling(3)
+        self.assertEqual([3, 3], [polling.next_delay(True), polling.next_delay(False)])
+
+    @mock.patch('cloudforge.watcher.random.uniform', side_effect=lambda low, high: high)
+    def test_backoff_polling_resets_on_new_events(self, mock_uniform):
+        polling = BackoffPolling(initial=1, maximum=5, factor=2)
+        delays = [polling.next_delay(new_events) for new_events in [False, False, False, False, True, False]]
+        self.assertEqual([1, 2, 4, 5, 1, 2], delays)
+
+    def test_backoff_polling_jitter_stays_below_delay(self):
+        polling = BackoffPolling(initial=10, jitter=0.5)
+        delay = polling.next_delay(True)
+        self.assertTrue(5 <= delay <= 10)
+
+    def test_make_polling_from_dict(self):
+        polling = make_polling({'strategy': 'fixed', 'interval': 7})()
+        self.assertEqual(7, polling.next_delay(False))
+
+    def test_make_polling_defaults_to_backoff(self):
+        self.assertTrue(isinstance(make_polling()(), BackoffPolling))
+
+    def test_make_polling_unknown_strategy_fails(self):
+        self.assertRaises(UnknownPollingStrategyError, make_polling, 'eager')
+
+    def test_watchers_share_one_handler(self):
+        for _ in range(3):
+            Watcher(mock.MagicMock())
+        self.assertEqual(1, len(logging.getLogger('cloudforge.watcher').handlers))
+
+    def test_labelled_watcher_prefixes_lines(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger = logging.getLogger('cloudforge.watcher')
+        logger.addHandler(handler)
+        try:
+            Watcher(mock.MagicMock(), label='us-west-2').logger.info('hello')
+            Watcher(mock.MagicMock()).logger.info('hello')
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(['[us-west-2] hello', 'hello'], [r.getMessage() for r in records])
+
 
 if __name__ == '__main__':
     unittest.main()
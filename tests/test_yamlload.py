@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+import yaml
+from cloudforge.cli import read_yamlfile
+from cloudforge.yamlload import ParsedFileCache, safe_load
+
+definitions = ('plain:\n'
+               '  region: us-west-2\n'
+               '  stacks:\n'
+               '    my_stack:\n'
+               '      resources:\n'
+               '        plain:\n'
+               '          variables: {count: 2, enabled: true}\n')
+
+
+class SafeLoadTest(unittest.TestCase):
+    def test_matches_pure_python_loader(self):
+        self.assertEqual(yaml.load(definitions, Loader=yaml.SafeLoader), safe_load(definitions))
+
+    def test_refuses_unsafe_tags(self):
+        self.assertRaises(yaml.YAMLError, safe_load, '!!python/object/apply:os.getcwd []')
+
+
+class ParsedFileCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp, 'cache')
+        self.path = os.path.join(self.tmp, 'definitions.yaml')
+        self.write(definitions)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, text, mtime=1000000000):
+        with open(self.path, 'w') as fp:
+            fp.write(text)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_second_read_skips_parsing(self):
+        parse = mock.MagicMock(side_effect=lambda path: {'parsed': path})
+        cache = ParsedFileCache(self.cache_dir)
+        self.assertEqual({'parsed': self.path}, cache.get(self.path, parse))
+        self.assertEqual({'parsed': self.path}, ParsedFileCache(self.cache_dir).get(self.path, parse))
+        self.assertEqual(1, parse.call_count)
+
+    def test_changed_file_is_parsed_again(self):
+        cache = ParsedFileCache(self.cache_dir)
+        cache.get(self.path, lambda path: 'old')
+        self.write(definitions, mtime=1000000001)
+        self.assertEqual('new', cache.get(self.path, lambda path: 'new'))
+        self.write(definitions + '\n', mtime=1000000001)
+        self.assertEqual('newer', cache.get(self.path, lambda path: 'newer'))
+
+    def test_corrupt_entry_is_replaced(self):
+        cache = ParsedFileCache(self.cache_dir)
+        cache.get(self.path, lambda path: 'old')
+        with open(cache.entry_path(self.path), 'w') as fp:
+            fp.write('garbage')
+        self.assertEqual('new', cache.get(self.path, lambda path: 'new'))
+
+    def test_read_yamlfile_uses_cache_dir(self):
+        self.assertEqual(safe_load(definitions), read_yamlfile(self.path, self.cache_dir))
+        with mock.patch('cloudforge.cli.parse_yamlfile') as mock_parse:
+            self.assertEqual(safe_load(definitions), read_yamlfile(self.path, self.cache_dir))
+        self.assertFalse(mock_parse.called)
+
+
+if __name__ == '__main__':
+    unittest.main()